@@ -0,0 +1,117 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+import asyncio
+
+from argparse import ArgumentParser
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from time import perf_counter
+
+from common import User
+from common import models
+from common import make_orm
+from common import BenchContainer
+from service_sqlalchemy.core.dependencies import AsyncSQLAlchemy
+from service_sqlalchemy.core.shortcuts import orm_json_search
+from service_sqlalchemy.core.shortcuts import select_or_create
+from service_sqlalchemy.core.shortcuts import orm_json_search_async
+from service_sqlalchemy.core.shortcuts import select_or_create_async
+from service_sqlalchemy.constants import SQLALCHEMY_CONFIG_KEY
+
+
+def make_search(i: int, rows: int) -> t.Dict[t.Text, t.Any]:
+    """ 生成查询参数
+
+    @param i: 当前次数
+    @param rows: 数据行数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    return {
+        'module': models,
+        'query': ['User.id', 'User.name'],
+        'filter_by': [{'field': 'User.age', 'op': '==', 'value': i % 90}, 'and', {'field': 'User.id', 'op': '<=', 'value': rows}],
+        'order_by': ['-User.id'],
+        'page': 1,
+        'page_size': 20
+    }
+
+
+def run_sync(orm: t.Any, number: int, rows: int) -> t.Dict[t.Text, float]:
+    """ 同步路径的吞吐
+
+    @param orm: sqlalchemy
+    @param number: 执行次数
+    @param rows: 数据行数
+    @return: t.Dict[t.Text, float]
+    """
+    report = {}
+    start = perf_counter()
+    for i in range(number): orm_json_search(orm, **make_search(i, rows)).all()
+    report['orm_json_search'] = number / (perf_counter() - start)
+    start = perf_counter()
+    for i in range(number): select_or_create(orm, model=User, name=f'user{i % rows}')
+    orm.get_client().close()
+    report['select_or_create'] = number / (perf_counter() - start)
+    return report
+
+
+async def run_async(orm: AsyncSQLAlchemy, number: int, rows: int, concurrency: int) -> t.Dict[t.Text, float]:
+    """ 异步路径的吞吐, 按并发数分组执行
+
+    @param orm: sqlalchemy
+    @param number: 执行次数
+    @param rows: 数据行数
+    @param concurrency: 并发数
+    @return: t.Dict[t.Text, float]
+    """
+    async def search(index: int) -> None:
+        await orm_json_search_async(orm, **make_search(index, rows))
+
+    async def select(index: int) -> None:
+        await select_or_create_async(orm, model=User, name=f'user{index % rows}')
+        await orm.session_cls.remove()
+
+    report = {}
+    for name, func in (('orm_json_search', search), ('select_or_create', select)):
+        start = perf_counter()
+        for offset in range(0, number, concurrency):
+            await asyncio.gather(*[func(i) for i in range(offset, min(offset + concurrency, number))])
+        report[name] = number / (perf_counter() - start)
+    await orm.dispose()
+    return report
+
+
+def run(number: int, rows: int, concurrency: int) -> t.Dict[t.Text, t.Any]:
+    """ 执行基准测试, 结果为每秒次数
+
+    @param number: 执行次数
+    @param rows: 数据行数
+    @param concurrency: 并发数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    orm = make_orm('file', rows=rows)
+    url = str(orm.engine.url).replace('sqlite://', 'sqlite+aiosqlite://', 1)
+    report = {'sync': run_sync(orm, number, rows)}
+    orm.stop()
+    for n in sorted({1, concurrency}):
+        # 与同步路径一致使用连接池, aiosqlite默认的NullPool每次都会新建连接
+        engine_options = {'url': url, 'poolclass': AsyncAdaptedQueuePool, 'pool_size': 32, 'max_overflow': 32}
+        async_orm = AsyncSQLAlchemy(alias='bench', engine_options=engine_options)
+        async_orm.container = BenchContainer({SQLALCHEMY_CONFIG_KEY: {'bench': {}}})
+        async_orm.setup()
+        report[f'async.concurrency_{n}'] = asyncio.run(run_async(async_orm, number, rows, n))
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='sync vs asyncio throughput benchmark')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.rows, options.concurrency), indent=2))
@@ -0,0 +1,129 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+import tracemalloc
+
+from argparse import ArgumentParser
+from sqlalchemy.sql import and_, or_
+
+from common import models
+from common import measure
+from service_sqlalchemy.core.searching.schemas import FilterSchema
+from service_sqlalchemy.core.searching.validate import validate
+from service_sqlalchemy.core.searching.compiler import compile_filter
+from service_sqlalchemy.core.searching.evaluate import make_filter
+from service_sqlalchemy.core.searching.evaluate import make_dict_filter
+from service_sqlalchemy.core.searching.expresss import OperatorExpression
+from service_sqlalchemy.core.searching.converts import convert_list_filter_to_dict
+from service_sqlalchemy.core.searching.converts import convert_dict_filter_to_list
+
+condition_type = {'and': and_, 'or': or_}
+
+
+def make_predicates(size: int) -> t.List:
+    """ 生成平衡的嵌套过滤条件
+
+    @param size: 条件数量
+    @return: t.List
+    """
+    fields = [('User.name', 'eq', 'user'), ('User.age', 'gt', 10), ('User.name', 'like', 'u%'), ('Apps.score', 'le', 5)]
+    predicates = []
+    for i in range(size):
+        field, op, value = fields[i % len(fields)]
+        predicates.append({'field': field, 'op': op, 'value': value})
+
+    def tree(items: t.List, depth: int) -> t.Any:
+        if len(items) == 1: return items[0]
+        middle = len(items) // 2
+        return [tree(items[:middle], depth + 1), 'and' if depth % 2 else 'or', tree(items[middle:], depth + 1)]
+
+    return tree(predicates, 0)
+
+
+def legacy_eval_filter(filters: t.List) -> t.Any:
+    """ 优化前的构造过滤条件: 每个节点实例化OperatorExpression和操作对象 """
+    if not filters: return and_()
+    a, o, b = filters
+    a = legacy_eval_filter(a) if isinstance(a, list) else legacy_eval_operator(a)
+    b = legacy_eval_filter(b) if isinstance(b, list) else legacy_eval_operator(b)
+    return condition_type[o](a, b)
+
+
+def legacy_eval_operator(node: t.Dict[t.Text, t.Any]) -> t.Any:
+    """ 优化前的构造操作表达式: 每次通过rsplit和getattr解析名称 """
+    model_name, field_name = node['field'].rsplit('.', 1)
+    model = getattr(models, model_name)
+    return OperatorExpression(
+        model=model, field=field_name, type=node['type'],
+        op=node['op'], value=node['value'], param=node['param']
+    ).expr()
+
+
+def legacy_compile(filters: t.List) -> t.Any:
+    """ 优化前的流程: 列表 => 字典 => 校验 => 列表 => 逐节点构造 """
+    dict_filters = convert_list_filter_to_dict(make_filter(*filters))
+    dict_filters = validate(FilterSchema, dict_filters, trusted=True)
+    return legacy_eval_filter(convert_dict_filter_to_list(dict_filters))
+
+
+def ast_compile(filters: t.List) -> t.Any:
+    """ 优化后的流程: 字典 => 校验 => 语法树 => 单次编译 """
+    dict_filters = validate(FilterSchema, make_dict_filter(*filters), trusted=True)
+    return compile_filter(models, dict_filters)
+
+
+def measure_memory(func: t.Callable[[], t.Any]) -> t.Dict[t.Text, t.Any]:
+    """ 测量一次编译的内存分配
+
+    @param func: 编译函数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    del result
+    return {
+        'peak_kib': peak / 1024,
+        'retained_blocks': sum(s.count_diff for s in stats if s.count_diff > 0)
+    }
+
+
+def run(number: int, sizes: t.List[int]) -> t.Dict[t.Text, t.Any]:
+    """ 对比不同条件数量下的编译耗时和内存分配
+
+    注意: 均使用受信任校验, 只比较构造表达式的开销
+
+    @param number: 执行次数
+    @param sizes: 条件数量
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    for size in sizes:
+        filters = make_predicates(size)
+        for name, func in (('legacy', legacy_compile), ('ast', ast_compile)):
+            # 预热注册表和操作映射
+            func(filters)
+            result = measure(lambda i: func(filters), max(1, number * 10 // size))
+            result.update(measure_memory(lambda: func(filters)))
+            report[f'{size}.{name}'] = result
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='search filter compile benchmark')
+    parser.add_argument('--number', type=int, default=1000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.sizes), indent=2))
@@ -0,0 +1,118 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from threading import Thread
+from time import perf_counter
+from argparse import ArgumentParser
+from sqlalchemy import text
+
+from common import measure
+from common import make_orm
+
+
+def execute(orm: t.Any) -> None:
+    """ 签出连接执行一条语句
+
+    @param orm: sqlalchemy
+    @return: None
+    """
+    with orm.engine.connect() as connection:
+        connection.execute(text('SELECT 1')).close()
+
+
+def spawn_all(func: t.Callable[[], t.Any], concurrency: int, green: bool) -> None:
+    """ 并发执行并等待全部结束
+
+    @param func: 工作函数
+    @param concurrency: 并发数
+    @param green: 是否使用eventlet协程, 否则使用线程
+    @return: None
+    """
+    if green:
+        import eventlet
+        pool = eventlet.GreenPool(concurrency)
+        for _ in range(concurrency): pool.spawn_n(func)
+        pool.waitall()
+        return
+    workers = [Thread(target=func) for _ in range(concurrency)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+
+
+def contend(number: int, kind: t.Text, concurrency: int, pool_size: int, green: bool) -> t.Dict[t.Text, t.Any]:
+    """ 并发数超过连接数时的签出争用
+
+    @param number: 执行次数
+    @param kind: memory/file
+    @param concurrency: 并发数
+    @param pool_size: 连接池大小, 不允许溢出
+    @param green: 是否使用eventlet协程
+    @return: t.Dict[t.Text, t.Any]
+    """
+    engine_options = {'pool_size': pool_size, 'max_overflow': 0, 'pool_timeout': 30}
+    orm = make_orm(kind, engine_options=engine_options)
+    per_worker = max(1, number // concurrency)
+    start = perf_counter()
+    spawn_all(lambda: [execute(orm) for _ in range(per_worker)], concurrency, green)
+    seconds = perf_counter() - start
+    report = {
+        'number': per_worker * concurrency,
+        'concurrency': concurrency,
+        'pool_size': pool_size,
+        'workers': 'greenlet' if green else 'thread',
+        'total': seconds,
+        'per_second': per_worker * concurrency / seconds,
+        'pool_stats': orm.pool_stats.dict() if orm.pool_stats else None
+    }
+    orm.stop()
+    return report
+
+
+def run(
+        number: int,
+        kind: t.Text,
+        concurrency: t.Optional[int] = 64,
+        pool_size: t.Optional[int] = 8,
+        green: t.Optional[bool] = False
+) -> t.Dict[t.Text, t.Any]:
+    """ 对比开启/关闭连接池统计时的签出开销, 以及连接数不足时的签出争用
+
+    @param number: 执行次数
+    @param kind: memory/file
+    @param concurrency: 并发数
+    @param pool_size: 争用场景的连接池大小
+    @param green: 是否使用eventlet协程
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    cases = {
+        'checkout': lambda orm: lambda i: orm.engine.raw_connection().close(),
+        'execute': lambda orm: lambda i: execute(orm),
+    }
+    for name, make_case in cases.items():
+        for label, enabled in (('off', False), ('on', True)):
+            orm = make_orm(kind, telemetry_options={'pool_stats': enabled})
+            report[f'{name}.{label}'] = measure(make_case(orm), number)
+            orm.pool_stats and report[f'{name}.{label}'].update(pool_stats=orm.pool_stats.dict())
+            orm.stop()
+    report['contention'] = contend(number, kind, concurrency, pool_size, green)
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='pool telemetry overhead benchmark')
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--kind', choices=['memory', 'file'], default='memory')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--green', action='store_true', help='use eventlet greenlets instead of threads')
+    options = parser.parse_args()
+    # 注意: 协程模式需在创建引擎前打补丁, 连接池的锁才会让出给其它协程
+    options.green and __import__('eventlet').monkey_patch()
+    print(json.dumps(run(options.number, options.kind, options.concurrency, options.pool_size, options.green), indent=2))
@@ -0,0 +1,61 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from argparse import ArgumentParser
+
+from common import models
+from common import measure
+from common import make_orm
+from service_sqlalchemy.core.searching import Search
+from service_sqlalchemy.core.searching.modes import result_modes
+
+# 整行模型以及只有数值字段的分析型查询
+queries = {
+    'model': {'query': ['User']},
+    'numbers': {'query': ['Apps.id', 'Apps.score', 'Apps.user_id']},
+}
+
+
+def run(number: int, rows: int, kind: t.Text) -> t.Dict[t.Text, t.Any]:
+    """ 对比不同结果模式的吞吐
+
+    注意: 每次执行前清空标识映射, orm模式不会复用已加载的实例
+
+    @param number: 执行次数
+    @param rows: 用户数量, 应用数量为其两倍
+    @param kind: memory/file
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    orm = make_orm(kind, rows=rows)
+    session = orm.get_client()
+    for name, payload in queries.items():
+        for mode in result_modes:
+            def func(index: int) -> t.Any:
+                session.expunge_all()
+                search = Search(session, module=models, cache=orm.plan_cache, **payload)
+                return search.result(mode)
+
+            size = len(func(0)) if mode != 'columnar' else len(next(iter(func(0).values())))
+            stats = measure(func, number)
+            stats['rows'] = size
+            stats['rows_per_second'] = size * number / stats['total']
+            report[f'{name}.{mode}'] = stats
+    session.close()
+    orm.stop()
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='search result mode benchmark')
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--kind', choices=['memory', 'file'], default='memory')
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.rows, options.kind), indent=2))
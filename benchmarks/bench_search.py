@@ -0,0 +1,102 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from argparse import ArgumentParser
+
+from common import models
+from common import measure
+from common import make_orm
+from service_sqlalchemy.core.searching import Search
+from service_sqlalchemy.core.shortcuts import orm_json_search
+
+
+def make_width(size: int) -> t.List:
+    """ 生成AND连接的列表形式过滤条件
+
+    @param size: 条件数量
+    @return: t.List
+    """
+    filters = {'field': 'User.age', 'op': 'ne', 'value': 0}
+    for i in range(1, size):
+        filters = [filters, 'and', {'field': 'User.age', 'op': 'ne', 'value': i}]
+    return filters
+
+
+def make_depth(size: int) -> t.Dict[t.Text, t.Any]:
+    """ 生成and/or交替嵌套的过滤条件
+
+    @param size: 嵌套层数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    node = {'field': 'User.age', 'op': 'ge', 'value': 0}
+    for i in range(size):
+        leaf = {'field': 'User.name', 'op': 'eq', 'value': f'user{i}'}
+        node = {'a': leaf, 'o': 'or' if i % 2 else 'and', 'b': node}
+    return node
+
+
+# 端到端查询的典型形状
+searches = {
+    'plain': lambda i, rows: {
+        'query': ['User'], 'filter_by': {'field': 'User.id', 'op': 'eq', 'value': i % rows + 1}
+    },
+    'page': lambda i, rows: {
+        'query': ['User.id', 'User.name'], 'filter_by': {'field': 'User.age', 'op': 'eq', 'value': i % 90},
+        'order_by': ['-User.id'], 'page': 1, 'page_size': 20
+    },
+    'join': lambda i, rows: {
+        'query': ['User.name', 'Apps.name'],
+        'join': [{'model': 'Apps', 'must': {'field': 'Apps.user_id', 'op': 'eq', 'value': {'field': 'User.id', 'fn': 'field'}}}],
+        'filter_by': {'field': 'User.age', 'op': 'eq', 'value': i % 90}, 'page': 1, 'page_size': 20
+    },
+    'group_having': lambda i, rows: {
+        'query': ['User.age', {'field': 'Apps.id', 'fn': 'count'}],
+        'join': [{'model': 'Apps', 'must': {'field': 'Apps.user_id', 'op': 'eq', 'value': {'field': 'User.id', 'fn': 'field'}}}],
+        'group_by': ['User.age'], 'having': {'field': {'field': 'Apps.id', 'fn': 'count'}, 'op': 'gt', 'value': i % 3},
+        'order_by': ['User.age']
+    },
+}
+
+
+def run(number: int, rows: int, kind: t.Text, sizes: t.List[int]) -> t.Dict[t.Text, t.Any]:
+    """ 查询编译耗时以及端到端查询耗时
+
+    compile: 不使用计划缓存, 只构造查询对象不执行
+    search: 经由orm_json_search执行并取回结果, 使用依赖配置的计划缓存
+
+    @param number: 执行次数
+    @param rows: 用户数量, 应用数量为其两倍
+    @param kind: memory/file
+    @param sizes: 过滤条件的宽度/深度
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    orm = make_orm(kind, rows=rows)
+    session = orm.get_client()
+    for size in sizes:
+        for shape, make_filter in (('width', make_width), ('depth', make_depth)):
+            filters = make_filter(size)
+            func = lambda i: Search(session, module=models, query=['User'], filter_by=filters).queryset
+            report[f'compile.{shape}.{size}'] = measure(func, max(1, number * 10 // size))
+    session.close()
+    for name, make_search in searches.items():
+        func = lambda i: orm_json_search(orm, module=models, **make_search(i, rows)).all()
+        report[f'search.{name}'] = measure(func, number)
+    orm.stop()
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='search compile and orm_json_search benchmark')
+    parser.add_argument('--number', type=int, default=1000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--kind', choices=['memory', 'file'], default='memory')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100])
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.rows, options.kind, options.sizes), indent=2))
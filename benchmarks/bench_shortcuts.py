@@ -0,0 +1,90 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from argparse import ArgumentParser
+from sqlalchemy.exc import MultipleResultsFound
+
+from common import User
+from common import measure
+from common import make_orm
+from common import QueryCounter
+from service_sqlalchemy.core.dependencies import SQLAlchemy
+from service_sqlalchemy.core.shortcuts import select_or_create
+from service_sqlalchemy.core.shortcuts import update_or_create
+from service_sqlalchemy.core.transaction import safe_transaction
+
+
+def legacy_select_or_create(orm: SQLAlchemy, *, model: t.Any, defaults: t.Optional[t.Dict] = None, **query: t.Any) -> t.Any:
+    """ 优化前的查询并创建实例: SAVEPOINT + COUNT + SELECT """
+    defaults = dict(defaults or {})
+    with safe_transaction(orm, nested=True, commit=False) as session:
+        queryset = session.query(model).filter_by(**query)
+        if queryset.count() > 1: raise MultipleResultsFound(f'{model} - {query}')
+        instance = queryset.first()
+        if not instance:
+            defaults.update(query)
+            instance = model(**defaults)
+            session.add(instance)
+            session.commit()
+        return instance
+
+
+def legacy_update_or_create(orm: SQLAlchemy, *, model: t.Any, defaults: t.Optional[t.Dict] = None, **query: t.Any) -> t.Any:
+    """ 优化前的更新并创建实例: SAVEPOINT + COUNT + SELECT """
+    defaults = dict(defaults or {})
+    with safe_transaction(orm, nested=True, commit=True) as session:
+        queryset = session.query(model).filter_by(**query)
+        if queryset.count() > 1: raise MultipleResultsFound(f'{model} - {query}')
+        instance = queryset.first()
+        if instance:
+            for k, v in defaults.items(): setattr(instance, k, v)
+        else:
+            defaults.update(query)
+            instance = model(**defaults)
+            session.add(instance)
+        return instance
+
+
+def run(number: int, rows: int, kind: t.Text) -> t.Dict[t.Text, t.Any]:
+    """ 执行基准测试
+
+    @param number: 执行次数
+    @param rows: 数据行数
+    @param kind: memory/file
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    cases = {
+        'select_or_create.hit': lambda f: lambda i: f(orm, model=User, name=f'user{i % rows}'),
+        'select_or_create.miss': lambda f: lambda i: f(orm, model=User, name=f'{f.__name__}{i}'),
+        'update_or_create.hit': lambda f: lambda i: f(orm, model=User, defaults={'age': i % 90}, name=f'user{i % rows}'),
+    }
+    funcs = {
+        'select_or_create': (legacy_select_or_create, select_or_create),
+        'update_or_create': (legacy_update_or_create, update_or_create),
+    }
+    for name, make_case in cases.items():
+        for label, func in zip(('before', 'after'), funcs[name.split('.')[0]]):
+            orm = make_orm(kind, rows=rows)
+            with QueryCounter(orm) as counter:
+                stats = measure(make_case(func), number)
+            orm.get_client().commit()
+            orm.stop()
+            stats['queries_per_call'] = counter.count / number
+            report[f'{name}.{label}'] = stats
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='select_or_create/update_or_create benchmark')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--kind', choices=['memory', 'file'], default='memory')
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.rows, options.kind), indent=2))
@@ -0,0 +1,67 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from argparse import ArgumentParser
+
+from common import User
+from common import measure
+from common import make_orm
+from service_sqlalchemy.core.transaction import safe_transaction
+
+
+def bare(orm: t.Any, i: int, rows: int) -> None:
+    """ 不经过safe_transaction的基准: 直接在会话上更新并提交 """
+    session = orm.get_client()
+    session.query(User).filter(User.id == i % rows + 1).update({'age': i % 90})
+    session.commit()
+
+
+def flat(orm: t.Any, i: int, rows: int) -> None:
+    """ safe_transaction提交事务 """
+    with safe_transaction(orm, commit=True) as session:
+        session.query(User).filter(User.id == i % rows + 1).update({'age': i % 90})
+
+
+def nested(orm: t.Any, i: int, rows: int) -> None:
+    """ 外层事务中通过SAVEPOINT提交, 外层最后统一提交 """
+    with safe_transaction(orm, commit=True):
+        with safe_transaction(orm, nested=True, commit=True) as session:
+            session.query(User).filter(User.id == i % rows + 1).update({'age': i % 90})
+
+
+def readonly(orm: t.Any, i: int, rows: int) -> None:
+    """ safe_transaction只读事务 """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        session.query(User.id).filter(User.id == i % rows + 1).all()
+
+
+def run(number: int, rows: int, kind: t.Text) -> t.Dict[t.Text, t.Any]:
+    """ 对比safe_transaction在嵌套与非嵌套时的开销
+
+    @param number: 执行次数
+    @param rows: 用户数量
+    @param kind: memory/file
+    @return: t.Dict[t.Text, t.Any]
+    """
+    report = {}
+    for func in (bare, flat, nested, readonly):
+        orm = make_orm(kind, rows=rows)
+        report[func.__name__] = measure(lambda i: func(orm, i, rows), number)
+        orm.get_client().close()
+        orm.stop()
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='safe_transaction overhead benchmark')
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--kind', choices=['memory', 'file'], default='memory')
+    options = parser.parse_args()
+    print(json.dumps(run(options.number, options.rows, options.kind), indent=2))
@@ -0,0 +1,189 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import sys
+import itertools
+import typing as t
+import tempfile
+import sqlalchemy as sa
+
+from types import ModuleType
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import relationship
+from sqlalchemy.ext.declarative import declarative_base
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service_sqlalchemy.core.dependencies import SQLAlchemy
+from service_sqlalchemy.constants import SQLALCHEMY_CONFIG_KEY
+
+BaseModel = declarative_base()
+# 每个内存库使用独立的名称
+sequence = itertools.count()
+
+
+class User(BaseModel):
+    """ 用户模型 """
+    __tablename__ = 'user'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True, comment='用户ID')
+    name = sa.Column(sa.String(64), nullable=False, unique=True, comment='用户名称')
+    age = sa.Column(sa.Integer, nullable=False, default=0, comment='用户年龄')
+    apps = relationship('Apps', back_populates='user')
+
+
+class Apps(BaseModel):
+    """ 应用模型 """
+    __tablename__ = 'apps'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True, comment='应用ID')
+    name = sa.Column(sa.String(64), nullable=False, comment='应用名称')
+    score = sa.Column(sa.Float, nullable=False, default=0, comment='应用评分')
+    user_id = sa.Column(sa.Integer, sa.ForeignKey('user.id'), nullable=False, index=True, comment='用户ID')
+    user = relationship('User', back_populates='apps')
+
+
+# 供Search按名称加载模型
+models = ModuleType('benchmarks.models')
+models.User, models.Apps = User, Apps
+
+
+class BenchConfig(object):
+    """ 基准配置 """
+
+    def __init__(self, data: t.Dict[t.Text, t.Any]) -> None:
+        """ 初始化实例
+
+        @param data: 配置字典
+        """
+        self._data = data
+
+    def get(self, key: t.Text, default: t.Any = None) -> t.Any:
+        """ 获取配置
+
+        @param key: 点分路径
+        @param default: 默认值
+        @return: t.Any
+        """
+        data = self._data
+        for name in key.split('.'):
+            if not isinstance(data, dict) or name not in data:
+                return default
+            data = data[name]
+        return data
+
+
+class BenchContainer(object):
+    """ 基准容器 """
+
+    def __init__(self, config: t.Dict[t.Text, t.Any]) -> None:
+        """ 初始化实例
+
+        @param config: 配置字典
+        """
+        self.config = BenchConfig(config)
+
+
+def make_url(kind: t.Text) -> t.Text:
+    """ 生成数据库地址
+
+    @param kind: memory/file
+    @return: t.Text
+    """
+    if kind == 'memory':
+        # 共享缓存的内存库才能被连接池中的多个连接访问
+        return f'sqlite:///file:bench{os.getpid()}_{next(sequence)}?mode=memory&cache=shared&uri=true'
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    return f'sqlite:///{path}'
+
+
+def make_orm(
+        kind: t.Optional[t.Text] = 'file',
+        rows: t.Optional[int] = 0,
+        engine_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+        **options: t.Any
+) -> SQLAlchemy:
+    """ 创建并初始化依赖
+
+    @param kind: memory/file
+    @param rows: 用户数量
+    @param engine_options: 覆盖默认的引擎配置
+    @param options: 别名配置
+    @return: SQLAlchemy
+    """
+    engine_options = {'url': make_url(kind), 'poolclass': QueuePool, 'pool_size': 32, 'max_overflow': 32} | (engine_options or {})
+    # 连接在线程间签出签入, 关闭pysqlite的同线程检查
+    engine_options.setdefault('connect_args', {'check_same_thread': False})
+    orm = SQLAlchemy(alias='bench', engine_options=engine_options)
+    orm.container = BenchContainer({SQLALCHEMY_CONFIG_KEY: {'bench': options}})
+    orm.setup()
+    BaseModel.metadata.create_all(orm.engine)
+    if rows:
+        with orm.engine.begin() as connection:
+            users = [{'id': i + 1, 'name': f'user{i}', 'age': i % 90} for i in range(rows)]
+            connection.execute(User.__table__.insert(), users)
+            apps = [{'name': f'app{i}', 'score': i % 100 / 10, 'user_id': i % rows + 1} for i in range(rows * 2)]
+            connection.execute(Apps.__table__.insert(), apps)
+    return orm
+
+
+class QueryCounter(object):
+    """ 统计执行的语句数 """
+
+    def __init__(self, orm: SQLAlchemy) -> None:
+        """ 初始化实例
+
+        @param orm: sqlalchemy
+        """
+        self.count = 0
+        self.engine = orm.engine
+
+    def __enter__(self) -> QueryCounter:
+        """ 开始统计
+
+        @return: QueryCounter
+        """
+        event.listen(self.engine, 'before_cursor_execute', self.on_execute)
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        """ 结束统计
+
+        @return: None
+        """
+        event.remove(self.engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, *args: t.Any, **kwargs: t.Any) -> None:
+        """ 语句执行事件
+
+        @return: None
+        """
+        self.count += 1
+
+
+def measure(func: t.Callable[[int], t.Any], number: int) -> t.Dict[t.Text, float]:
+    """ 测量执行耗时
+
+    @param func: 测量函数, 参数为当前次数
+    @param number: 执行次数
+    @return: t.Dict[t.Text, float]
+    """
+    timings = []
+    for index in range(number):
+        start = perf_counter()
+        func(index)
+        timings.append(perf_counter() - start)
+    timings.sort()
+    return {
+        'number': number,
+        'total': sum(timings),
+        'mean': sum(timings) / number,
+        'p50': timings[number // 2],
+        'p99': timings[min(number - 1, int(number * 0.99))]
+    }
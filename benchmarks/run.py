@@ -0,0 +1,153 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import typing as t
+import sqlalchemy as sa
+
+from argparse import ArgumentParser
+
+# 基准名称以及支持的公共参数
+suites = {
+    'compile': ['--number'],
+    'search': ['--number', '--kind', '--rows'],
+    'results': ['--number', '--kind', '--rows'],
+    'shortcuts': ['--number', '--kind', '--rows'],
+    'transaction': ['--number', '--kind', '--rows'],
+    'pool': ['--number', '--kind'],
+    'async': ['--number', '--rows'],
+}
+
+
+def load_commit() -> t.Optional[t.Text]:
+    """ 加载当前提交
+
+    @return: t.Optional[t.Text]
+    """
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def run_suite(name: t.Text, options: t.Dict[t.Text, t.Any], timeout: int) -> t.Dict[t.Text, t.Any]:
+    """ 在独立进程中执行基准
+
+    注意: 每个基准独占一个解释器, 彼此的连接池/缓存/内存占用互不影响
+
+    @param name: 基准名称
+    @param options: 公共参数
+    @param timeout: 超时秒数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'bench_{name}.py')
+    args = [sys.executable, path]
+    for flag in suites[name]:
+        value = options.get(flag[2:])
+        value is None or args.extend([flag, str(value)])
+    start = time.perf_counter()
+    try:
+        output = subprocess.run(args, capture_output=True, text=True, timeout=timeout, cwd=os.path.dirname(path))
+    except subprocess.TimeoutExpired:
+        return {'error': f'timeout after {timeout}s'}
+    if output.returncode != 0:
+        # 缺少可选依赖(如aiosqlite)等失败不影响其它基准
+        lines = output.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {output.returncode}'}
+    return {'seconds': time.perf_counter() - start, 'report': json.loads(output.stdout)}
+
+
+def flatten(report: t.Dict[t.Text, t.Any], prefix: t.Text = '') -> t.Dict[t.Text, float]:
+    """ 展开报告中的平均耗时
+
+    @param report: 基准报告
+    @param prefix: 键前缀
+    @return: t.Dict[t.Text, float]
+    """
+    means = {}
+    for key, value in report.items():
+        if not isinstance(value, dict):
+            continue
+        if isinstance(value.get('mean'), (int, float)):
+            means[f'{prefix}{key}'] = value['mean']
+        else:
+            means.update(flatten(value, f'{prefix}{key}.'))
+    return means
+
+
+def compare(old: t.Dict[t.Text, t.Any], new: t.Dict[t.Text, t.Any], threshold: float) -> int:
+    """ 对比两次结果的平均耗时
+
+    @param old: 基线结果
+    @param new: 本次结果
+    @param threshold: 变慢超过该比例视为退化
+    @return: int
+    """
+    regressions = 0
+    print(f"{'benchmark':<56}{'old(us)':>12}{'new(us)':>12}{'ratio':>8}")
+    for name, suite in new['suites'].items():
+        if 'report' not in suite or 'report' not in old['suites'].get(name, {}):
+            continue
+        old_means = flatten(old['suites'][name]['report'])
+        for key, mean in flatten(suite['report']).items():
+            if not old_means.get(key):
+                continue
+            ratio = mean / old_means[key]
+            flag = ''
+            if ratio > 1 + threshold:
+                flag, regressions = ' !', regressions + 1
+            print(f'{name + "." + key:<56}{old_means[key] * 1e6:>12.1f}{mean * 1e6:>12.1f}{ratio:>8.2f}{flag}')
+    return regressions
+
+
+def run(names: t.List[t.Text], options: t.Dict[t.Text, t.Any], timeout: int) -> t.Dict[t.Text, t.Any]:
+    """ 依次执行基准并汇总
+
+    @param names: 基准名称
+    @param options: 公共参数
+    @param timeout: 单个基准的超时秒数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    result = {
+        'commit': load_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': sa.__version__,
+        'platform': platform.platform(),
+        'options': options,
+        'suites': {}
+    }
+    for name in names:
+        result['suites'][name] = run_suite(name, options, timeout)
+        print(f'{name}: {result["suites"][name].get("error", "ok")}', file=sys.stderr)
+    return result
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='run benchmarks in separate processes and compare with a baseline')
+    parser.add_argument('--suites', nargs='+', choices=list(suites), default=list(suites))
+    parser.add_argument('--number', type=int, default=None, help='override the number of each benchmark')
+    parser.add_argument('--kind', choices=['memory', 'file'], default=None)
+    parser.add_argument('--rows', type=int, default=None)
+    parser.add_argument('--timeout', type=int, default=1800)
+    parser.add_argument('--output', default=None, help='write json result to file')
+    parser.add_argument('--compare', default=None, help='baseline json result to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='mean slowdown ratio treated as regression')
+    namespace = parser.parse_args()
+    result = run(namespace.suites, {'number': namespace.number, 'kind': namespace.kind, 'rows': namespace.rows}, namespace.timeout)
+    if namespace.output:
+        with open(namespace.output, 'w', encoding='utf-8') as f: json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+    if namespace.compare:
+        with open(namespace.compare, encoding='utf-8') as f: baseline = json.load(f)
+        sys.exit(1 if compare(baseline, result, namespace.threshold) else 0)
@@ -0,0 +1,104 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sys
+import json
+
+from logging import getLogger
+from argparse import Namespace
+from importlib import import_module
+from argparse import ArgumentParser
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from service_core.cli.subcmds import BaseCommand
+from service_core.core.configure import Configure
+from service_sqlalchemy.core.exports import CSV
+from service_sqlalchemy.core.exports import export_formats
+from service_sqlalchemy.core.exports import export_compressions
+from service_sqlalchemy.core.exports import export_search
+from service_sqlalchemy.core.exports import ExportResult
+from service_sqlalchemy.core.searching.inlists import InListStrategy
+from service_sqlalchemy.core.searching.limits import load_limits
+from service_sqlalchemy.constants import SQLALCHEMY_CONFIG_KEY
+
+logger = getLogger(__name__)
+
+
+class Export(BaseCommand):
+    """ 导出sqlalchemy查询结果 """
+
+    name = 'export'
+    help = 'export sqlalchemy search results'
+    desc = 'export sqlalchemy search results'
+
+    @classmethod
+    def init_parser(cls, parser: ArgumentParser, config: Configure) -> None:
+        """ 自定义子命令
+
+        @param parser: 解析对象
+        @param config: 配置字典
+        @return: None
+        """
+        parser.add_argument('-a', '--alias', required=True,
+                            help='alias in config')
+        parser.add_argument('-m', '--module', required=True,
+                            help='models module path, such as facade.models')
+        parser.add_argument('-q', '--query', required=True,
+                            help='search payload json, or @path to a json file')
+        parser.add_argument('-o', '--output', default='-',
+                            help='output file path, default stdout')
+        parser.add_argument('-f', '--format', choices=export_formats, default=CSV,
+                            help='output format, arrow/parquet require pyarrow')
+        parser.add_argument('-c', '--compression', choices=export_compressions, default=None,
+                            help='output compression')
+        parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                            help='rows fetched and written per batch')
+
+    @classmethod
+    def main(cls, namespace: Namespace, *, config: Configure) -> None:
+        """ 子命令入口
+
+        查询参数与orm_json_search相同, 结果通过服务端游标分批写入, 只读查询不会提交
+
+        @param namespace: 命名空间
+        @param config: 配置字典
+        @return: None
+        """
+        alias, query = namespace.alias, namespace.query
+        if query.startswith('@'):
+            with open(query[1:], encoding='utf-8') as f: query = f.read()
+        payload = json.loads(query)
+        module = import_module(namespace.module)
+        engine_options = config.get(f'{SQLALCHEMY_CONFIG_KEY}.{alias}.engine_options', default={})
+        engine = create_engine(**dict(engine_options or {}))
+        search_options = config.get(f'{SQLALCHEMY_CONFIG_KEY}.{alias}.search_options', default={}) or {}
+        # 与依赖保持一致, 大IN列表按配置的策略执行
+        in_list_strategy = InListStrategy(
+            threshold=search_options.get('in_list_threshold', 1000),
+            strategy=search_options.get('in_list_strategy', 'inline'),
+            chunk_size=search_options.get('in_list_chunk_size', 1000),
+            chunk_threshold=search_options.get('in_list_chunk_threshold', 10000)
+        )
+        in_list_strategy.install(engine)
+
+        def progress(result: ExportResult) -> None:
+            logger.info(f'sqlalchemy alias {alias} exported {result.rows} rows in {result.seconds:.3f}s')
+
+        stream = sys.stdout.buffer if namespace.output == '-' else open(namespace.output, 'wb')
+        session = Session(bind=engine)
+        try:
+            result = export_search(
+                session, module=module, stream=stream,
+                format=namespace.format, compression=namespace.compression,
+                batch_size=namespace.batch_size, progress=progress,
+                in_list_strategy=in_list_strategy, limits=load_limits(search_options), **payload
+            )
+            logger.info(f'sqlalchemy alias {alias} export done, {json.dumps(result.dict())}')
+        finally:
+            session.rollback()
+            session.close()
+            stream is sys.stdout.buffer or stream.close()
+            engine.dispose()
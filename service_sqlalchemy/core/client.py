@@ -5,5 +5,7 @@
 from __future__ import annotations
 
 from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 SQLAlchemyClient = Session
+AsyncSQLAlchemyClient = AsyncSession
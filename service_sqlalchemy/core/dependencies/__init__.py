@@ -5,3 +5,4 @@
 from __future__ import annotations
 
 from .orm import SQLAlchemy
+from .async_orm import AsyncSQLAlchemy
@@ -0,0 +1,136 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+import asyncio
+
+from logging import getLogger
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import async_scoped_session
+from service_sqlalchemy.core.client import AsyncSQLAlchemyClient
+from service_sqlalchemy.core.telemetry import RetryStats
+from service_sqlalchemy.core.searching.plans import PlanCache
+from service_sqlalchemy.core.searching.validate import SchemaCache
+from service_sqlalchemy.core.searching.inlists import InListStrategy
+from service_sqlalchemy.core.searching.limits import load_limits
+from service_core.core.service.dependency import Dependency
+from service_sqlalchemy.constants import SQLALCHEMY_CONFIG_KEY
+
+logger = getLogger(__name__)
+
+
+class AsyncSQLAlchemy(Dependency):
+    """ SQLAlchemy异步依赖类
+
+    基于sqlalchemy.ext.asyncio, 需使用异步驱动, 如aiomysql/asyncmy/aiosqlite
+    """
+
+    name = 'AsyncSQLAlchemy'
+
+    def __init__(
+            self,
+            alias: t.Text,
+            engine_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            session_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            search_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            **kwargs: t.Any
+    ) -> None:
+        """ 初始化实例
+
+        @param alias: 配置别名
+        @param engine_options:  引擎配置
+        @param session_options: 会话配置
+        @param search_options: 查询配置
+        @param kwargs: 其它参数
+        """
+        self.alias = alias
+        self.engine = None
+        self.session_cls = None
+        self.engine_options = engine_options or {}
+        self.session_options = session_options or {}
+        self.plan_cache = None
+        self.schema_cache = None
+        self.in_list_strategy = None
+        self.search_limits = None
+        # 事务重试统计, 见safe_transaction的重试装饰器retry_transaction
+        self.retry_stats = RetryStats()
+        self.search_options = search_options or {}
+        super(AsyncSQLAlchemy, self).__init__(**kwargs)
+
+    def setup(self) -> None:
+        """ 生命周期 - 载入阶段
+
+        @return: None
+        """
+        engine_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.engine_options', default={})
+        # 防止YAML中声明值为None
+        self.engine_options = (engine_options or {}) | self.engine_options
+        # 注意: sqlite默认使用NullPool/StaticPool, 不支持设置连接池大小
+        if make_url(self.engine_options['url']).get_backend_name() != 'sqlite':
+            self.engine_options.setdefault('pool_size', 1024)
+            self.engine_options.setdefault('max_overflow', 1024)
+            self.engine_options.setdefault('pool_timeout', 0)
+            self.engine_options.setdefault('pool_recycle', 2 * 60 * 60)
+        self.engine_options.setdefault('echo', False)
+        self.engine_options.setdefault('pool_pre_ping', True)
+        session_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.session_options', default={})
+        # 防止YAML中声明值为None
+        self.session_options = (session_options or {}) | self.session_options
+        # 提交后不过期实例, 避免在协程外访问属性时触发隐式的IO
+        self.session_options.setdefault('expire_on_commit', False)
+        search_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.search_options', default={})
+        # 防止YAML中声明值为None
+        self.search_options = (search_options or {}) | self.search_options
+        self.search_options.setdefault('plan_cache_size', 512)
+        self.search_options.setdefault('schema_cache_size', 1024)
+        self.plan_cache = PlanCache(maxsize=self.search_options['plan_cache_size'])
+        self.schema_cache = SchemaCache(maxsize=self.search_options['schema_cache_size'])
+        self.search_options.setdefault('in_list_threshold', 1000)
+        self.search_options.setdefault('in_list_strategy', 'inline')
+        self.search_options.setdefault('in_list_chunk_size', 1000)
+        self.search_options.setdefault('in_list_chunk_threshold', 10000)
+        self.in_list_strategy = InListStrategy(
+            threshold=self.search_options['in_list_threshold'],
+            strategy=self.search_options['in_list_strategy'],
+            chunk_size=self.search_options['in_list_chunk_size'],
+            chunk_threshold=self.search_options['in_list_chunk_threshold']
+        )
+        # 复杂度限制, 如max_joins/max_filter_nodes/max_filter_depth/max_in_size/max_page_size, 不配置时不限制
+        self.search_limits = load_limits(self.search_options)
+        self.engine = create_async_engine(**self.engine_options)
+        self.in_list_strategy.install(self.engine)
+        session_factory = sessionmaker(bind=self.engine, class_=AsyncSession, **self.session_options)
+        # 每个协程任务独享一个会话, 与同步版本中每个线程独享一个会话保持一致
+        self.session_cls = async_scoped_session(session_factory, scopefunc=asyncio.current_task)
+
+    def stop(self) -> None:
+        """ 生命周期 - 关闭阶段
+
+        @return: None
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.dispose())
+        else:
+            loop.create_task(self.dispose())
+
+    async def dispose(self) -> None:
+        """ 释放连接池
+
+        @return: None
+        """
+        await self.engine.dispose()
+
+    def get_client(self) -> AsyncSQLAlchemyClient:
+        """ 获取当前任务的会话
+
+        @return: AsyncSQLAlchemyClient
+        """
+        return self.session_cls()
@@ -11,6 +11,19 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 from service_sqlalchemy.core.client import SQLAlchemyClient
+from service_sqlalchemy.core.identity import IdentityCache
+from service_sqlalchemy.core.pooling import AdaptivePool
+from service_sqlalchemy.core.replicas import ReplicaSet
+from service_sqlalchemy.core.replicas import RoutingSession
+from service_sqlalchemy.core.slowlog import QueryStats
+from service_sqlalchemy.core.telemetry import PoolStats
+from service_sqlalchemy.core.telemetry import RetryStats
+from service_sqlalchemy.core.searching.plans import PlanCache
+from service_sqlalchemy.core.searching.validate import SchemaCache
+from service_sqlalchemy.core.searching.inlists import InListStrategy
+from service_sqlalchemy.core.searching.limits import load_limits
+from service_sqlalchemy.core.searching.results import ResultCache
+from service_sqlalchemy.core.searching.explain import ExplainGuard
 from service_core.core.service.dependency import Dependency
 from service_sqlalchemy.constants import SQLALCHEMY_CONFIG_KEY
 
@@ -29,6 +42,11 @@ class SQLAlchemy(Dependency):
             session_wrapper: t.Optional[t.Callable[..., t.Any]] = None,
             session_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
             migrate_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            search_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            replica_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            telemetry_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            pool_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
+            identity_options: t.Optional[t.Dict[t.Text, t.Any]] = None,
             **kwargs: t.Any
     ) -> None:
         """ 初始化实例
@@ -38,6 +56,11 @@ class SQLAlchemy(Dependency):
         @param session_wrapper: 会话装饰
         @param session_options: 会话配置
         @param migrate_options: 迁移配置
+        @param search_options: 查询配置
+        @param replica_options: 从库配置
+        @param telemetry_options: 监控配置
+        @param pool_options: 连接池配置
+        @param identity_options: 实体缓存配置
         @param kwargs: 其它参数
         """
         self.alias = alias
@@ -59,6 +82,23 @@ class SQLAlchemy(Dependency):
         self.engine_options.setdefault('pool_recycle', 2 * 60 * 60)
         self.session_options = session_options or {}
         self.migrate_options = migrate_options or {}
+        self.plan_cache = None
+        self.schema_cache = None
+        self.in_list_strategy = None
+        self.result_cache = None
+        self.explain_guard = None
+        self.search_limits = None
+        self.search_options = search_options or {}
+        self.replicas = None
+        self.replica_options = replica_options or {}
+        self.pool_stats = None
+        # 事务重试统计, 见safe_transaction的重试装饰器retry_transaction
+        self.retry_stats = RetryStats()
+        self.query_stats = None
+        self.telemetry_options = telemetry_options or {}
+        self.pool_options = pool_options or {}
+        self.identity_cache = None
+        self.identity_options = identity_options or {}
         super(SQLAlchemy, self).__init__(**kwargs)
 
     def setup(self) -> None:
@@ -72,8 +112,120 @@ class SQLAlchemy(Dependency):
         session_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.session_options', default={})
         # 防止YAML中声明值为None
         self.session_options = (session_options or {}) | self.session_options
+        search_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.search_options', default={})
+        # 防止YAML中声明值为None
+        self.search_options = (search_options or {}) | self.search_options
+        # 每个别名缓存的查询计划数量, 设置为0时关闭计划缓存
+        self.search_options.setdefault('plan_cache_size', 512)
+        self.plan_cache = PlanCache(maxsize=self.search_options['plan_cache_size'])
+        # 每个别名缓存的校验结果数量, 设置为0时关闭校验缓存
+        self.search_options.setdefault('schema_cache_size', 1024)
+        self.schema_cache = SchemaCache(maxsize=self.search_options['schema_cache_size'])
+        # 超过该数量的IN列表按策略改用数组参数/临时表/拆分查询, 统计见orm.in_list_strategy.stats()
+        self.search_options.setdefault('in_list_threshold', 1000)
+        self.search_options.setdefault('in_list_strategy', 'inline')
+        self.search_options.setdefault('in_list_chunk_size', 1000)
+        self.search_options.setdefault('in_list_chunk_threshold', 10000)
+        self.in_list_strategy = InListStrategy(
+            threshold=self.search_options['in_list_threshold'],
+            strategy=self.search_options['in_list_strategy'],
+            chunk_size=self.search_options['in_list_chunk_size'],
+            chunk_threshold=self.search_options['in_list_chunk_threshold']
+        )
+        # 查询结果缓存数量, 默认0表示关闭, 开启后orm_json_search(cache_results=True)时生效
+        self.search_options.setdefault('result_cache_size', 0)
+        self.search_options.setdefault('result_cache_ttl', 60)
+        # 缓存值的签名密钥, 多个进程共享外部存储时需配置相同的值
+        self.search_options.setdefault('result_cache_secret', None)
+        # 可传入StoreBackend等自定义后端, 此时忽略result_cache_size
+        result_backend = self.search_options.get('result_cache_backend', None)
+        if result_backend is not None or self.search_options['result_cache_size']:
+            self.result_cache = ResultCache(
+                namespace=self.alias,
+                backend=result_backend,
+                maxsize=self.search_options['result_cache_size'],
+                ttl=self.search_options['result_cache_ttl'],
+                secret=self.search_options['result_cache_secret']
+            )
+        # 执行计划护栏, 默认None表示关闭, 可选reject/downgrade/warn, 相同形状的查询只EXPLAIN一次
+        self.search_options.setdefault('explain_action', None)
+        if self.search_options['explain_action'] is not None:
+            self.explain_guard = ExplainGuard(
+                max_full_scans=self.search_options.get('explain_max_full_scans', None),
+                max_rows=self.search_options.get('explain_max_rows', None),
+                allow_filesort=self.search_options.get('explain_allow_filesort', True),
+                allow_temporary=self.search_options.get('explain_allow_temporary', True),
+                action=self.search_options['explain_action'],
+                maxsize=self.search_options.get('explain_cache_size', 512)
+            )
+        # 复杂度限制, 如max_joins/max_filter_nodes/max_filter_depth/max_in_size/max_page_size, 不配置时不限制
+        self.search_limits = load_limits(self.search_options)
+        replica_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.replica_options', default={})
+        # 防止YAML中声明值为None
+        self.replica_options = (replica_options or {}) | self.replica_options
+        telemetry_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.telemetry_options', default={})
+        # 防止YAML中声明值为None
+        self.telemetry_options = (telemetry_options or {}) | self.telemetry_options
+        # 是否统计连接池, 关闭时不注册任何连接池事件
+        self.telemetry_options.setdefault('pool_stats', True)
+        # 是否统计语句耗时, 开启后注册引擎级事件, 每条语句会有额外的分发开销
+        self.telemetry_options.setdefault('query_stats', False)
+        # 慢查询阈值(秒)/快查询的采样比例/是否隐藏绑定参数
+        self.telemetry_options.setdefault('slow_query_seconds', 0.5)
+        self.telemetry_options.setdefault('sample_rate', 0.0)
+        self.telemetry_options.setdefault('redact_parameters', True)
+        pool_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.pool_options', default={})
+        # 防止YAML中声明值为None
+        self.pool_options = (pool_options or {}) | self.pool_options
+        # 自适应模式下常驻连接数在min_size和max_size之间伸缩, 连接耗尽时有界排队等待
+        if self.pool_options.get('adaptive', False):
+            self.engine_options['poolclass'] = AdaptivePool
+            self.engine_options['pool_timeout'] = self.pool_options.get('timeout', 3)
+            for name in ('min_size', 'max_size', 'max_waiters', 'grow_wait', 'adjust_interval'):
+                name in self.pool_options and self.engine_options.update({name: self.pool_options[name]})
+        identity_options = self.container.config.get(f'{SQLALCHEMY_CONFIG_KEY}.{self.alias}.identity_options', default={})
+        # 防止YAML中声明值为None
+        self.identity_options = (identity_options or {}) | self.identity_options
+        # 实体缓存数量, 默认0表示关闭, 开启后按表名注册需要缓存的模型及其自然键
+        self.identity_options.setdefault('maxsize', 0)
+        # 实体缓存是进程内的, 其它进程提交的写入只能等待过期
+        self.identity_options.setdefault('ttl', 60)
+        if self.identity_options['maxsize']:
+            self.identity_cache = IdentityCache(
+                maxsize=self.identity_options['maxsize'],
+                ttl=self.identity_options['ttl'],
+                models=self.identity_options.get('models', {}) or {}
+            )
         self.engine = create_engine(**self.engine_options)
-        self.session_cls = scoped_session(sessionmaker(bind=self.engine, **self.session_options))
+        self.in_list_strategy.install(self.engine)
+        if self.telemetry_options['pool_stats']:
+            self.pool_stats = PoolStats(self.engine)
+        if self.telemetry_options['query_stats']:
+            self.query_stats = QueryStats(
+                threshold=self.telemetry_options['slow_query_seconds'],
+                sample_rate=self.telemetry_options['sample_rate'],
+                redact=self.telemetry_options['redact_parameters']
+            )
+            self.query_stats.install(self.engine)
+        session_options = self.session_options
+        replica_urls = self.replica_options.get('urls', []) or []
+        if replica_urls:
+            # 从库沿用主库的引擎配置, 只读会话按策略路由到健康的从库
+            engines = [create_engine(**(self.engine_options | {'url': url})) for url in replica_urls]
+            self.replicas = ReplicaSet(
+                engines,
+                balance=self.replica_options.get('balance', 'round_robin'),
+                sticky_seconds=self.replica_options.get('sticky_seconds', 3),
+                eject_seconds=self.replica_options.get('eject_seconds', 30)
+            )
+            session_options = session_options | {'class_': RoutingSession, 'replicas': self.replicas}
+            for engine in engines: self.query_stats and self.query_stats.install(engine)
+            for engine in engines: self.in_list_strategy.install(engine)
+        session_factory = sessionmaker(bind=self.engine, **session_options)
+        self.replicas and self.replicas.install(session_factory)
+        self.result_cache and self.result_cache.install(session_factory)
+        self.identity_cache and self.identity_cache.install(session_factory)
+        self.session_cls = scoped_session(session_factory)
         self.session_cls = self.session_wrapper(self.session_cls) if self.session_wrapper else self.session_cls
 
     def stop(self) -> None:
@@ -82,6 +234,7 @@ class SQLAlchemy(Dependency):
         @return: None
         """
         self.engine.dispose()
+        self.replicas and self.replicas.dispose()
 
     def get_client(self) -> SQLAlchemyClient:
         """ 获取一个独立的会话
@@ -0,0 +1,354 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import io
+import abc
+import csv
+import gzip
+import json
+import typing as t
+
+from datetime import date
+from datetime import datetime
+from time import perf_counter
+from types import ModuleType
+from sqlalchemy.types import TypeEngine
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.client import SQLAlchemyClient
+from service_sqlalchemy.core.searching import Search
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# 导出格式
+CSV, NDJSON, ARROW, PARQUET = 'csv', 'ndjson', 'arrow', 'parquet'
+export_formats = (CSV, NDJSON, ARROW, PARQUET)
+# 压缩方式, arrow/parquet使用格式内置的压缩
+GZIP, ZSTD = 'gzip', 'zstd'
+export_compressions = (GZIP, ZSTD)
+
+
+class ExportResult(object):
+    """ 导出结果 """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self.rows = 0
+        self.batches = 0
+        self.columns = []
+        self.seconds = 0.0
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'rows': self.rows,
+            'batches': self.batches,
+            'columns': self.columns,
+            'seconds': self.seconds
+        }
+
+
+class ExportWriter(abc.ABC):
+    """ 导出写入基类 """
+
+    def __init__(self, stream: t.BinaryIO, compression: t.Optional[t.Text] = None) -> None:
+        """ 初始化实例
+
+        @param stream: 二进制输出流, 不会被关闭
+        @param compression: 压缩方式
+        """
+        self.stream = stream
+        self.compression = compression
+
+    @abc.abstractmethod
+    def open(self, names: t.List[t.Text], types: t.List[t.Optional[type]]) -> None:
+        """ 写入表头
+
+        @param names: 字段名称
+        @param types: 字段的Python类型, 未知时为None
+        @return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def write(self, rows: t.List[t.Any]) -> None:
+        """ 写入一个批次
+
+        @param rows: 数据行
+        @return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """ 结束写入
+
+        @return: None
+        """
+        pass
+
+
+class TextWriter(ExportWriter):
+    """ 文本格式写入, 可选gzip/zstd流式压缩 """
+
+    def __init__(self, stream: t.BinaryIO, compression: t.Optional[t.Text] = None) -> None:
+        """ 初始化实例
+
+        @param stream: 二进制输出流, 不会被关闭
+        @param compression: 压缩方式
+        """
+        super(TextWriter, self).__init__(stream, compression)
+        if compression == GZIP:
+            self.raw = gzip.GzipFile(fileobj=stream, mode='wb')
+        elif compression == ZSTD:
+            self.raw = zstandard.ZstdCompressor().stream_writer(stream, closefd=False)
+        else:
+            self.raw = stream
+        self.text = io.TextIOWrapper(self.raw, encoding='utf-8', newline='', write_through=False)
+
+    def close(self) -> None:
+        """ 结束写入
+
+        @return: None
+        """
+        self.text.flush()
+        # 注意: 分离后关闭文本包装不会关闭输出流, 压缩流关闭时写入结尾但保留输出流
+        self.text.detach()
+        self.raw is not self.stream and self.raw.close()
+        self.stream.flush()
+
+
+class CsvWriter(TextWriter):
+    """ CSV写入 """
+
+    def open(self, names: t.List[t.Text], types: t.List[t.Optional[type]]) -> None:
+        """ 写入表头
+
+        @param names: 字段名称
+        @param types: 字段的Python类型, 未知时为None
+        @return: None
+        """
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(names)
+
+    def write(self, rows: t.List[t.Any]) -> None:
+        """ 写入一个批次
+
+        @param rows: 数据行
+        @return: None
+        """
+        self.writer.writerows(rows)
+
+
+class NdjsonWriter(TextWriter):
+    """ 每行一个JSON对象 """
+
+    def open(self, names: t.List[t.Text], types: t.List[t.Optional[type]]) -> None:
+        """ 写入表头
+
+        @param names: 字段名称
+        @param types: 字段的Python类型, 未知时为None
+        @return: None
+        """
+        self.names = names
+
+    def write(self, rows: t.List[t.Any]) -> None:
+        """ 写入一个批次
+
+        @param rows: 数据行
+        @return: None
+        """
+        names, dumps = self.names, json.dumps
+        # 注意: 日期/Decimal等类型输出为字符串
+        self.text.write(''.join(dumps(dict(zip(names, row)), ensure_ascii=False, default=str) + '\n' for row in rows))
+
+
+class ArrowWriter(ExportWriter):
+    """ Arrow IPC文件写入
+
+    列类型优先由字段类型确定, 未知类型(如Decimal/JSON)由首个批次推断
+    """
+
+    def open(self, names: t.List[t.Text], types: t.List[t.Optional[type]]) -> None:
+        """ 写入表头
+
+        @param names: 字段名称
+        @param types: 字段的Python类型, 未知时为None
+        @return: None
+        """
+        arrow_types = {
+            bool: pyarrow.bool_(), int: pyarrow.int64(), float: pyarrow.float64(), str: pyarrow.string(),
+            bytes: pyarrow.binary(), datetime: pyarrow.timestamp('us'), date: pyarrow.date32()
+        }
+        self.names = names
+        self.types = [arrow_types.get(k, None) for k in types]
+        self.schema = None
+        self.writer = None
+
+    def make_batch(self, rows: t.List[t.Any]) -> t.Any:
+        """ 转换为RecordBatch
+
+        @param rows: 数据行
+        @return: t.Any
+        """
+        columns = list(zip(*rows)) if rows else [()] * len(self.names)
+        if self.schema is None:
+            arrays = [pyarrow.array(c, type=k) for c, k in zip(columns, self.types)]
+            return pyarrow.RecordBatch.from_arrays(arrays, names=self.names)
+        arrays = [pyarrow.array(c, type=f.type) for c, f in zip(columns, self.schema)]
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def make_writer(self, schema: t.Any) -> t.Any:
+        """ 创建写入对象
+
+        @param schema: 数据结构
+        @return: t.Any
+        """
+        options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+        return pyarrow.ipc.new_file(self.stream, schema, options=options)
+
+    def write(self, rows: t.List[t.Any]) -> None:
+        """ 写入一个批次
+
+        @param rows: 数据行
+        @return: None
+        """
+        batch = self.make_batch(rows)
+        if self.writer is None:
+            self.schema = batch.schema
+            self.writer = self.make_writer(self.schema)
+        self.writer.write_batch(batch)
+
+    def close(self) -> None:
+        """ 结束写入
+
+        @return: None
+        """
+        self.writer is None and self.write([])
+        self.writer.close()
+        self.stream.flush()
+
+
+class ParquetWriter(ArrowWriter):
+    """ Parquet文件写入, 每个批次为一个行组 """
+
+    def make_writer(self, schema: t.Any) -> t.Any:
+        """ 创建写入对象
+
+        @param schema: 数据结构
+        @return: t.Any
+        """
+        return pyarrow.parquet.ParquetWriter(self.stream, schema, compression=self.compression or 'snappy')
+
+    def write(self, rows: t.List[t.Any]) -> None:
+        """ 写入一个批次
+
+        @param rows: 数据行
+        @return: None
+        """
+        batch = self.make_batch(rows)
+        if self.writer is None:
+            self.schema = batch.schema
+            self.writer = self.make_writer(self.schema)
+        self.writer.write_table(pyarrow.Table.from_batches([batch]))
+
+
+writer_types = {CSV: CsvWriter, NDJSON: NdjsonWriter, ARROW: ArrowWriter, PARQUET: ParquetWriter}
+
+
+def load_type(column: t.Any) -> t.Optional[type]:
+    """ 加载字段的Python类型
+
+    @param column: 字段或表达式
+    @return: t.Optional[type]
+    """
+    type_ = getattr(column, 'type', None)
+    # 未声明Python类型的字段(如NullType/TypeDecorator)沿用TypeEngine的默认实现, 视为未知类型
+    if type_ is None or type(type_).python_type is TypeEngine.python_type:
+        return None
+    return type_.python_type
+
+
+def make_writer(stream: t.BinaryIO, format: t.Text, compression: t.Optional[t.Text] = None) -> ExportWriter:
+    """ 创建导出写入对象
+
+    依赖缺失或格式不支持的压缩方式在查询前即报错
+
+    @param stream: 二进制输出流
+    @param format: csv/ndjson/arrow/parquet
+    @param compression: gzip/zstd
+    @return: ExportWriter
+    """
+    if format not in export_formats:
+        errs = f'invalid export format {format}'
+        raise ValidationError(errormsg=errs)
+    if compression is not None and compression not in export_compressions:
+        errs = f'invalid export compression {compression}'
+        raise ValidationError(errormsg=errs)
+    if format in (ARROW, PARQUET) and pyarrow is None:
+        errs = f'export format {format} requires pyarrow'
+        raise ValidationError(errormsg=errs)
+    if format == ARROW and compression == GZIP:
+        errs = 'export format arrow not support gzip'
+        raise ValidationError(errormsg=errs)
+    if format in (CSV, NDJSON) and compression == ZSTD and zstandard is None:
+        errs = 'export compression zstd requires zstandard'
+        raise ValidationError(errormsg=errs)
+    return writer_types[format](stream, compression)
+
+
+def export_search(
+        session: SQLAlchemyClient,
+        *,
+        module: ModuleType,
+        stream: t.BinaryIO,
+        format: t.Optional[t.Text] = CSV,
+        compression: t.Optional[t.Text] = None,
+        batch_size: t.Optional[int] = 1000,
+        progress: t.Optional[t.Callable[[ExportResult], t.Any]] = None,
+        **payload: t.Any
+) -> ExportResult:
+    """ 流式导出查询结果
+
+    复用Search的编译和流式遍历, 通过服务端游标分批写入, 内存占用只与batch_size相关
+
+    @param session: 数据会话
+    @param module: 模块对象
+    @param stream: 二进制输出流, 不会被关闭
+    @param format: csv/ndjson/arrow/parquet
+    @param compression: gzip/zstd
+    @param batch_size: 批次大小
+    @param progress: 每个批次写入后的回调
+    @param payload: 查询参数, 同Search
+    @return: ExportResult
+    """
+    writer = make_writer(stream, format, compression)
+    search = Search(session, module=module, **payload)
+    result, start = ExportResult(), perf_counter()
+    names, columns = search.columns
+    result.columns = names
+    writer.open(names, [load_type(c) for c in columns])
+    for rows in search.iter_rows(batch_size):
+        writer.write(rows)
+        result.rows += len(rows)
+        result.batches += 1
+        result.seconds = perf_counter() - start
+        progress and progress(result)
+    writer.close()
+    result.seconds = perf_counter() - start
+    return result
@@ -0,0 +1,308 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import pickle
+import typing as t
+
+from threading import Lock
+from time import monotonic
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.expression import TableClause
+from sqlalchemy.ext.declarative import declarative_base
+from service_sqlalchemy.core.searching.results import load_changed
+from service_sqlalchemy.core.searching.results import mark_changed
+from service_sqlalchemy.core.searching.results import on_transaction_end
+
+BaseModel = declarative_base()
+# 主键查找的标记
+PRIMARY_KEY = '__pk__'
+# 会话事务开始时的失效代数
+GENERATION = 'identity_generation'
+
+
+class IdentityCache(object):
+    """ 二级实体缓存(LRU)
+
+    按(表, 主键)缓存已提交的列数据, 声明的自然键映射到主键, 命中时构造游离实例而无需查询;
+    只缓存注册过的模型, 会话提交写入过的表后清除该表的全部缓存
+
+    注意: 缓存是进程内的, 只能感知本进程会话提交的写入, 其它进程或绕过会话的写入依赖ttl过期
+    """
+
+    def __init__(
+            self,
+            *,
+            maxsize: t.Optional[int] = 4096,
+            ttl: t.Optional[float] = 60,
+            models: t.Optional[t.Dict[t.Text, t.List[t.List[t.Text]]]] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大缓存的实例数, 0表示关闭缓存
+        @param ttl: 过期秒数, None表示不过期
+        @param models: 表名到自然键列表的映射, 如 {'tag': [['name']]}
+        """
+        self.maxsize = maxsize or 0
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # 提交后清除的表数
+        self.invalidations = 0
+        self._lock = Lock()
+        # (表, 主键) => (序列化后的列数据, 自然键索引, 过期时间)
+        self._entries = OrderedDict()
+        # (表, 字段, 值) => 主键
+        self._index = {}
+        # 每次失效递增的代数以及各表最后失效时的代数
+        self._generation = 0
+        self._invalidated = {}
+        # 表名 => 排序后的自然键字段列表
+        self._models = {}
+        for name, keys in (models or {}).items():
+            self.register(name, *keys)
+
+    def __len__(self) -> int:
+        """ 缓存数量
+
+        @return: int
+        """
+        return len(self._entries)
+
+    def register(self, model: t.Union[t.Text, BaseModel], *natural_keys: t.Sequence[t.Text]) -> None:
+        """ 注册需要缓存的模型
+
+        @param model: 模型或表名
+        @param natural_keys: 自然键的字段列表, 需为唯一约束
+        @return: None
+        """
+        name = model if isinstance(model, str) else inspect(model).local_table.fullname
+        keys = self._models.setdefault(name, [])
+        keys.extend(tuple(sorted(k)) for k in natural_keys if tuple(sorted(k)) not in keys)
+
+    def load_key(self, model: BaseModel, query: t.Dict[t.Text, t.Any]) -> t.Optional[t.Tuple]:
+        """ 计算查找键
+
+        查询字段恰好为主键或已声明的自然键时才可使用缓存
+
+        @param model: 目标模型
+        @param query: 查询字典
+        @return: t.Optional[t.Tuple]
+        """
+        mapper = inspect(model)
+        name = mapper.local_table.fullname
+        if not self.maxsize or name not in self._models:
+            return None
+        fields = tuple(sorted(query))
+        primary = tuple(mapper.get_property_by_column(c).key for c in mapper.primary_key)
+        try:
+            if fields == tuple(sorted(primary)):
+                return name, PRIMARY_KEY, tuple(query[k] for k in primary)
+            if fields in self._models[name]:
+                key = name, fields, tuple(query[k] for k in fields)
+                hash(key)
+                return key
+        except TypeError:
+            return None
+        return None
+
+    def get(self, session: Session, model: BaseModel, query: t.Dict[t.Text, t.Any]) -> t.Optional[BaseModel]:
+        """ 获取游离实例
+
+        会话中存在未提交的同表写入时不使用缓存, 关系和延迟加载的字段在合并后按需加载
+
+        @param session: 数据会话
+        @param model: 目标模型
+        @param query: 查询字典
+        @return: t.Optional[BaseModel]
+        """
+        key = self.load_key(model, query)
+        if key is None or key[0] in load_changed(session):
+            return None
+        with self._lock:
+            primary = key[2] if key[1] == PRIMARY_KEY else self._index.get(key, None)
+            entry = None if primary is None else self._entries.get((key[0], primary), None)
+            if entry is not None and entry[2] is not None and entry[2] <= monotonic():
+                self.expirations += 1
+                self.discard((key[0], primary))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end((key[0], primary))
+        data = entry[0]
+        instance = model.__mapper__.class_manager.new_instance()
+        # 注意: 每次反序列化出独立的值, 调用方修改可变类型的字段不会污染缓存
+        for k, v in pickle.loads(data).items():
+            set_committed_value(instance, k, v)
+        make_transient_to_detached(instance)
+        return instance
+
+    def set(self, session: Session, instance: BaseModel) -> None:
+        """ 缓存实例的列数据
+
+        会话中存在未提交的同表写入或事务开始后该表被其它会话提交过写入时不缓存,
+        避免回滚后缓存中留下不存在的数据, 以及可重复读隔离级别下快照中的旧数据
+
+        @param session: 数据会话
+        @param instance: 持久化实例
+        @return: None
+        """
+        state = inspect(instance)
+        mapper = state.mapper
+        name = mapper.local_table.fullname
+        if not self.maxsize or name not in self._models or state.identity is None or state.modified:
+            return
+        if name in load_changed(session):
+            return
+        generation = session.info.get(GENERATION, None)
+        if generation is None or self._invalidated.get(name, -1) > generation:
+            return
+        keys = [p.key for p in mapper.column_attrs]
+        # 注意: 过期或延迟加载的字段不在__dict__中, 只缓存完整加载的实例
+        if any(k not in state.dict for k in keys):
+            return
+        values = {k: state.dict[k] for k in keys}
+        try:
+            data = pickle.dumps(values)
+            index = [(name, f, tuple(values[k] for k in f)) for f in self._models[name]]
+            for key in index: hash(key)
+        except (TypeError, pickle.PicklingError):
+            return
+        primary = (name, state.identity)
+        with self._lock:
+            # 注意: 加锁后再次检查, 避免与并发的提交交错后写入旧数据
+            if self._invalidated.get(name, -1) > generation:
+                return
+            self._entries[primary] = (data, index, None if self.ttl is None else monotonic() + self.ttl)
+            self._entries.move_to_end(primary)
+            for key in index: self._index[key] = state.identity
+            while len(self._entries) > self.maxsize:
+                self.evictions += 1
+                self.discard(next(iter(self._entries)))
+
+    def discard(self, primary: t.Tuple) -> None:
+        """ 移除单个实例及其自然键索引, 调用方需持有锁
+
+        @param primary: (表, 主键)
+        @return: None
+        """
+        _, index, _ = self._entries.pop(primary)
+        for key in index: self._index.get(key, None) == primary[1] and self._index.pop(key)
+
+    def invalidate(self, tables: t.Iterable[t.Text]) -> None:
+        """ 清除表的全部缓存
+
+        @param tables: 表名列表
+        @return: None
+        """
+        tables = {n for n in tables if n in self._models}
+        if not tables:
+            return
+        with self._lock:
+            self._generation += 1
+            for name in tables: self._invalidated[name] = self._generation
+            for key in [k for k in self._entries if k[0] in tables]:
+                self._entries.pop(key, None)
+            self._index = {k: v for k, v in self._index.items() if k[0] not in tables}
+            self.invalidations += len(tables)
+
+    def install(self, factory: sessionmaker) -> None:
+        """ 安装会话事件
+
+        @param factory: 会话工厂
+        @return: None
+        """
+        event.listen(factory, 'after_transaction_create', self.on_transaction_create)
+        event.listen(factory, 'after_flush', self.on_after_flush)
+        event.listen(factory, 'do_orm_execute', self.on_do_orm_execute)
+        event.listen(factory, 'after_commit', self.on_after_commit)
+        event.listen(factory, 'after_transaction_end', on_transaction_end)
+
+    def on_transaction_create(self, session: Session, transaction: t.Any) -> None:
+        """ 会话事务开始事件, 记录最外层事务开始时的失效代数
+
+        @param session: 数据会话
+        @param transaction: 开始的事务
+        @return: None
+        """
+        transaction.parent is None and session.info.update({GENERATION: self._generation})
+
+    def on_after_flush(self, session: Session, context: t.Any) -> None:
+        """ 会话刷新事件, 记录写入过的已注册的表
+
+        @param session: 数据会话
+        @param context: 刷新上下文
+        @return: None
+        """
+        tables = set()
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            tables.update(inspect(instance).mapper.tables)
+        tables = [t for t in tables if t.fullname in self._models]
+        tables and mark_changed(session, tables)
+
+    def on_do_orm_execute(self, state: t.Any) -> None:
+        """ 会话执行事件, 记录通过session.execute执行的INSERT/UPDATE/DELETE写入的表
+
+        @param state: 执行状态
+        @return: None
+        """
+        statement = state.statement
+        if not isinstance(statement, UpdateBase):
+            return
+        table = getattr(statement, 'table', None)
+        isinstance(table, TableClause) and table.fullname in self._models and mark_changed(state.session, [table])
+
+    def on_after_commit(self, session: Session) -> None:
+        """ 会话提交事件
+
+        注意: 提交SAVEPOINT时同样会触发, 只有最外层事务提交后写入才对其它会话可见
+
+        @param session: 数据会话
+        @return: None
+        """
+        if session.in_nested_transaction():
+            return
+        tables = load_changed(session)
+        tables and self.invalidate(tables)
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 缓存统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'models': sorted(self._models),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,246 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+from time import perf_counter
+from collections import deque
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util.queue import Empty
+from service_sqlalchemy.exception import ValidationError
+
+from .telemetry import Histogram
+
+logger = getLogger(__name__)
+
+# 调整动作
+GROW, SHRINK, REJECT = 'grow', 'shrink', 'reject'
+
+
+class AdaptivePool(QueuePool):
+    """ 自适应连接池
+
+    1. 常驻连接数在min_size和max_size之间按签出等待和空闲情况伸缩, 总连接数始终不超过max_size
+    2. 使用LIFO复用最近归还的连接, 冷连接沉在队列底部, 收缩时优先关闭
+    3. 连接耗尽时最多max_waiters个请求排队等待timeout秒, 超出排队上限立即拒绝
+
+    注意: 调整在签出时惰性触发, 不启动后台线程
+    注意: 底层QueuePool固定为max_size个槽位且不溢出, 常驻连接数只记录在本类字段中, 归还时超出常驻数的连接直接关闭
+    """
+
+    def __init__(
+            self,
+            creator: t.Callable[..., t.Any],
+            min_size: t.Optional[int] = 4,
+            max_size: t.Optional[int] = 64,
+            max_waiters: t.Optional[int] = 128,
+            grow_wait: t.Optional[float] = 0.01,
+            adjust_interval: t.Optional[float] = 10,
+            timeout: t.Optional[float] = 3,
+            **kwargs: t.Any
+    ) -> None:
+        """ 初始化实例
+
+        @param creator: 连接创建函数
+        @param min_size: 最小常驻连接数
+        @param max_size: 最大总连接数
+        @param max_waiters: 最大排队数
+        @param grow_wait: 签出等待超过该秒数时扩容
+        @param adjust_interval: 调整间隔秒数
+        @param timeout: 排队等待的截止秒数
+        @param kwargs: 其它参数
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            errs = f'invalid adaptive pool bounds, expect 0 <= min_size({min_size}) <= max_size({max_size}) and max_size >= 1'
+            raise ValidationError(errormsg=errs)
+        if max_waiters < 0:
+            errs = f'invalid adaptive pool max_waiters {max_waiters}, expect >= 0'
+            raise ValidationError(errormsg=errs)
+        # 注意: 参数不能声明为仅限关键字, create_engine只会透传按位置声明的参数
+        # 注意: create_engine会传入pool_size/max_overflow, 自适应模式下以min_size/max_size为准
+        kwargs.pop('pool_size', None)
+        kwargs.pop('max_overflow', None)
+        kwargs['use_lifo'] = True
+        super(AdaptivePool, self).__init__(creator, pool_size=max_size, max_overflow=0, timeout=timeout, **kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_waiters = max_waiters
+        self.grow_wait = grow_wait
+        self.adjust_interval = adjust_interval
+        self.waiters = 0
+        # 签出等待耗时以及排队超时(含超出排队上限被拒绝)的次数
+        self.checkout_wait = Histogram()
+        self.timeouts = 0
+        self.slow_waits = 0
+        self.peak_in_use = 0
+        self.grows = 0
+        self.shrinks = 0
+        self.rejects = 0
+        self.decisions = deque(maxlen=100)
+        self._target_size = min_size
+        self._adjust_at = monotonic() + adjust_interval
+        self._adaptive_lock = Lock()
+
+    @property
+    def target_size(self) -> int:
+        """ 当前常驻连接数
+
+        @return: int
+        """
+        return self._target_size
+
+    def _do_get(self) -> t.Any:
+        """ 签出连接
+
+        @return: t.Any
+        """
+        with self._adaptive_lock:
+            # 底层不溢出, 签出数达到max_size即表示连接耗尽
+            exhausted = self.checkedout() >= self.max_size
+            if exhausted and self.waiters >= self.max_waiters:
+                self.rejects += 1
+                self.timeouts += 1
+                self.decide(REJECT, self.target_size, self.target_size, f'{self.waiters} waiters')
+                raise exc.TimeoutError(
+                    f'AdaptivePool limit of size {self.max_size} reached, '
+                    f'{self.waiters} waiters exceed max_waiters {self.max_waiters}'
+                )
+            self.waiters += 1
+        start = perf_counter()
+        try:
+            return super(AdaptivePool, self)._do_get()
+        except exc.TimeoutError:
+            with self._adaptive_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            wait = perf_counter() - start
+            self.checkout_wait.record(wait)
+            with self._adaptive_lock:
+                self.waiters -= 1
+                self.slow_waits += wait >= self.grow_wait
+                self.peak_in_use = max(self.peak_in_use, self.checkedout())
+            self._adjust_at <= monotonic() and self.adjust()
+
+    def adjust(self) -> None:
+        """ 根据上个周期的观测调整常驻连接数
+
+        存在慢签出时翻倍扩容, 整个周期内使用的连接数峰值低于常驻数时收缩到峰值
+
+        @return: None
+        """
+        with self._adaptive_lock:
+            if self._adjust_at > monotonic(): return
+            self._adjust_at = monotonic() + self.adjust_interval
+            slow_waits, peak_in_use = self.slow_waits, self.peak_in_use
+            self.slow_waits, self.peak_in_use = 0, self.checkedout()
+        size = self.target_size
+        if slow_waits and size < self.max_size:
+            target = min(self.max_size, max(size * 2, size + 1))
+            self.resize(target)
+            self.grows += 1
+            self.decide(GROW, size, target, f'{slow_waits} checkouts waited over {self.grow_wait}s')
+        elif peak_in_use < size and size > self.min_size:
+            target = max(self.min_size, peak_in_use)
+            closed = self.resize(target)
+            self.shrinks += 1
+            self.decide(SHRINK, size, target, f'peak in use {peak_in_use}, closed {closed} idle connections')
+
+    def _do_return_conn(self, record: t.Any) -> None:
+        """ 归还连接, 空闲连接数已达常驻数时直接关闭
+
+        @param record: 连接记录
+        @return: None
+        """
+        with self._adaptive_lock:
+            keep = self.checkedin() < self._target_size
+        if keep: return super(AdaptivePool, self)._do_return_conn(record)
+        record.close()
+        self._dec_overflow()
+
+    def resize(self, target: int) -> int:
+        """ 调整常驻连接数, 收缩时关闭队列底部的冷连接
+
+        @param target: 常驻连接数
+        @return: int
+        """
+        records = []
+        with self._adaptive_lock:
+            self._target_size = target
+            if self.checkedin() <= target: return 0
+            # LIFO队列按从热到冷的顺序取出, 保留最热的target个并按原顺序放回
+            try:
+                while True: records.append(self._pool.get(False))
+            except Empty:
+                pass
+            for record in reversed(records[:target]): self._pool.put(record, False)
+            records = records[target:]
+        for record in records:
+            record.close()
+            self._dec_overflow()
+        return len(records)
+
+    def decide(self, action: t.Text, size: int, target: int, reason: t.Text) -> None:
+        """ 记录调整决策
+
+        @param action: 调整动作
+        @param size: 调整前
+        @param target: 调整后
+        @param reason: 调整原因
+        @return: None
+        """
+        decision = {'time': monotonic(), 'action': action, 'from': size, 'to': target, 'reason': reason}
+        self.decisions.append(decision)
+        # 拒绝可能非常频繁, 只在调试时输出
+        log = logger.debug if action == REJECT else logger.info
+        log(f'adaptive pool {action} {size} -> {target}, {reason}')
+
+    def recreate(self) -> AdaptivePool:
+        """ 重建连接池
+
+        @return: AdaptivePool
+        """
+        self.logger.info('Pool recreating')
+        return self.__class__(
+            self._creator,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_waiters=self.max_waiters,
+            grow_wait=self.grow_wait,
+            adjust_interval=self.adjust_interval,
+            timeout=self._timeout,
+            pre_ping=self._pre_ping,
+            recycle=self._recycle,
+            echo=self.echo,
+            logging_name=self._orig_logging_name,
+            reset_on_return=self._reset_on_return,
+            _dispatch=self.dispatch,
+            dialect=self._dialect
+        )
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 连接池统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'target_size': self.target_size,
+            'checked_out': self.checkedout(),
+            'idle': self.checkedin(),
+            'waiters': self.waiters,
+            'timeouts': self.timeouts,
+            'checkout_wait': self.checkout_wait.dict(),
+            'grows': self.grows,
+            'shrinks': self.shrinks,
+            'rejects': self.rejects,
+            'decisions': list(self.decisions)
+        }
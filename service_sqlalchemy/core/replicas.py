@@ -0,0 +1,203 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from threading import Lock
+from threading import local
+from time import monotonic
+from itertools import count
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = getLogger(__name__)
+
+# 会话只读标记
+READONLY = 'readonly'
+# 会话固定使用的从库
+REPLICA = 'replica'
+# 会话中是否存在写入
+WRITTEN = 'written'
+# 负载均衡策略
+ROUND_ROBIN, LEAST_CONNECTIONS = 'round_robin', 'least_connections'
+
+
+class ReplicaSet(object):
+    """ 从库集合 """
+
+    def __init__(
+            self,
+            engines: t.List[Engine],
+            *,
+            balance: t.Optional[t.Text] = ROUND_ROBIN,
+            sticky_seconds: t.Optional[float] = 3,
+            eject_seconds: t.Optional[float] = 30
+    ) -> None:
+        """ 初始化实例
+
+        @param engines: 从库引擎
+        @param balance: 均衡策略, round_robin/least_connections
+        @param sticky_seconds: 提交写入后读主库的窗口
+        @param eject_seconds: 从库异常后的摘除时长
+        """
+        self.engines = engines
+        self.balance = balance
+        self.sticky_seconds = sticky_seconds or 0
+        self.eject_seconds = eject_seconds or 0
+        self.ejected = {}
+        self._lock = Lock()
+        self._local = local()
+        self._counter = count()
+        for engine in engines:
+            event.listen(engine, 'handle_error', self.on_handle_error)
+
+    def on_handle_error(self, context: t.Any) -> None:
+        """ 从库异常事件
+
+        连接失败或断开时摘除该从库, 超过摘除时长后自动恢复
+
+        @param context: 异常上下文
+        @return: None
+        """
+        if context.connection is not None and not context.is_disconnect:
+            return
+        engine = context.engine
+        logger.warning(f'replica {engine.url!r} ejected for {self.eject_seconds}s')
+        with self._lock:
+            self.ejected[engine] = monotonic() + self.eject_seconds
+
+    def healthy(self) -> t.List[Engine]:
+        """ 健康的从库
+
+        @return: t.List[Engine]
+        """
+        now = monotonic()
+        with self._lock:
+            for engine, until in list(self.ejected.items()):
+                if until <= now: self.ejected.pop(engine)
+            return [e for e in self.engines if e not in self.ejected]
+
+    def choose(self) -> t.Optional[Engine]:
+        """ 选择一个从库
+
+        @return: t.Optional[Engine]
+        """
+        engines = self.healthy()
+        if not engines:
+            return None
+        if self.balance == LEAST_CONNECTIONS:
+            return min(engines, key=lambda e: getattr(e.pool, 'checkedout', int)())
+        return engines[next(self._counter) % len(engines)]
+
+    def mark_written(self) -> None:
+        """ 记录当前工作者的提交时间
+
+        @return: None
+        """
+        self._local.written_at = monotonic()
+
+    def is_sticky(self) -> bool:
+        """ 当前工作者是否需要读主库
+
+        @return: bool
+        """
+        written_at = getattr(self._local, 'written_at', None)
+        return written_at is not None and monotonic() - written_at < self.sticky_seconds
+
+    def install(self, factory: sessionmaker) -> None:
+        """ 安装会话事件
+
+        @param factory: 会话工厂
+        @return: None
+        """
+        event.listen(factory, 'after_flush', self.on_after_flush)
+        event.listen(factory, 'after_commit', self.on_after_commit)
+        event.listen(factory, 'after_soft_rollback', self.on_after_rollback)
+        event.listen(factory, 'after_transaction_end', self.on_after_transaction_end)
+
+    def on_after_flush(self, session: Session, context: t.Any) -> None:
+        """ 会话刷新事件
+
+        @param session: 数据会话
+        @param context: 刷新上下文
+        @return: None
+        """
+        session.info[WRITTEN] = True
+
+    def on_after_commit(self, session: Session) -> None:
+        """ 会话提交事件
+
+        @param session: 数据会话
+        @return: None
+        """
+        session.info.pop(WRITTEN, False) and self.mark_written()
+
+    def on_after_rollback(self, session: Session, previous_transaction: t.Any) -> None:
+        """ 会话回滚事件
+
+        @param session: 数据会话
+        @param previous_transaction: 回滚的事务
+        @return: None
+        """
+        previous_transaction.parent is None and session.info.pop(WRITTEN, None)
+
+    def on_after_transaction_end(self, session: Session, transaction: t.Any) -> None:
+        """ 会话事务结束事件
+
+        @param session: 数据会话
+        @param transaction: 结束的事务
+        @return: None
+        """
+        transaction.parent is None and session.info.pop(REPLICA, None)
+
+    def dispose(self) -> None:
+        """ 释放从库连接
+
+        @return: None
+        """
+        for engine in self.engines: engine.dispose()
+
+
+class RoutingSession(Session):
+    """ 读写分离会话
+
+    只读会话和标记为只读的语句路由到从库, 刷新和写语句始终使用主库
+    """
+
+    def __init__(self, *args: t.Any, replicas: t.Optional[ReplicaSet] = None, **kwargs: t.Any) -> None:
+        """ 初始化实例
+
+        @param replicas: 从库集合
+        """
+        self.replicas = replicas
+        super(RoutingSession, self).__init__(*args, **kwargs)
+
+    def get_bind(self, mapper: t.Any = None, clause: t.Any = None, **kwargs: t.Any) -> t.Any:
+        """ 选择绑定的引擎
+
+        @param mapper: 映射对象
+        @param clause: 执行语句
+        @param kwargs: 其它参数
+        @return: t.Any
+        """
+        primary = super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.replicas is None or self._flushing or isinstance(clause, UpdateBase):
+            return primary
+        options = clause.get_execution_options() if hasattr(clause, 'get_execution_options') else {}
+        if not (self.info.get(READONLY, False) or options.get(READONLY, False)):
+            return primary
+        if self.info.get(WRITTEN, False) or self.replicas.is_sticky():
+            return primary
+        # 同一事务内固定使用同一个从库
+        replica = self.info.get(REPLICA, None) or self.replicas.choose()
+        if replica is None:
+            return primary
+        self.info[REPLICA] = replica
+        return replica
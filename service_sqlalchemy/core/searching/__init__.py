@@ -6,25 +6,61 @@ from __future__ import annotations
 
 import typing as t
 
+from time import perf_counter
 from types import ModuleType
+from sqlalchemy import func
 from sqlalchemy.orm import Query
 from sqlalchemy.sql.functions import GenericFunction
 from sqlalchemy.sql.elements import BooleanClauseList
 from service_core.core.decorator import AsLazyProperty
 from sqlalchemy.ext.declarative import declarative_base
+from service_sqlalchemy.exception import ValidationError
 from service_sqlalchemy.core.client import SQLAlchemyClient
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
-from .evaluate import eval_join
-from .evaluate import eval_query
+from service_sqlalchemy.core.slowlog import SEARCH_PAYLOAD
+from service_sqlalchemy.core.slowlog import SEARCH_IN_LISTS
+
+from .plans import PlanCache
+from .plans import SearchPlan
+from .plans import make_plan
+from .paging import NEXT
+from .paging import PREV
+from .paging import PEEK
+from .paging import COUNT
+from .paging import WINDOW
+from .paging import CursorPage
+from .paging import PageResult
+from .paging import count_queryset
+from .paging import support_window
+from .paging import encode_cursor
+from .paging import decode_cursor
+from .paging import make_sort_keys
+from .paging import make_seek_filter
+from .paging import make_sort_orders
 from .schemas import SearchSchema
 from .schemas import FilterSchema
-from .evaluate import make_filter
-from .evaluate import eval_filter
-from .evaluate import eval_order_by
-from .evaluate import eval_group_by
-from .converts import convert_list_filter_to_dict
-from .converts import convert_dict_filter_to_list
+from .validate import validate
+from .validate import SchemaCache
+from .evaluate import make_dict_filter
+from .inlists import split_filter
+from .inlists import InListPlanner
+from .inlists import InListStrategy
+from .results import ResultCache
+from .limits import HAVING
+from .limits import LimitChecker
+from .limits import SearchLimits
+from .explain import PlanSummary
+from .explain import ExplainGuard
+from .explain import explain_queryset
+from .modes import ORM
+from .modes import TUPLE
+from .modes import result_modes
+from .modes import convert_rows
+from .modes import make_columns
+from .compiler import compile_joins
+from .compiler import compile_fields
+from .compiler import compile_filter
 
 BaseModel = declarative_base()
 
@@ -44,7 +80,14 @@ class Search(object):
             having: t.Optional[t.Union[t.Dict, t.List]] = None,
             order_by: t.Optional[t.List[t.Union[t.Text, t.Dict[t.Text, t.Any]]]] = None,
             page: t.Optional[int] = None,
-            page_size: t.Optional[int] = None
+            page_size: t.Optional[int] = None,
+            cursor: t.Optional[t.Text] = None,
+            cache: t.Optional[PlanCache] = None,
+            schema_cache: t.Optional[SchemaCache] = None,
+            in_list_strategy: t.Optional[InListStrategy] = None,
+            explain_guard: t.Optional[ExplainGuard] = None,
+            limits: t.Optional[SearchLimits] = None,
+            trusted: t.Optional[bool] = False
     ) -> None:
         """ 初始化实例
 
@@ -56,9 +99,22 @@ class Search(object):
         @param order_by: 排序字段
         @param page: 分页页码
         @param page_size: 分页大小
+        @param cursor: 分页游标
+        @param cache: 计划缓存
+        @param schema_cache: 校验缓存
+        @param in_list_strategy: 大IN列表策略, 为None时列表始终内联
+        @param explain_guard: 执行计划护栏, 执行前按形状EXPLAIN并检查阈值
+        @param limits: 复杂度限制, 在编译时检查
+        @param trusted: 受信任的参数跳过pydantic校验, 仅用于内部调用
         """
         self._module, self._session = module, session
+        self._in_list_strategy = in_list_strategy
+        self._explain_guard = explain_guard
+        self._limits = limits
+        limits is None or limits.check_page_size(page_size)
         self._page, self._page_size = page, page_size
+        self._cursor = cursor
+        self._schema_cache, self._trusted = schema_cache, trusted
         join = join or []
         if not isinstance(join, list):
             join = [join]
@@ -76,12 +132,41 @@ class Search(object):
             group_by = [group_by]
         if not isinstance(order_by, list):
             order_by = [order_by]
-        schema = SearchSchema(
-            query=query, join=join, order_by=order_by,
-            group_by=group_by, page=page,
-            page_size=page_size
+        self._init_args = {
+            'query': query, 'join': join, 'order_by': order_by,
+            'group_by': group_by, 'page': page, 'page_size': page_size
+        }
+        # 分页参数不参与计划缓存, 非整数时交由校验报错
+        paging = (page, page_size)
+        if any(v is not None and type(v) is not int for v in paging):
+            cache = None
+        if cache is not None and not cache.maxsize:
+            cache = None
+        self._cache = cache
+        # 开启计划缓存时校验推迟到计划未命中时
+        cache is None and self._init_data
+
+    @AsLazyProperty
+    def _init_data(self) -> t.Dict[t.Text, t.Any]:
+        """ 校验数据
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return validate(SearchSchema, self._init_args, trusted=self._trusted, cache=self._schema_cache)
+
+    @AsLazyProperty
+    def plan(self) -> SearchPlan:
+        """ 查询计划
+
+        @return: SearchPlan
+        """
+        args = self._init_args
+        return make_plan(
+            module=self._module,
+            query=args['query'], join=args['join'],
+            filter_by=self._filter_by, group_by=args['group_by'],
+            having=self._having, order_by=args['order_by']
         )
-        self._init_data = schema.dict()
 
     @AsLazyProperty
     def query(self) -> t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]:
@@ -90,7 +175,7 @@ class Search(object):
         @return: t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]
         """
         query = self._init_data['query']
-        return eval_query(module=self._module, fields=query)
+        return compile_fields(self._module, query)
 
     @AsLazyProperty
     def join(self) -> t.List[t.Tuple[InstrumentedAttribute, BooleanClauseList, t.Dict[t.Text, t.Any]]]:
@@ -99,7 +184,36 @@ class Search(object):
         @return: t.List[t.Tuple[InstrumentedAttribute, BooleanClauseList, t.Dict[t.Text, t.Any]]]
         """
         joins = self._init_data['join']
-        return eval_join(module=self._module, joins=joins)
+        return compile_joins(self._module, joins)
+
+    @AsLazyProperty
+    def in_list_planner(self) -> t.Optional[InListPlanner]:
+        """ 大IN列表规划
+
+        @return: t.Optional[InListPlanner]
+        """
+        if self._in_list_strategy is None:
+            return None
+        dialect = self._session.get_bind().dialect.name
+        return InListPlanner(self._in_list_strategy, dialect)
+
+    @AsLazyProperty
+    def limit_checker(self) -> t.Optional[LimitChecker]:
+        """ 复杂度检查
+
+        @return: t.Optional[LimitChecker]
+        """
+        return None if self._limits is None else LimitChecker(self._limits)
+
+    @AsLazyProperty
+    def filter_data(self) -> t.Dict[t.Text, t.Any]:
+        """ 校验后的查询条件
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        # 整理成嵌套字典后校验
+        dict_filters = make_dict_filter(*self._filter_by)
+        return validate(FilterSchema, dict_filters, trusted=self._trusted, cache=self._schema_cache)
 
     @AsLazyProperty
     def filter_by(self) -> BooleanClauseList:
@@ -107,15 +221,7 @@ class Search(object):
 
         @return: BooleanClauseList
         """
-        # 整理成嵌套列表
-        # 1.用于简化配置
-        # 2.用于生成查询
-        list_filters = make_filter(*self._filter_by)
-        dict_filters = convert_list_filter_to_dict(list_filters)
-        # 验证嵌套的数据
-        dict_filters = FilterSchema(**dict_filters).dict()
-        filters = convert_dict_filter_to_list(dict_filters)
-        return eval_filter(module=self._module, filters=filters)
+        return compile_filter(self._module, self.filter_data, self.in_list_planner, self.limit_checker)
 
     @AsLazyProperty
     def group_by(self) -> t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]:
@@ -124,7 +230,7 @@ class Search(object):
         @return: t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]
         """
         group_by = self._init_data['group_by']
-        return eval_group_by(module=self._module, fields=group_by)
+        return compile_fields(self._module, group_by)
 
     @AsLazyProperty
     def having(self) -> t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]:
@@ -132,15 +238,10 @@ class Search(object):
 
         @return: t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]
         """
-        # 整理成嵌套列表
-        # 1.用于简化配置
-        # 2.用于生成查询
-        list_filters = make_filter(*self._having)
-        dict_filters = convert_list_filter_to_dict(list_filters)
-        # 验证嵌套的数据
-        dict_filters = FilterSchema(**dict_filters).dict()
-        havings = convert_dict_filter_to_list(dict_filters)
-        return eval_filter(module=self._module, filters=havings)
+        # 整理成嵌套字典, 校验后直接编译
+        dict_filters = make_dict_filter(*self._having)
+        dict_filters = validate(FilterSchema, dict_filters, trusted=self._trusted, cache=self._schema_cache)
+        return compile_filter(self._module, dict_filters, self.in_list_planner, self.limit_checker, HAVING)
 
     @AsLazyProperty
     def order_by(self) -> t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]:
@@ -149,14 +250,40 @@ class Search(object):
         @return: t.List[t.Union[BaseModel, InstrumentedAttribute, GenericFunction]]
         """
         order_by = self._init_data['order_by']
-        return eval_order_by(module=self._module, fields=order_by)
+        return compile_fields(self._module, order_by)
+
+    @AsLazyProperty
+    def payload(self) -> t.Dict[t.Text, t.Any]:
+        """ 原始查询参数
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return self._init_args | {'filter_by': self._filter_by, 'having': self._having}
 
     @AsLazyProperty
     def queryset(self) -> Query:
         """ 查询对象
 
+        配置执行计划护栏时, 超出阈值的查询会被拒绝或去掉排序(分页查询不会去掉排序)
+
+        @return: Query
+        """
+        if self._explain_guard is None:
+            return self.compiled_queryset
+        key = (self._module.__name__, self.plan.key)
+        paginated = self._page is not None or self._page_size is not None or self._cursor is not None
+        return self._explain_guard.check(self._session, key, self.compiled_queryset, paginated)
+
+    @AsLazyProperty
+    def compiled_queryset(self) -> Query:
+        """ 编译后的查询对象
+
+        执行选项中携带原始查询参数, 供慢查询日志输出
+
         @return: Query
         """
+        if self._cache is not None:
+            return self.cached_queryset.execution_options(**{SEARCH_PAYLOAD: self.payload})
         queryset = self._session.query(*self.query)
         for model, must, param in self.join:
             queryset = queryset.join(model, must, **param)
@@ -167,7 +294,50 @@ class Search(object):
             queryset = queryset.having(self.having)
         if self.order_by:
             queryset = queryset.order_by(*self.order_by)
-        return queryset
+        if self.limit_checker is not None:
+            models = [d['entity'] for d in queryset.column_descriptions] + [m for m, _, _ in self.join]
+            self.limit_checker.finish(models, len(self._init_data['join']))
+        options = {SEARCH_PAYLOAD: self.payload}
+        # 大IN列表的策略供慢查询日志输出, 临时表在执行前加载
+        planner = self.in_list_planner
+        planner is not None and options.update(planner.execution_options())
+        planner is not None and planner.tables and self._in_list_strategy.install_session(self._session)
+        return queryset.execution_options(**options)
+
+    def explain(self) -> t.Optional[PlanSummary]:
+        """ 执行EXPLAIN并返回规范化的执行计划摘要
+
+        只估算执行计划而不执行查询, 不经过护栏也不使用缓存, 不支持的方言返回None
+
+        @return: t.Optional[PlanSummary]
+        """
+        return explain_queryset(self._session, self.compiled_queryset)
+
+    @AsLazyProperty
+    def cached_queryset(self) -> Query:
+        """ 缓存查询对象
+
+        相同形状的查询只编译一次, 之后仅绑定新的参数
+
+        @return: Query
+        """
+        plan = self.plan
+        queryset = self._cache.get(plan.key)
+        if queryset is None:
+            start = perf_counter()
+            # 注意: 模版中的Slot序列化后与普通字符串相同, 不能使用校验缓存
+            search = Search(
+                self._session, module=self._module, trusted=self._trusted,
+                in_list_strategy=self._in_list_strategy, limits=self._limits, **plan.payload
+            )
+            queryset = search.queryset
+            # 大IN列表的值是计划键的一部分, 缓存只会占用内存而几乎不会命中
+            planner = search.in_list_planner
+            if planner is not None and planner.decisions:
+                return queryset
+            self._cache.set(plan.key, queryset.with_session(None), perf_counter() - start)
+            return queryset
+        return queryset.with_session(self._session).params(**plan.values)
 
     @AsLazyProperty
     def pagination(self) -> Query:
@@ -181,3 +351,261 @@ class Search(object):
             page, page_size = self._page or 1, self._page_size or 15
             start, stop = (page - 1) * page_size, page * page_size
         return self.queryset.slice(start, stop)
+
+    @AsLazyProperty
+    def cursor_pagination(self) -> CursorPage:
+        """ 游标分页
+
+        基于最后一行的排序键定位下一页, 避免大偏移量的LIMIT/OFFSET
+
+        @return: CursorPage
+        """
+        if self._init_args['group_by']:
+            errs = 'cursor pagination not support group_by'
+            raise ValidationError(errormsg=errs)
+        page_size = self._page_size or 15
+        keys = make_sort_keys(self.queryset, self.order_by)
+        if self._cursor:
+            values, direction = decode_cursor(self._cursor, len(keys))
+        else:
+            values, direction = None, NEXT
+        queryset = self.queryset
+        width = len(queryset.column_descriptions)
+        labels = [k.label(f'cursor_{i}') for i, (k, _) in enumerate(keys)]
+        queryset = queryset.add_columns(*labels)
+        if values is not None:
+            queryset = queryset.filter(make_seek_filter(keys, values, direction))
+        # 向前翻页时反转排序后再反转结果
+        reverse = direction == PREV
+        queryset = queryset.order_by(None).order_by(*make_sort_orders(keys, reverse))
+        rows = queryset.limit(page_size + 1).all()
+        more, rows = len(rows) > page_size, rows[:page_size]
+        reverse and rows.reverse()
+        items = [row[0] if width == 1 else row[:width] for row in rows]
+        head = rows[0][width:] if rows else None
+        tail = rows[-1][width:] if rows else None
+        has_next = more if direction == NEXT else values is not None
+        has_prev = more if direction == PREV else values is not None
+        return CursorPage(
+            items=items, page_size=page_size,
+            next_cursor=encode_cursor(tail, NEXT) if has_next and rows else None,
+            prev_cursor=encode_cursor(head, PREV) if has_prev and rows else None
+        )
+
+    @AsLazyProperty
+    def single_entity(self) -> bool:
+        """ 是否只查询单个模型
+
+        与Query保持一致, 单个模型时结果直接为模型实例
+
+        @return: bool
+        """
+        descriptions = self.queryset.column_descriptions
+        return len(descriptions) == 1 and descriptions[0]['expr'] is descriptions[0]['entity']
+
+    @AsLazyProperty
+    def chunkable(self) -> bool:
+        """ 能否按大IN列表拆分为多次查询后合并结果
+
+        无分页/排序/分组且只查询模型或字段时, 各次查询的结果互不相交, 直接拼接即可
+
+        @return: bool
+        """
+        args = self._init_args
+        if self._page is not None or self._page_size is not None or self._having:
+            return False
+        if args['order_by'] or args['group_by']:
+            return False
+        return all(isinstance(q, str) for q in args['query'])
+
+    @AsLazyProperty
+    def chunks(self) -> t.Optional[t.Tuple[t.Dict[t.Text, t.Any], t.List[Search]]]:
+        """ 按顶层的大IN列表拆分的查询
+
+        @return: t.Optional[t.Tuple[t.Dict[t.Text, t.Any], t.List[Search]]]
+        """
+        if self._in_list_strategy is None or not self.chunkable:
+            return None
+        dialect = self._session.get_bind().dialect.name
+        result = split_filter(self.filter_data, self._in_list_strategy, dialect)
+        if result is None:
+            return None
+        decision, chunks = result
+        self._limits is None or self._limits.check_in_size(decision['field'], decision['size'])
+        data = self._init_data
+        # 注意: 拆分后的参数已校验, 每份的值不同, 不使用计划缓存
+        return decision, [
+            Search(
+                self._session, module=self._module, query=data['query'], join=data['join'],
+                filter_by=filters, in_list_strategy=self._in_list_strategy, limits=self._limits, trusted=True
+            )
+            for filters in chunks
+        ]
+
+    def iter_batches(self, batch_size: t.Optional[int] = 1000) -> t.Iterator[t.List[t.Any]]:
+        """ 分批流式遍历
+
+        通过stream_results使用服务端游标(如pymysql的SSCursor)并配合yield_per分批加载,
+        内存占用只与batch_size相关, 生成器关闭时会立即释放游标;
+        顶层的大IN列表可按策略拆分为多次查询, 依次流式返回
+
+        注意: 遍历期间请勿在同一会话上执行其它查询
+
+        @param batch_size: 批次大小
+        @return: t.Iterator[t.List[t.Any]]
+        """
+        chunks = self.chunks
+        if chunks is None:
+            yield from self.stream(self.pagination, batch_size)
+            return
+        decision, searches = chunks
+        for search in searches:
+            queryset = search.pagination.execution_options(**{SEARCH_IN_LISTS: [decision]})
+            yield from search.stream(queryset, batch_size)
+
+    def stream(self, queryset: Query, batch_size: t.Optional[int] = 1000) -> t.Iterator[t.List[t.Any]]:
+        """ 通过服务端游标分批遍历查询对象
+
+        @param queryset: 查询对象
+        @param batch_size: 批次大小
+        @return: t.Iterator[t.List[t.Any]]
+        """
+        options = {'yield_per': batch_size, 'stream_results': True, 'max_row_buffer': batch_size}
+        result = self._session.execute(queryset.statement, execution_options=options)
+        result = result.scalars() if self.single_entity else result
+        try:
+            for batch in result.partitions(batch_size):
+                yield batch
+        finally:
+            result.close()
+
+    def cached_result(
+            self,
+            cache: ResultCache,
+            ttl: t.Optional[float] = None,
+            queryset: t.Optional[Query] = None
+    ) -> t.List[t.Any]:
+        """ 带结果缓存的查询结果
+
+        以规范化后的查询参数为键, 会话提交写入相关的表后自动失效
+
+        @param cache: 结果缓存
+        @param ttl: 过期秒数, 默认使用缓存的设置
+        @param queryset: 附加了执行选项的查询对象, 默认为分页对象
+        @return: t.List[t.Any]
+        """
+        key = cache.make_key(self._module, self.payload)
+        return cache.fetch(key, self.pagination if queryset is None else queryset, ttl)
+
+    @AsLazyProperty
+    def columns(self) -> t.Tuple[t.List[t.Text], t.List[t.Any]]:
+        """ 展开模型后的字段名称和字段
+
+        @return: t.Tuple[t.List[t.Text], t.List[t.Any]]
+        """
+        return make_columns(self.queryset)
+
+    def result(
+            self,
+            mode: t.Optional[t.Text] = TUPLE,
+            queryset: t.Optional[Query] = None,
+            cache: t.Optional[ResultCache] = None,
+            ttl: t.Optional[float] = None
+    ) -> t.Any:
+        """ 按结果模式返回查询结果
+
+        tuple/dict/columnar模式将模型展开为各列后直接在会话的连接上执行, 不构造实例也不进入标识映射,
+        columnar返回字段名称到列数组的映射, 安装NumPy时为ndarray
+
+        @param mode: orm/tuple/dict/columnar
+        @param queryset: 附加了执行选项的查询对象, 默认为分页对象
+        @param cache: 结果缓存
+        @param ttl: 过期秒数, 默认使用缓存的设置
+        @return: t.Any
+        """
+        if mode not in result_modes:
+            errs = f'invalid result mode {mode}'
+            raise ValidationError(errormsg=errs)
+        queryset = self.pagination if queryset is None else queryset
+        if mode == ORM:
+            return queryset.all() if cache is None else self.cached_result(cache, ttl, queryset)
+        names, columns = self.columns
+        if cache is not None:
+            key = cache.make_key(self._module, self.payload | {'mode': 'rows'})
+            rows = cache.fetch(key, queryset.with_entities(*columns), ttl)
+            return convert_rows(rows, names, mode)
+        return convert_rows(self.execute_rows(queryset).all(), names, mode)
+
+    def execute_rows(self, queryset: Query, **options: t.Any) -> t.Any:
+        """ 展开模型后在会话的连接上执行
+
+        @param queryset: 查询对象
+        @param options: 执行选项
+        @return: t.Any
+        """
+        statement = queryset.with_entities(*self.columns[1]).statement
+        statement = statement.execution_options(**options) if options else statement
+        # 注意: 与Query保持一致, 执行前刷新会话中未提交的修改
+        self._session.autoflush and self._session.flush()
+        connection = self._session.connection(bind_arguments={'clause': statement})
+        return connection.execute(statement)
+
+    def iter_rows(self, batch_size: t.Optional[int] = 1000) -> t.Iterator[t.List[t.Any]]:
+        """ 分批流式遍历数据行
+
+        与iter_batches相同, 但模型展开为各列且不构造实例, 字段名称见columns
+
+        @param batch_size: 批次大小
+        @return: t.Iterator[t.List[t.Any]]
+        """
+        chunks = self.chunks
+        querysets = [(self, self.pagination)] if chunks is None else [
+            (search, search.pagination.execution_options(**{SEARCH_IN_LISTS: [chunks[0]]}))
+            for search in chunks[1]
+        ]
+        for search, queryset in querysets:
+            result = search.execute_rows(queryset, stream_results=True, max_row_buffer=batch_size)
+            try:
+                for batch in result.partitions(batch_size):
+                    yield batch
+            finally:
+                result.close()
+
+    def page_result(self, *, strategy: t.Optional[t.Text] = COUNT) -> PageResult:
+        """ 页码分页结果
+
+        peek: 多取一行判断是否有下一页, 不统计总数
+        count: 额外执行去掉排序和预加载的统计查询
+        window: 通过COUNT(*) OVER()随数据一并返回总数, 不支持时退化为count
+
+        @param strategy: 统计策略
+        @return: PageResult
+        """
+        if strategy not in (PEEK, COUNT, WINDOW):
+            errs = f'invalid page strategy {strategy}'
+            raise ValidationError(errormsg=errs)
+        page, page_size = self._page or 1, self._page_size or 15
+        start, stop = (page - 1) * page_size, page * page_size
+        queryset, total = self.queryset, None
+        if strategy == WINDOW and not support_window(self._session.get_bind().dialect):
+            strategy = COUNT
+        if strategy == PEEK:
+            items = queryset.slice(start, stop + 1).all()
+            has_next, items = len(items) > page_size, items[:page_size]
+            return PageResult(items=items, page=page, page_size=page_size, has_next=has_next)
+        if strategy == WINDOW:
+            width = len(queryset.column_descriptions)
+            total_column = func.count().over().label('total')
+            rows = queryset.add_columns(total_column).slice(start, stop).all()
+            items = [row[0] if width == 1 else row[:width] for row in rows]
+            # 超出末页时没有数据行携带总数
+            total = rows[0][-1] if rows else None
+        else:
+            items = queryset.slice(start, stop).all()
+        # 未满一页时可直接推算总数
+        if total is None and (items or page == 1) and len(items) < page_size:
+            total = start + len(items)
+        if total is None:
+            total = count_queryset(queryset)
+        has_next = stop < total
+        return PageResult(items=items, page=page, page_size=page_size, has_next=has_next, total=total)
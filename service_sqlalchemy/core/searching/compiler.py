@@ -0,0 +1,241 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from types import ModuleType
+from sqlalchemy.sql import and_, or_
+from service_sqlalchemy.exception import ValidationError
+
+from .nodes import Node
+from .nodes import empty_node
+from .nodes import empty_param
+from .nodes import OperatorNode
+from .nodes import FunctionNode
+from .nodes import ConditionNode
+from .schemas import FieldTypeEnum
+from .inlists import InListPlanner
+from .limits import FILTER_BY
+from .limits import LimitChecker
+from .optimizer import optimize
+from .registry import resolve_field
+from .operators import OperatorMeta
+from .functions import FunctionMeta
+from .functions import DefaultFunction
+
+condition_type = {'and': and_, 'or': or_}
+order_maps = {'-': 'desc', '+': 'asc'}
+
+field_type = FieldTypeEnum.field.value
+plain_type = FieldTypeEnum.plain.value
+
+
+def load_field(module: ModuleType, name: t.Text) -> t.Any:
+    """ 加载模型或字段, 支持-/+前缀表示排序
+
+    @param module: 模块对象
+    @param name: 字段名称
+    @return: t.Any
+    """
+    order_name = None
+    if '.' in name and name[0] in order_maps:
+        order_name, name = order_maps[name[0]], name[1:]
+    field = resolve_field(module, name).attribute
+    return field if order_name is None else getattr(field, order_name)()
+
+
+def parse_node(
+        module: ModuleType,
+        node: t.Dict[t.Text, t.Any],
+        checker: t.Optional[LimitChecker] = None,
+        scope: t.Optional[t.Text] = FILTER_BY,
+        conjunctive: t.Optional[bool] = False
+) -> t.Optional[Node]:
+    """ 解析操作或函数
+
+    名称解析和处理函数查表在此一次完成, 未知的操作或名称在构造SQL前即报错
+
+    @param module: 模块对象
+    @param node: 校验后的节点
+    @param checker: 复杂度检查
+    @param scope: 检查范围, filter_by/having
+    @param conjunctive: 是否位于过滤条件的顶层AND中
+    @return: t.Optional[Node]
+    """
+    if 'op' in node:
+        return parse_operator(module, node, checker, scope, conjunctive)
+    if 'fn' in node:
+        return parse_function(module, node, checker, scope)
+    return None
+
+
+def parse_operator(
+        module: ModuleType,
+        node: t.Dict[t.Text, t.Any],
+        checker: t.Optional[LimitChecker] = None,
+        scope: t.Optional[t.Text] = FILTER_BY,
+        conjunctive: t.Optional[bool] = False
+) -> OperatorNode:
+    """ 解析操作
+
+    @param module: 模块对象
+    @param node: 校验后的节点
+    @param checker: 复杂度检查
+    @param scope: 检查范围, filter_by/having
+    @param conjunctive: 是否位于过滤条件的顶层AND中
+    @return: OperatorNode
+    """
+    op, name, value, path = node['op'], node['field'], node['value'], None
+    handler = OperatorMeta.handlers.get(op, None)
+    if handler is None:
+        errs = f'invalid operator {op}'
+        raise ValidationError(errormsg=errs)
+    if isinstance(name, dict):
+        field = parse_node(module, name, checker, scope)
+    elif node['type'] == plain_type:
+        field = name
+    else:
+        path = resolve_field(module, name)
+        field = path.attribute
+    checker is None or checker.visit_operator(scope, op, name, value, path, conjunctive)
+    if isinstance(value, dict):
+        value = parse_node(module, value, checker, scope)
+    elif isinstance(value, list) and value:
+        # 注意: 与原实现保持一致, 空的子节点被忽略, 标量(如IN列表)原样保留
+        value = [
+            parse_node(module, v, checker, scope) if isinstance(v, dict) else v
+            for v in value if not isinstance(v, dict) or 'op' in v or 'fn' in v
+        ]
+    return OperatorNode(handler, field, value, node['param'] or empty_param, name, path)
+
+
+def parse_function(
+        module: ModuleType,
+        node: t.Dict[t.Text, t.Any],
+        checker: t.Optional[LimitChecker] = None,
+        scope: t.Optional[t.Text] = FILTER_BY
+) -> FunctionNode:
+    """ 解析函数
+
+    @param module: 模块对象
+    @param node: 校验后的节点
+    @param checker: 复杂度检查
+    @param scope: 检查范围, filter_by/having
+    @return: FunctionNode
+    """
+    fn, name = node['fn'], node['field']
+    handler = FunctionMeta.handlers.get(fn, DefaultFunction.handle)
+    if isinstance(name, list) and name:
+        field = [parse_node(module, f, checker, scope) for f in name]
+    elif isinstance(name, dict):
+        field = parse_node(module, name, checker, scope)
+    elif isinstance(name, str) and node['type'] != plain_type:
+        field = resolve_field(module, name).attribute
+    else:
+        field = name
+    return FunctionNode(handler, field, node['param'] or empty_param, fn)
+
+
+def parse_filter(
+        module: ModuleType,
+        filters: t.Any,
+        checker: t.Optional[LimitChecker] = None,
+        scope: t.Optional[t.Text] = FILTER_BY
+) -> t.Optional[Node]:
+    """ 解析过滤条件
+
+    直接消费FilterSchema校验后的嵌套字典, 无需再转换为嵌套列表, 迭代遍历不受递归深度限制;
+    传入checker时在同一次遍历中检查节点数量/嵌套层数/操作/IN列表大小
+
+    @param module: 模块对象
+    @param filters: 校验后的过滤条件
+    @param checker: 复杂度检查
+    @param scope: 检查范围, filter_by/having
+    @return: t.Optional[Node]
+    """
+    root = [None]
+    stack = [(root, 0, filters, 0, True)]
+    while stack:
+        parent, index, node, depth, conjunctive = stack.pop()
+        if node is None:
+            continue
+        if not node:
+            parent[index] = empty_node
+            continue
+        if isinstance(node, list):
+            if checker is not None:
+                for f in node: f and checker.visit(scope, depth + 1)
+            nodes = [parse_node(module, f, checker, scope, conjunctive) for f in node if f]
+            parent[index] = ConditionNode(and_, [n for n in nodes if n is not None])
+            continue
+        if 'a' in node and 'o' in node and 'b' in node:
+            parent[index] = ConditionNode(condition_type[node['o']], [None, None])
+            conjunctive = conjunctive and node['o'] == 'and'
+            stack.append((parent[index].nodes, 0, node['a'], depth + 1, conjunctive))
+            stack.append((parent[index].nodes, 1, node['b'], depth + 1, conjunctive))
+            continue
+        checker is None or checker.visit(scope, depth)
+        parent[index] = parse_node(module, node, checker, scope, conjunctive)
+    return root[0]
+
+
+def compile_filter(
+        module: ModuleType,
+        filters: t.Dict[t.Text, t.Any],
+        planner: t.Optional[InListPlanner] = None,
+        checker: t.Optional[LimitChecker] = None,
+        scope: t.Optional[t.Text] = FILTER_BY
+) -> t.Any:
+    """ 编译过滤条件
+
+    解析后经过优化再生成SQL表达式
+
+    @param module: 模块对象
+    @param filters: 校验后的过滤条件
+    @param planner: 大IN列表规划, 为None时列表始终内联
+    @param checker: 复杂度检查
+    @param scope: 检查范围, filter_by/having
+    @return: t.Any
+    """
+    node = optimize(parse_filter(module, filters, checker, scope))
+    node = node if planner is None else planner.rewrite(node)
+    if node is None:
+        return empty_node.compile()
+    # 注意: 语法树只在此使用一次
+    return node.compile(release=True) if isinstance(node, ConditionNode) else node.compile()
+
+
+def compile_fields(module: ModuleType, fields: t.List[t.Union[t.Text, t.Dict[t.Text, t.Any]]]) -> t.List[t.Any]:
+    """ 编译字段列表
+
+    @param module: 模块对象
+    @param fields: 校验后的字段列表
+    @return: t.List[t.Any]
+    """
+    result = []
+    for field in fields:
+        if isinstance(field, str):
+            result.append(load_field(module, field))
+            continue
+        node = parse_node(module, field) if isinstance(field, dict) else None
+        node is not None and result.append(node.compile())
+    return result
+
+
+def compile_joins(module: ModuleType, joins: t.List[t.Dict[t.Text, t.Any]]) -> t.List[t.Tuple[t.Any, t.Any, t.Any]]:
+    """ 编译联表列表
+
+    @param module: 模块对象
+    @param joins: 校验后的联表列表
+    @return: t.List[t.Tuple[t.Any, t.Any, t.Any]]
+    """
+    result = []
+    for join in joins:
+        model = load_field(module, join['model'])
+        must = join.get('must', {}) or {}
+        node = parse_node(module, must) if must else None
+        node is not None and result.append((model, node.compile(), join.get('param', {}) or {}))
+    return result
@@ -14,16 +14,13 @@ from sqlalchemy.ext.declarative import declarative_base
 from service_sqlalchemy.exception import ValidationError
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
-from .schemas import FieldTypeEnum
-from .expresss import OperatorExpression
-from .expresss import FunctionExpression
+from .compiler import load_field
+from .compiler import parse_operator
+from .compiler import parse_function
 
 BaseModel = declarative_base()
 condition_type = {'and': and_, 'or': or_}
 
-field_type = FieldTypeEnum.field.value
-plain_type = FieldTypeEnum.plain.value
-
 
 def load_orm_class(
         *,
@@ -32,28 +29,13 @@ def load_orm_class(
 ) -> t.Union[BaseModel, InstrumentedAttribute]:
     """ 加载ORM特定类
 
+    名称通过模块的注册表解析, 未知的模型或字段在构造SQL前即报错
+
     @param module: 模块对象
     @param field: 字段名称
     @return: InstrumentedAttribute
     """
-    if field.count('.') == 0:
-        return getattr(module, field)
-    if field.count('.') != 1:
-        errs = f'{field} must be [Model].[Field]'
-        raise ValidationError(errormsg=errs)
-    model_name, field_name = field.rsplit('.', 1)
-    order_maps = {'-': 'desc', '+': 'asc'}
-    order_keys = tuple(order_maps.keys())
-    if not model_name.startswith(order_keys):
-        order_name = None
-    else:
-        order_type = model_name[0]
-        model_name = model_name[1:]
-        order_name = order_maps.get(order_type, None)
-    model = getattr(module, model_name)
-    field = getattr(model, field_name)
-    if order_name is None: return field
-    return getattr(field, order_name)()
+    return load_field(module, field)
 
 
 def eval_operator(
@@ -75,57 +57,8 @@ def eval_operator(
     @param param: 操作选项
     @return: BooleanClauseList
     """
-    param, model, field_name = param or {}, BaseModel, None
-    if isinstance(field, dict) and 'op' in field:
-        field_name = eval_operator(
-            module=module, field=field['field'],
-            op=field['op'], value=field['value'],
-            type=field['type'], param=field['param']
-        )
-    if isinstance(field, dict) and 'fn' in field:
-        field_name = eval_function(
-            module=module,
-            field=field['field'], fn=field['fn'],
-            type=field['type'], param=field['param']
-        )
-    if isinstance(value, list) and value:
-        value_list = []
-        for item in value:
-            if item and 'op' in item:
-                value_list.append(eval_operator(
-                    module=module, field=item['field'],
-                    op=item['op'], value=item['value'],
-                    type=item['type'], param=item['param']
-                ))
-            if item and 'fn' in item:
-                value_list.append(eval_function(
-                    module=module,
-                    field=item['field'], fn=item['fn'],
-                    type=item['type'], param=item['param']
-                ))
-        value = value_list
-    if isinstance(value, dict) and 'op' in value:
-        value = eval_operator(
-            module=module, field=value['field'],
-            op=value['op'], value=value['value'],
-            type=value['type'], param=value['param']
-        )
-    if isinstance(value, dict) and 'fn' in value:
-        value = eval_function(
-            module=module,
-            field=value['field'], fn=value['fn'],
-            type=value['type'], param=value['param']
-        )
-    if isinstance(field, str) and type == field_type:
-        model_name, field_name = field.rsplit('.', 1)
-        model = getattr(module, model_name)
-    if isinstance(field, str) and type == plain_type:
-        field_name = field
-    operator_expression = OperatorExpression(
-        model=model, field=field_name, type=type,
-        op=op, param=param, value=value
-    )
-    return operator_expression.expr()
+    node = {'field': field, 'type': type, 'op': op, 'value': value, 'param': param}
+    return parse_operator(module, node).compile()
 
 
 def eval_join(
@@ -185,6 +118,44 @@ def make_filter(
     if check_a and check_b: return [a, o, b]
 
 
+def make_dict_filter(
+        a: t.Optional[t.Union[t.Dict[t.Text, t.Any], t.List[t.Dict]]] = None,
+        o: t.Optional[t.Text] = None,
+        b: t.Optional[t.Union[t.Dict[t.Text, t.Any], t.List[t.Dict]]] = None,
+) -> t.Dict[t.Text, t.Any]:
+    """ 整理过滤条件
+
+    与convert_list_filter_to_dict(make_filter(...))结果一致, 一次遍历直接生成FilterSchema的嵌套字典,
+    迭代遍历不受递归深度限制
+
+    @param a: 条件a
+    @param o: and/or
+    @param b: 条件b
+    @return: t.Dict[t.Text, t.Any]
+    """
+    root = [None]
+    stack = [(root, 0, [a, o, b], False)]
+    while stack:
+        parent, index, frame, visited = stack.pop()
+        if not visited:
+            stack.append((parent, index, frame, True))
+            # 嵌套列表按位置展开为[a, o, b], 结果回填到frame中
+            for position in (2, 0):
+                item = frame[position]
+                if not isinstance(item, list) or not item: continue
+                if len(item) > 3:
+                    errs = f'{item!r} must be [a, o, b]'
+                    raise ValidationError(errormsg=errs)
+                stack.append((frame, position, (item + [None, None, None])[:3], False))
+            continue
+        a, o, b = frame
+        a, o, b = a or [], o or 'and', b or []
+        check_a = isinstance(a, (dict, list)) or not a
+        check_b = isinstance(b, (dict, list)) or not b
+        parent[index] = {'a': a, 'o': o, 'b': b} if check_a and check_b else {}
+    return root[0]
+
+
 def eval_filter(
         *,
         module: ModuleType,
@@ -246,29 +217,8 @@ def eval_function(
     @param param: 函数选项
     @return: GenericFunction
     """
-    param, model, field_name = param or {}, None, None
-    if isinstance(field, list) and field:
-        field_name = [eval_function(
-            module=module,
-            field=f['field'], fn=f['fn'],
-            type=f['type'], param=f['param']
-        ) for f in field]
-    if isinstance(field, dict) and 'fn' in field:
-        field_name = eval_function(
-            module=module,
-            field=field['field'], fn=field['fn'],
-            type=field['type'], param=field['param']
-        )
-    if isinstance(field, str) and type == field_type:
-        model_name, field_name = field.rsplit('.', 1)
-        model = getattr(module, model_name)
-    if isinstance(field, str) and type == plain_type:
-        field_name = field
-    function_expression = FunctionExpression(
-        fn=fn, model=model, type=type,
-        field=field_name, param=param
-    )
-    return function_expression.eval()
+    node = {'field': field, 'type': type, 'fn': fn, 'param': param}
+    return parse_function(module, node).compile()
 
 
 def eval_fields(
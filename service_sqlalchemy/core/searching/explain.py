@@ -0,0 +1,367 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+
+from threading import Lock
+from logging import getLogger
+from collections import OrderedDict
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
+from sqlalchemy.ext.compiler import compiles
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.client import SQLAlchemyClient
+
+from .inlists import IN_LIST_TABLES
+
+logger = getLogger(__name__)
+
+# 超出阈值时的处理方式
+REJECT, DOWNGRADE, WARN = 'reject', 'downgrade', 'warn'
+# 违反的规则
+FULL_SCAN, FILESORT, TEMPORARY, ROWS = 'full_scan', 'filesort', 'temporary', 'rows'
+
+
+class PlanSummary(object):
+    """ 规范化的执行计划摘要 """
+
+    def __init__(
+            self,
+            dialect: t.Text,
+            *,
+            full_scans: t.Optional[t.List[t.Text]] = None,
+            filesort: t.Optional[bool] = False,
+            temporary: t.Optional[bool] = False,
+            rows: t.Optional[int] = None,
+            details: t.Optional[t.List[t.Any]] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param dialect: 方言名称
+        @param full_scans: 全表扫描的表
+        @param filesort: 是否需要额外排序
+        @param temporary: 是否使用临时表
+        @param rows: 单个步骤的最大估算行数, SQLite不提供估算时为None
+        @param details: 原始执行计划
+        """
+        self.dialect = dialect
+        self.full_scans = full_scans or []
+        self.filesort = filesort
+        self.temporary = temporary
+        self.rows = rows
+        self.details = details or []
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'dialect': self.dialect,
+            'full_scans': self.full_scans,
+            'filesort': self.filesort,
+            'temporary': self.temporary,
+            'rows': self.rows,
+            'details': self.details
+        }
+
+
+class Explain(Executable, ClauseElement):
+    """ EXPLAIN语句, 绑定参数与原语句一致 """
+
+    inherit_cache = False
+
+    def __init__(self, statement: t.Any, prefix: t.Text) -> None:
+        """ 初始化实例
+
+        @param statement: 查询语句
+        @param prefix: 方言的EXPLAIN前缀
+        """
+        self.statement = statement
+        self.prefix = prefix
+        # 注意: 大IN列表的临时表需要在同一连接上先行加载
+        tables = statement.get_execution_options().get(IN_LIST_TABLES, None)
+        self._execution_options = self._execution_options.union({IN_LIST_TABLES: tables} if tables else {})
+
+
+@compiles(Explain)
+def visit_explain(element: Explain, compiler: t.Any, **kwargs: t.Any) -> t.Text:
+    """ 编译EXPLAIN语句
+
+    @param element: EXPLAIN语句
+    @param compiler: 编译器
+    @param kwargs: 编译参数
+    @return: t.Text
+    """
+    return f'{element.prefix} {compiler.process(element.statement, **kwargs)}'
+
+
+def iter_nodes(data: t.Any) -> t.Iterator[t.Dict[t.Text, t.Any]]:
+    """ 遍历JSON执行计划中的所有对象
+
+    @param data: JSON执行计划
+    @return: t.Iterator[t.Dict[t.Text, t.Any]]
+    """
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            yield node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+
+def load_json(value: t.Any) -> t.Any:
+    """ 加载JSON格式的执行计划, 部分驱动已解析为对象
+
+    @param value: 执行计划
+    @return: t.Any
+    """
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def parse_sqlite(rows: t.List[t.Any]) -> PlanSummary:
+    """ 解析SQLite的EXPLAIN QUERY PLAN
+
+    每行的detail形如 SCAN user / SEARCH user USING INDEX ... / USE TEMP B-TREE FOR ORDER BY
+
+    @param rows: 执行计划
+    @return: PlanSummary
+    """
+    summary = PlanSummary('sqlite', details=[row[-1] for row in rows])
+    for detail in summary.details:
+        words = detail.split()
+        # 注意: 旧版本为SCAN TABLE user, 子查询/常量行不是真实的表
+        if words[0] == 'SCAN' and 'INDEX' not in words:
+            name = words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1]
+            name.startswith('(') or name == 'CONSTANT' or summary.full_scans.append(name)
+        if detail.startswith('USE TEMP B-TREE'):
+            if 'ORDER BY' in detail:
+                summary.filesort = True
+            else:
+                summary.temporary = True
+    return summary
+
+
+def parse_mysql(rows: t.List[t.Any]) -> PlanSummary:
+    """ 解析MySQL的EXPLAIN FORMAT=JSON
+
+    @param rows: 执行计划
+    @return: PlanSummary
+    """
+    data = load_json(rows[0][0])
+    summary = PlanSummary('mysql', details=[data])
+    for node in iter_nodes(data):
+        if node.get('access_type', None) == 'ALL':
+            summary.full_scans.append(node.get('table_name', ''))
+        if 'rows_examined_per_scan' in node:
+            summary.rows = max(summary.rows or 0, int(node['rows_examined_per_scan']))
+        summary.filesort = summary.filesort or bool(node.get('using_filesort', False))
+        summary.temporary = summary.temporary or bool(node.get('using_temporary_table', False))
+    return summary
+
+
+def parse_postgresql(rows: t.List[t.Any]) -> PlanSummary:
+    """ 解析PostgreSQL的EXPLAIN (FORMAT JSON)
+
+    @param rows: 执行计划
+    @return: PlanSummary
+    """
+    data = load_json(rows[0][0])
+    summary = PlanSummary('postgresql', details=data)
+    for node in iter_nodes(data):
+        node_type = node.get('Node Type', None)
+        if node_type is None:
+            continue
+        if node_type == 'Seq Scan':
+            summary.full_scans.append(node.get('Relation Name', ''))
+        if node_type in ('Sort', 'Incremental Sort'):
+            summary.filesort = True
+        if node_type == 'Materialize' or node.get('Strategy', None) == 'Hashed':
+            summary.temporary = True
+        summary.rows = max(summary.rows or 0, int(node.get('Plan Rows', 0)))
+    return summary
+
+
+# 方言 => (EXPLAIN前缀, 解析函数)
+explain_dialects = {
+    'sqlite': ('EXPLAIN QUERY PLAN', parse_sqlite),
+    'mysql': ('EXPLAIN FORMAT=JSON', parse_mysql),
+    'postgresql': ('EXPLAIN (FORMAT JSON)', parse_postgresql),
+}
+
+
+def explain_queryset(session: SQLAlchemyClient, queryset: Query) -> t.Optional[PlanSummary]:
+    """ 在会话的连接上执行EXPLAIN
+
+    只估算执行计划而不执行查询, 不支持的方言返回None
+
+    @param session: 数据会话
+    @param queryset: 查询对象
+    @return: t.Optional[PlanSummary]
+    """
+    statement = queryset.statement
+    connection = session.connection(bind_arguments={'clause': statement})
+    dialect = connection.dialect.name
+    if dialect not in explain_dialects:
+        return None
+    prefix, parse = explain_dialects[dialect]
+    summary = parse(connection.execute(Explain(statement, prefix)).fetchall())
+    # 大IN列表的临时表只有列表中的值, 扫描它不算全表扫描
+    tables = statement.get_execution_options().get(IN_LIST_TABLES, None) or []
+    names = {table.name for table, _, _ in tables}
+    summary.full_scans = [name for name in summary.full_scans if name not in names]
+    return summary
+
+
+class ExplainGuard(object):
+    """ 执行计划护栏
+
+    查询执行前先按形状EXPLAIN一次并缓存摘要, 超出阈值时按action处理:
+    reject: 拒绝执行
+    downgrade: 仅因额外排序超出且未分页时去掉ORDER BY后执行, 否则拒绝
+    warn: 只记录日志
+    """
+
+    def __init__(
+            self,
+            *,
+            max_full_scans: t.Optional[int] = None,
+            max_rows: t.Optional[int] = None,
+            allow_filesort: t.Optional[bool] = True,
+            allow_temporary: t.Optional[bool] = True,
+            action: t.Optional[t.Text] = REJECT,
+            maxsize: t.Optional[int] = 512
+    ) -> None:
+        """ 初始化实例
+
+        @param max_full_scans: 允许全表扫描的表数量, None表示不限制
+        @param max_rows: 单个步骤允许的最大估算行数, None表示不限制
+        @param allow_filesort: 是否允许额外排序
+        @param allow_temporary: 是否允许临时表
+        @param action: 超出阈值时的处理方式, reject/downgrade/warn
+        @param maxsize: 缓存的执行计划数量
+        """
+        if action not in (REJECT, DOWNGRADE, WARN):
+            errs = f'invalid explain action {action}'
+            raise ValidationError(errormsg=errs)
+        self.max_full_scans = max_full_scans
+        self.max_rows = max_rows
+        self.allow_filesort = allow_filesort
+        self.allow_temporary = allow_temporary
+        self.action = action
+        self.maxsize = maxsize or 0
+        self.counts = dict.fromkeys(('explains', 'hits', 'rejects', 'downgrades', 'warns'), 0)
+        self._lock = Lock()
+        self._plans = OrderedDict()
+
+    def violations(self, summary: PlanSummary) -> t.List[t.Text]:
+        """ 执行计划违反的规则
+
+        @param summary: 执行计划摘要
+        @return: t.List[t.Text]
+        """
+        violations = []
+        if self.max_full_scans is not None and len(summary.full_scans) > self.max_full_scans:
+            violations.append(FULL_SCAN)
+        if not self.allow_filesort and summary.filesort:
+            violations.append(FILESORT)
+        if not self.allow_temporary and summary.temporary:
+            violations.append(TEMPORARY)
+        if self.max_rows is not None and summary.rows is not None and summary.rows > self.max_rows:
+            violations.append(ROWS)
+        return violations
+
+    def explain(self, session: SQLAlchemyClient, key: t.Tuple, queryset: Query) -> t.Optional[PlanSummary]:
+        """ 获取执行计划摘要, 相同形状只EXPLAIN一次
+
+        @param session: 数据会话
+        @param key: 查询形状
+        @param queryset: 查询对象
+        @return: t.Optional[PlanSummary]
+        """
+        with self._lock:
+            if key in self._plans:
+                self.counts['hits'] += 1
+                self._plans.move_to_end(key)
+                return self._plans[key]
+        summary = explain_queryset(session, queryset)
+        with self._lock:
+            self.counts['explains'] += 1
+            if not self.maxsize:
+                return summary
+            self._plans[key] = summary
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return summary
+
+    def record(self, name: t.Text) -> None:
+        """ 记录处理结果
+
+        @param name: 计数名称
+        @return: None
+        """
+        with self._lock:
+            self.counts[name] += 1
+
+    def check(
+            self,
+            session: SQLAlchemyClient,
+            key: t.Tuple,
+            queryset: Query,
+            paginated: t.Optional[bool] = False
+    ) -> Query:
+        """ 按执行计划检查查询
+
+        @param session: 数据会话
+        @param key: 查询形状
+        @param queryset: 查询对象
+        @param paginated: 是否分页, 分页依赖排序保证各页不重不漏, 不允许去掉排序
+        @return: Query
+        """
+        summary = self.explain(session, key, queryset)
+        violations = [] if summary is None else self.violations(summary)
+        if not violations:
+            return queryset
+        if self.action == WARN:
+            self.record('warns')
+            logger.warning(f'search plan exceeds guardrails {violations}, {json.dumps(summary.dict(), default=str)}')
+            return queryset
+        # 注意: 去掉排序后重新检查, 分页查询去掉排序后页间顺序不确定, 直接拒绝
+        if self.action == DOWNGRADE and violations == [FILESORT] and not paginated:
+            downgraded = queryset.order_by(None)
+            summary = self.explain(session, key + (DOWNGRADE,), downgraded)
+            if not self.violations(summary):
+                self.record('downgrades')
+                logger.warning('search plan requires filesort, order_by dropped')
+                return downgraded
+        self.record('rejects')
+        errs = f'search rejected by plan guardrails {violations}, full_scans={summary.full_scans} rows={summary.rows}'
+        raise ValidationError(errormsg=errs)
+
+    def clear(self) -> None:
+        """ 清空执行计划
+
+        @return: None
+        """
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 护栏统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            return {
+                'size': len(self._plans),
+                'maxsize': self.maxsize,
+                'action': self.action,
+                'counts': dict(self.counts)
+            }
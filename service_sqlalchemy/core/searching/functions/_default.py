@@ -2,6 +2,9 @@
 #
 # author: forcemain@163.com
 
+import typing as t
+
+from sqlalchemy import func as funcs
 from sqlalchemy.sql.functions import GenericFunction
 
 from .base import BaseFunction
@@ -12,13 +15,14 @@ class DefaultFunction(BaseFunction):
 
     alias = {'default'}
 
-    def eval(self) -> GenericFunction:
+    @classmethod
+    def handle(cls, field: t.Any, param: t.Dict[t.Text, t.Any], fn: t.Text) -> GenericFunction:
         """ 生成的函数
 
+        @param field: 模型的字段
+        @param param: 函数选项
+        @param fn: 函数名称
         @return: GenericFunction
         """
-        if isinstance(self.field, list):
-            field = self.field
-        else:
-            field = [self.field]
-        return self.func(*field, **self._param)
+        field = field if isinstance(field, list) else [field]
+        return getattr(funcs, fn)(*field, **param)
@@ -2,6 +2,8 @@
 #
 # author: forcemain@163.com
 
+import typing as t
+
 import sqlalchemy as sa
 from sqlalchemy.sql.functions import GenericFunction
 
@@ -13,9 +15,13 @@ class DistinctFunction(BaseFunction):
 
     alias = {'distinct'}
 
-    def eval(self) -> GenericFunction:
+    @classmethod
+    def handle(cls, field: t.Any, param: t.Dict[t.Text, t.Any], fn: t.Text) -> GenericFunction:
         """ 生成的函数
 
+        @param field: 模型的字段
+        @param param: 函数选项
+        @param fn: 函数名称
         @return: GenericFunction
         """
-        return sa.distinct(self.field)
+        return sa.distinct(field)
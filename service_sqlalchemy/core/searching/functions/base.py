@@ -19,6 +19,8 @@ class FunctionMeta(type):
     """ 函数的收集器 """
 
     mapping = {}
+    # 函数名称 => 无状态的处理函数, 编译时直接查表分发
+    handlers = {}
 
     def __new__(mcs, name: t.Text, bases: t.Tuple[type, ...], namespace: t.Dict[t.Text, t.Any]) -> t.Type:
         """ 初始化子类
@@ -33,11 +35,35 @@ class FunctionMeta(type):
         if name == 'BaseFunction':
             return klass
         else:
+            # 兼容只实现了eval的自定义函数, 处理时退化为实例化后调用eval
+            if 'eval' in namespace and 'handle' not in namespace:
+                klass.handle = classmethod(legacy_handle)
             data = {alias: klass for alias in klass.alias}
             mcs.mapping.update(data)
+            # 注意: 每次访问classmethod都会生成新的绑定方法, 所有别名共享同一个对象
+            handle = klass.handle
+            mcs.handlers.update({alias: handle for alias in klass.alias})
             return klass
 
 
+def legacy_handle(
+        cls: t.Type[BaseFunction],
+        field: t.Any,
+        param: t.Dict[t.Text, t.Any],
+        fn: t.Text
+) -> GenericFunction:
+    """ 实例化后调用eval
+
+    @param cls: 函数类
+    @param field: 模型的字段
+    @param param: 函数选项
+    @param fn: 函数名称
+    @return: GenericFunction
+    """
+    type = FieldTypeEnum.plain.value if isinstance(field, str) else FieldTypeEnum.field.value
+    return cls(func=fn, model=None, field=field, type=type, param=param).eval()
+
+
 class BaseFunction(object, metaclass=FunctionMeta):
     """ 函数的基类 """
 
@@ -73,13 +99,26 @@ class BaseFunction(object, metaclass=FunctionMeta):
         """
         return getattr(funcs, self._func)
 
-    def eval(self) -> GenericFunction:
+    @classmethod
+    def handle(cls, field: t.Any, param: t.Dict[t.Text, t.Any], fn: t.Text) -> GenericFunction:
         """ 生成的函数
 
+        无状态, 不依赖实例, 由编译器按函数名称直接调用
+
+        @param field: 模型的字段
+        @param param: 函数选项
+        @param fn: 函数名称
         @return: GenericFunction
         """
         raise NotImplementedError
 
+    def eval(self) -> GenericFunction:
+        """ 生成的函数
+
+        @return: GenericFunction
+        """
+        return self.handle(self.field, self._param, self._func)
+
     @AsLazyProperty
     def field(self) -> t.Any:
         """ 模型的字段
@@ -0,0 +1,361 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from threading import Lock
+from sqlalchemy import text
+from sqlalchemy import event
+from sqlalchemy import any_
+from sqlalchemy import all_
+from sqlalchemy import Table
+from sqlalchemy import Column
+from sqlalchemy import select
+from sqlalchemy import MetaData
+from sqlalchemy.types import ARRAY
+from sqlalchemy.types import NullType
+from sqlalchemy.sql import bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import ClauseElement
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.slowlog import SEARCH_IN_LISTS
+
+from .nodes import Node
+from .nodes import OperatorNode
+from .nodes import ConditionNode
+from .schemas import FieldTypeEnum
+from .operators import OperatorMeta
+
+# IN列表策略
+AUTO, INLINE, CHUNK, ARRAY_BIND, TEMP_TABLE = 'auto', 'inline', 'chunk', 'array', 'temp_table'
+# 语句执行选项中执行前需要加载的临时表
+IN_LIST_TABLES = 'search_in_list_tables'
+
+IN = OperatorMeta.handlers['in']
+NOT_IN = OperatorMeta.handlers['not_in']
+
+# 支持绑定数组参数的方言
+array_dialects = {'postgresql'}
+# 支持临时表的方言 => 只删除临时表的语句, 避免误删同名的普通表
+temp_table_dialects = {
+    'mysql': 'DROP TEMPORARY TABLE IF EXISTS {}',
+    'sqlite': 'DROP TABLE IF EXISTS temp.{}',
+    'postgresql': 'DROP TABLE IF EXISTS pg_temp.{}'
+}
+
+
+class InListStrategy(object):
+    """ 大IN列表策略
+
+    inline: 原样内联, 元素多时语句很大, 解析慢且可能超出MySQL的max_allowed_packet
+    chunk: 拆分为多次查询后合并结果, 只用于无分页/排序/分组的流式查询
+    array: 绑定为单个数组参数, 即 field = ANY(:array), 只支持PostgreSQL
+    temp_table: 执行前分批写入会话连接上的临时表, 即 field IN (SELECT value FROM temp)
+    """
+
+    def __init__(
+            self,
+            *,
+            threshold: t.Optional[int] = 1000,
+            strategy: t.Optional[t.Text] = AUTO,
+            chunk_size: t.Optional[int] = 1000,
+            chunk_threshold: t.Optional[int] = 10000
+    ) -> None:
+        """ 初始化实例
+
+        @param threshold: 超过该数量的IN列表不再内联
+        @param strategy: 策略, auto/inline/chunk/array/temp_table
+        @param chunk_size: chunk策略每次查询的元素数, 也是临时表每批写入的元素数
+        @param chunk_threshold: auto时流式查询的IN列表不超过该数量时拆分查询
+        """
+        if strategy not in (AUTO, INLINE, CHUNK, ARRAY_BIND, TEMP_TABLE):
+            errs = f'invalid in list strategy {strategy}'
+            raise ValidationError(errormsg=errs)
+        self.threshold = threshold or 0
+        self.strategy = strategy
+        self.chunk_size = max(chunk_size or 1, 1)
+        self.chunk_threshold = chunk_threshold or 0
+        self.counts = dict.fromkeys((INLINE, CHUNK, ARRAY_BIND, TEMP_TABLE), 0)
+        self._lock = Lock()
+
+    def choose(self, size: int, dialect: t.Text, chunkable: t.Optional[bool] = False) -> t.Text:
+        """ 按列表大小和方言选择策略
+
+        指定的策略不可用时退化为自动选择
+
+        @param size: 列表大小
+        @param dialect: 方言名称
+        @param chunkable: 能否拆分为多次查询
+        @return: t.Text
+        """
+        if self.strategy == INLINE or size <= self.threshold:
+            return INLINE
+        strategy = self.strategy
+        if strategy == CHUNK and chunkable:
+            return CHUNK
+        if strategy == ARRAY_BIND and dialect in array_dialects:
+            return ARRAY_BIND
+        if strategy == TEMP_TABLE and dialect in temp_table_dialects:
+            return TEMP_TABLE
+        # 注意: 数组参数只需一次往返, 优先于拆分查询
+        if dialect in array_dialects:
+            return ARRAY_BIND
+        if chunkable and size <= self.chunk_threshold:
+            return CHUNK
+        if dialect in temp_table_dialects:
+            return TEMP_TABLE
+        return CHUNK if chunkable else INLINE
+
+    def record(self, strategy: t.Text) -> None:
+        """ 记录选择的策略
+
+        @param strategy: 策略
+        @return: None
+        """
+        with self._lock:
+            self.counts[strategy] += 1
+
+    def install(self, engine: Engine) -> None:
+        """ 安装引擎事件, 语句执行前在同一连接上加载临时表
+
+        注意: 引擎级事件会让每条语句都走事件分发, inline策略从不使用临时表, 不安装
+
+        @param engine: 数据引擎, 异步引擎时安装到sync_engine
+        @return: None
+        """
+        if self.strategy == INLINE:
+            return
+        engine = getattr(engine, 'sync_engine', engine)
+        event.contains(engine, 'before_execute', load_tables) or event.listen(engine, 'before_execute', load_tables)
+
+    def install_session(self, session: Session) -> None:
+        """ 安装到会话可能使用的引擎, 包括只读路由的从库
+
+        单次查询传入的策略可能与引擎上安装的不同, 用到临时表时调用
+
+        @param session: 数据会话
+        @return: None
+        """
+        replicas = getattr(session, 'replicas', None)
+        for engine in (session.get_bind(), *getattr(replicas, 'engines', ())): self.install(engine)
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 策略统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'strategy': self.strategy,
+                'counts': dict(self.counts)
+            }
+
+
+class InListPlanner(object):
+    """ 单次查询的IN列表规划
+
+    在优化后的语法树上把超过阈值的字面量列表替换为数组参数或临时表子查询
+    """
+
+    def __init__(self, strategy: InListStrategy, dialect: t.Text) -> None:
+        """ 初始化实例
+
+        @param strategy: 策略配置
+        @param dialect: 方言名称
+        """
+        self.strategy = strategy
+        self.dialect = dialect
+        # 选择结果, 供慢查询日志输出
+        self.decisions = []
+        # 执行前需要加载的临时表及其数据
+        self.tables = []
+
+    def execution_options(self) -> t.Dict[t.Text, t.Any]:
+        """ 查询对象上附加的执行选项
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        options = {SEARCH_IN_LISTS: self.decisions} if self.decisions else {}
+        self.tables and options.update({IN_LIST_TABLES: self.tables})
+        return options
+
+    def rewrite(self, root: t.Optional[Node]) -> t.Optional[Node]:
+        """ 替换语法树中的大IN列表
+
+        @param root: 语法树根节点
+        @return: t.Optional[Node]
+        """
+        if not isinstance(root, ConditionNode):
+            return self.rewrite_node(root)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for index, child in enumerate(node.nodes):
+                if isinstance(child, ConditionNode):
+                    stack.append(child)
+                    continue
+                node.nodes[index] = self.rewrite_node(child)
+        return root
+
+    def rewrite_node(self, node: t.Any) -> t.Any:
+        """ 替换单个操作节点
+
+        @param node: 语法树节点
+        @return: t.Any
+        """
+        if not isinstance(node, OperatorNode) or node.handler not in (IN, NOT_IN):
+            return node
+        values = node.value
+        if not isinstance(values, (list, tuple)) or len(values) <= self.strategy.threshold:
+            return node
+        # 注意: 只处理已解析字段上的字面量列表, 子节点和参数槽位保持原样
+        field_type = getattr(node.field, 'type', None)
+        if node.path is None or field_type is None or isinstance(field_type, NullType):
+            return node
+        if any(isinstance(v, (Node, ClauseElement)) for v in values):
+            return node
+        strategy = self.strategy.choose(len(values), self.dialect)
+        self.strategy.record(strategy)
+        self.decisions.append({'field': node.name, 'size': len(values), 'strategy': strategy})
+        if strategy == ARRAY_BIND:
+            value = bindparam(None, value=list(values), type_=ARRAY(field_type))
+            handler = in_array if node.handler == IN else not_in_array
+            return OperatorNode(handler, node.field, value, node.param, node.name, node.path)
+        if strategy == TEMP_TABLE:
+            table = Table(f'search_in_{len(self.tables)}', MetaData(), Column('value', field_type), prefixes=['TEMPORARY'])
+            # 注意: IN的语义与重复元素无关, 去重后写入
+            self.tables.append((table, list(dict.fromkeys(values)), self.strategy.chunk_size))
+            handler = in_select if node.handler == IN else not_in_select
+            return OperatorNode(handler, node.field, select(table.c.value), node.param, node.name, node.path)
+        return node
+
+
+def in_array(field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> t.Any:
+    """ field = ANY(:array)
+
+    @param field: 模型的字段
+    @param value: 数组参数
+    @param param: 操作选项
+    @param name: 字段名称
+    @return: t.Any
+    """
+    return field == any_(value)
+
+
+def not_in_array(field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> t.Any:
+    """ field != ALL(:array)
+
+    @param field: 模型的字段
+    @param value: 数组参数
+    @param param: 操作选项
+    @param name: 字段名称
+    @return: t.Any
+    """
+    return field != all_(value)
+
+
+def in_select(field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> t.Any:
+    """ field IN (SELECT value FROM temp)
+
+    @param field: 模型的字段
+    @param value: 临时表子查询
+    @param param: 操作选项
+    @param name: 字段名称
+    @return: t.Any
+    """
+    return field.in_(value)
+
+
+def not_in_select(field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> t.Any:
+    """ field NOT IN (SELECT value FROM temp)
+
+    @param field: 模型的字段
+    @param value: 临时表子查询
+    @param param: 操作选项
+    @param name: 字段名称
+    @return: t.Any
+    """
+    return field.not_in(value)
+
+
+def load_tables(
+        conn: t.Any,
+        clauseelement: t.Any,
+        multiparams: t.Any,
+        params: t.Any,
+        execution_options: t.Dict[t.Text, t.Any]
+) -> None:
+    """ 语句执行前在同一连接上重建并分批写入临时表
+
+    临时表只对当前连接可见, 在执行时而不是构建时加载, 路由到从库或会话关闭后再执行的查询同样可用;
+    表名在单条语句内唯一, 每次执行前先删除同一连接上遗留的同名临时表
+
+    @param conn: 数据连接
+    @param clauseelement: 执行语句
+    @param multiparams: 批量参数
+    @param params: 绑定参数
+    @param execution_options: 执行选项
+    @return: None
+    """
+    tables = execution_options.get(IN_LIST_TABLES, None)
+    if not tables: return
+    drop = temp_table_dialects[conn.dialect.name]
+    for table, values, batch_size in tables:
+        conn.execute(text(drop.format(conn.dialect.identifier_preparer.quote(table.name))))
+        table.create(conn)
+        for index in range(0, len(values), batch_size):
+            conn.execute(table.insert(), [{'value': v} for v in values[index:index + batch_size]])
+
+
+def split_filter(
+        filters: t.Any,
+        strategy: InListStrategy,
+        dialect: t.Text
+) -> t.Optional[t.Tuple[t.Dict[t.Text, t.Any], t.List[t.Any]]]:
+    """ 按顶层AND中的大IN列表拆分过滤条件
+
+    只有顶层的IN才能拆分后合并结果, 每份过滤条件只替换该IN的值, 其余节点共享
+
+    @param filters: 校验后的过滤条件
+    @param strategy: 策略配置
+    @param dialect: 方言名称
+    @return: t.Optional[t.Tuple[t.Dict[t.Text, t.Any], t.List[t.Any]]]
+    """
+    stack = [(filters, ())]
+    while stack:
+        node, path = stack.pop()
+        if isinstance(node, list):
+            stack.extend((n, path + (i,)) for i, n in enumerate(node))
+            continue
+        if not isinstance(node, dict):
+            continue
+        if 'a' in node and 'o' in node and 'b' in node:
+            node['o'] == 'and' and stack.extend(((node['b'], path + ('b',)), (node['a'], path + ('a',))))
+            continue
+        values = node.get('value', None)
+        if OperatorMeta.handlers.get(node.get('op', None), None) != IN or not isinstance(values, list):
+            continue
+        if not isinstance(node.get('field', None), str) or node.get('type', None) == FieldTypeEnum.plain.value:
+            continue
+        if any(isinstance(v, (dict, list)) for v in values):
+            continue
+        if strategy.choose(len(values), dialect, chunkable=True) != CHUNK:
+            continue
+        strategy.record(CHUNK)
+        decision = {'field': node['field'], 'size': len(values), 'strategy': CHUNK}
+        chunks, size = [], strategy.chunk_size
+        for index in range(0, len(values), size):
+            root = current = dict(filters) if isinstance(filters, dict) else list(filters)
+            for key in path:
+                current[key] = dict(current[key]) if isinstance(current[key], dict) else list(current[key])
+                current = current[key]
+            current['value'] = values[index:index + size]
+            chunks.append(root)
+        decision['chunks'] = len(chunks)
+        return decision, chunks
+    return None
@@ -0,0 +1,233 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from sqlalchemy import Index
+from sqlalchemy import inspect
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.orm import ColumnProperty
+from service_sqlalchemy.exception import ValidationError
+
+from .registry import FieldPath
+
+# 检查范围
+FILTER_BY, HAVING = 'filter_by', 'having'
+# 可以使用索引的操作
+indexed_operators = {'eq', 'in', 'between', 'gt', 'ge', 'lt', 'le', 'startswith'}
+
+
+def is_indexed(path: t.Optional[FieldPath]) -> bool:
+    """ 字段是否为索引(含联合索引)的首列
+
+    @param path: 名称解析结果
+    @return: bool
+    """
+    if path is None or path.kind != 'column' or path.relationships:
+        return False
+    prop = getattr(path.attribute, 'property', None)
+    if not isinstance(prop, ColumnProperty):
+        return False
+    column = prop.columns[0]
+    if column.primary_key or column.index or column.unique:
+        return True
+    table = getattr(column, 'table', None)
+    for item in (*getattr(table, 'indexes', ()), *getattr(table, 'constraints', ())):
+        if not isinstance(item, (Index, UniqueConstraint)):
+            continue
+        columns = list(item.columns)
+        if columns and columns[0] is column:
+            return True
+    return False
+
+
+def load_table(model: t.Any) -> t.Optional[t.Text]:
+    """ 加载模型对应的表名
+
+    @param model: 模型或别名
+    @return: t.Optional[t.Text]
+    """
+    insp = inspect(model, raiseerr=False)
+    mapper = getattr(insp, 'mapper', None)
+    return None if mapper is None else mapper.local_table.name
+
+
+class SearchLimits(object):
+    """ 查询复杂度限制
+
+    在编译查询的同一次遍历中检查, 超出时报告具体的位置, 所有限制为None时不做检查
+    """
+
+    def __init__(
+            self,
+            *,
+            max_joins: t.Optional[int] = None,
+            max_nodes: t.Optional[int] = None,
+            max_depth: t.Optional[int] = None,
+            max_in_size: t.Optional[int] = None,
+            max_page_size: t.Optional[int] = None,
+            disallowed_operators: t.Optional[t.Dict[t.Text, t.List[t.Text]]] = None,
+            indexed_tables: t.Optional[t.List[t.Text]] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param max_joins: 最多联表数量
+        @param max_nodes: 过滤条件和分组条件中最多的条件(操作或函数)数量
+        @param max_depth: 条件外层and/or最多的嵌套层数, 单个条件为1
+        @param max_in_size: in/not_in列表最多的元素数量
+        @param max_page_size: 最大分页大小
+        @param disallowed_operators: 字段 => 禁止的操作, 字段可为Model.field/Model.*/*
+        @param indexed_tables: 大表的表名, 查询这些表时过滤条件的顶层AND中必须有索引字段上的条件
+        """
+        self.max_joins = max_joins
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_in_size = max_in_size
+        self.max_page_size = max_page_size
+        self.disallowed_operators = {k: set(v) for k, v in (disallowed_operators or {}).items()}
+        self.indexed_tables = set(indexed_tables or [])
+
+    def check_page_size(self, page_size: t.Optional[int]) -> None:
+        """ 检查分页大小
+
+        @param page_size: 分页大小
+        @return: None
+        """
+        if self.max_page_size is None or type(page_size) is not int or page_size <= self.max_page_size:
+            return
+        errs = f'page_size {page_size} exceeds max_page_size {self.max_page_size}'
+        raise ValidationError(errormsg=errs)
+
+    def check_in_size(self, name: t.Any, size: int) -> None:
+        """ 检查IN列表大小
+
+        @param name: 字段名称
+        @param size: 元素数量
+        @return: None
+        """
+        if self.max_in_size is None or size <= self.max_in_size:
+            return
+        errs = f'in list on {name} has {size} values, exceeds max_in_size {self.max_in_size}'
+        raise ValidationError(errormsg=errs)
+
+    def check_operator(self, op: t.Text, name: t.Any) -> None:
+        """ 检查字段上的操作是否被禁止
+
+        @param op: 操作名称
+        @param name: 字段名称, 函数等非字段时只匹配*
+        @return: None
+        """
+        disallowed = self.disallowed_operators
+        if not disallowed:
+            return
+        keys = ['*']
+        if isinstance(name, str) and '.' in name:
+            keys.extend((f'{name.split(".", 1)[0]}.*', name))
+        for key in keys:
+            if op not in disallowed.get(key, ()):
+                continue
+            errs = f'operator {op} is not allowed on {name if isinstance(name, str) else "expression"}'
+            raise ValidationError(errormsg=errs)
+
+
+class LimitChecker(object):
+    """ 单次查询的复杂度检查 """
+
+    def __init__(self, limits: SearchLimits) -> None:
+        """ 初始化实例
+
+        @param limits: 复杂度限制
+        """
+        self.limits = limits
+        self.nodes = 0
+        # 顶层AND中出现索引字段条件的表
+        self.indexed = set()
+
+    def visit(self, scope: t.Text, depth: int) -> None:
+        """ 访问过滤条件中的操作或函数
+
+        @param scope: filter_by/having
+        @param depth: 外层and/or条件的层数
+        @return: None
+        """
+        limits = self.limits
+        self.nodes += 1
+        if limits.max_nodes is not None and self.nodes > limits.max_nodes:
+            errs = f'{scope} exceeds max_nodes {limits.max_nodes}'
+            raise ValidationError(errormsg=errs)
+        if limits.max_depth is not None and depth > limits.max_depth:
+            errs = f'{scope} nesting depth {depth} exceeds max_depth {limits.max_depth}'
+            raise ValidationError(errormsg=errs)
+
+    def visit_operator(
+            self,
+            scope: t.Text,
+            op: t.Text,
+            name: t.Any,
+            value: t.Any,
+            path: t.Optional[FieldPath],
+            conjunctive: bool
+    ) -> None:
+        """ 访问操作节点
+
+        @param scope: filter_by/having
+        @param op: 操作名称
+        @param name: 字段名称
+        @param value: 操作的值
+        @param path: 名称解析结果, 非字段时为None
+        @param conjunctive: 是否位于顶层AND中
+        @return: None
+        """
+        limits = self.limits
+        limits.check_operator(op, name)
+        if op in ('in', 'not_in') and isinstance(value, list):
+            limits.check_in_size(name, len(value))
+        if not limits.indexed_tables or scope != FILTER_BY or not conjunctive:
+            return
+        if op in indexed_operators and is_indexed(path):
+            self.indexed.add(path.attribute.property.columns[0].table.name)
+
+    def finish(self, models: t.Iterable[t.Any], joins: int) -> None:
+        """ 检查联表数量以及大表上的索引条件
+
+        @param models: 查询涉及的模型
+        @param joins: 联表数量
+        @return: None
+        """
+        limits = self.limits
+        if limits.max_joins is not None and joins > limits.max_joins:
+            errs = f'search has {joins} joins, exceeds max_joins {limits.max_joins}'
+            raise ValidationError(errormsg=errs)
+        if not limits.indexed_tables:
+            return
+        for model in models:
+            table = load_table(model)
+            if table is None or table not in limits.indexed_tables or table in self.indexed:
+                continue
+            errs = f'search on large table {table} requires an indexed predicate in top level and of filter_by'
+            raise ValidationError(errormsg=errs)
+
+
+# 查询配置中的键 => SearchLimits的参数
+limit_options = {
+    'max_joins': 'max_joins',
+    'max_filter_nodes': 'max_nodes',
+    'max_filter_depth': 'max_depth',
+    'max_in_size': 'max_in_size',
+    'max_page_size': 'max_page_size',
+    'disallowed_operators': 'disallowed_operators',
+    'indexed_tables': 'indexed_tables',
+}
+
+
+def load_limits(options: t.Dict[t.Text, t.Any]) -> t.Optional[SearchLimits]:
+    """ 从查询配置中加载复杂度限制
+
+    @param options: 查询配置
+    @return: t.Optional[SearchLimits]
+    """
+    kwargs = {v: options[k] for k, v in limit_options.items() if options.get(k, None) is not None}
+    return SearchLimits(**kwargs) if kwargs else None
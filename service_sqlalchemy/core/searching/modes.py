@@ -0,0 +1,95 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from array import array
+from sqlalchemy import inspect
+from sqlalchemy.orm.query import Query
+from service_sqlalchemy.exception import ValidationError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 结果模式
+ORM, TUPLE, DICT, COLUMNAR = 'orm', 'tuple', 'dict', 'columnar'
+result_modes = (ORM, TUPLE, DICT, COLUMNAR)
+# 整数超出该范围时无法放入有符号64位数组
+int64_range = (-2 ** 63, 2 ** 63 - 1)
+
+
+def make_columns(queryset: Query) -> t.Tuple[t.List[t.Text], t.List[t.Any]]:
+    """ 展开查询中的模型为字段
+
+    模型展开为各列(如User.id), 模型字段沿用Model.field, 其它表达式使用label或函数的名称, 重名时追加序号
+
+    @param queryset: 查询对象
+    @return: t.Tuple[t.List[t.Text], t.List[t.Any]]
+    """
+    names, columns = [], []
+    for description in queryset.column_descriptions:
+        expr, entity = description['expr'], description['entity']
+        if entity is not None and expr is entity:
+            mapper = inspect(entity)
+            for attr in mapper.mapper.column_attrs:
+                names.append(f'{mapper.class_.__name__}.{attr.key}')
+                columns.append(getattr(entity, attr.key))
+            continue
+        if entity is not None and getattr(expr, 'class_', None) is not None and hasattr(expr, 'key'):
+            names.append(f'{inspect(entity).class_.__name__}.{expr.key}')
+        else:
+            # 注意: 未指定label的函数没有名称, 使用函数名
+            names.append(description['name'] or getattr(expr, 'name', None) or f'column_{len(names)}')
+        columns.append(expr)
+    seen = {}
+    for index, name in enumerate(names):
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        if count: names[index] = f'{name}_{count}'
+    return names, columns
+
+
+def make_array(values: t.Sequence[t.Any]) -> t.Any:
+    """ 转换为紧凑的列数组
+
+    安装NumPy时转换为ndarray, 否则全部为整数/浮点数时使用array, 其它情况保留列表
+
+    @param values: 列值
+    @return: t.Any
+    """
+    if numpy is not None:
+        return numpy.asarray(values)
+    types = {type(v) for v in values}
+    if types == {int} and int64_range[0] <= min(values) and max(values) <= int64_range[1]:
+        return array('q', values)
+    if types and types <= {int, float} and float in types:
+        return array('d', values)
+    return list(values)
+
+
+def convert_rows(
+        rows: t.List[t.Any],
+        names: t.List[t.Text],
+        mode: t.Text
+) -> t.Union[t.List[t.Tuple], t.List[t.Dict[t.Text, t.Any]], t.Dict[t.Text, t.Any]]:
+    """ 按结果模式转换数据行
+
+    @param rows: 数据行
+    @param names: 字段名称
+    @param mode: tuple/dict/columnar
+    @return: t.Union[t.List[t.Tuple], t.List[t.Dict[t.Text, t.Any]], t.Dict[t.Text, t.Any]]
+    """
+    if mode == TUPLE:
+        return [tuple(row) for row in rows]
+    if mode == DICT:
+        return [dict(zip(names, row)) for row in rows]
+    if mode == COLUMNAR:
+        columns = zip(*rows) if rows else [()] * len(names)
+        return {name: make_array(values) for name, values in zip(names, columns)}
+    errs = f'invalid result mode {mode}'
+    raise ValidationError(errormsg=errs)
@@ -0,0 +1,137 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from sqlalchemy import select
+from sqlalchemy import literal
+from sqlalchemy import union_all
+from sqlalchemy import bindparam
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.types import NullType
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.client import SQLAlchemyClient
+
+from . import Search
+from .modes import ORM
+from .modes import result_modes
+from .modes import convert_rows
+from .inlists import IN_LIST_TABLES
+
+# 合并查询中标记所属查询的列
+SEARCH_INDEX = 'search_index'
+
+
+def make_union_key(search: Search) -> t.Optional[t.Tuple]:
+    """ 计算可合并为UNION ALL的结构键
+
+    列数和各列类型一致时可以合并, 有排序(合并后不保证顺序)或需要临时表的查询单独执行
+
+    @param search: 查询对象
+    @return: t.Optional[t.Tuple]
+    """
+    if search.payload['order_by']:
+        return None
+    if search.queryset.get_execution_options().get(IN_LIST_TABLES, None):
+        return None
+    key = []
+    for column in search.columns[1]:
+        column_type = getattr(column, 'type', None)
+        if column_type is None or isinstance(column_type, NullType):
+            return None
+        key.append(column_type._type_affinity)
+    return tuple(key)
+
+
+def unique_binds(statement: t.Any) -> t.Any:
+    """ 将命名的绑定参数替换为匿名参数
+
+    同一形状的缓存计划编译出同名的参数槽位, UNION ALL中同名参数会合并为一个, 每个分支需要独立的参数
+
+    @param statement: 查询语句
+    @return: t.Any
+    """
+    def replace(element: t.Any) -> t.Optional[BindParameter]:
+        if not isinstance(element, BindParameter) or element.unique:
+            return None
+        return bindparam(
+            element.key,
+            value=element.value,
+            type_=element.type,
+            unique=True,
+            callable_=element.callable,
+            expanding=element.expanding
+        )
+
+    return visitors.replacement_traverse(statement, {}, replace)
+
+
+def execute_union(
+        session: SQLAlchemyClient,
+        searches: t.List[Search],
+        **options: t.Any
+) -> t.List[t.List[t.Any]]:
+    """ 通过一条UNION ALL执行多个查询
+
+    每个查询包装为子查询(保留各自的分页), 并附加所属查询的序号, 各分支的绑定参数相互独立
+
+    @param session: 数据会话
+    @param searches: 列结构一致的查询对象
+    @param options: 执行选项
+    @return: t.List[t.List[t.Any]]
+    """
+    branches = []
+    for index, search in enumerate(searches):
+        subquery = search.pagination.with_entities(*search.columns[1]).subquery()
+        # 注意: 替换时按对象去重, 每个分支单独替换
+        branches.append(unique_binds(select(literal(index).label(SEARCH_INDEX), *subquery.c)))
+    statement = union_all(*branches)
+    statement = statement.execution_options(**options) if options else statement
+    # 注意: 与Query保持一致, 执行前刷新会话中未提交的修改
+    session.autoflush and session.flush()
+    connection = session.connection(bind_arguments={'clause': statement})
+    results = [[] for _ in searches]
+    for row in connection.execute(statement):
+        results[row[0]].append(tuple(row[1:]))
+    return results
+
+
+def execute_searches(
+        session: SQLAlchemyClient,
+        searches: t.Dict[t.Text, Search],
+        mode: t.Optional[t.Text] = ORM,
+        combine: t.Optional[bool] = True,
+        **options: t.Any
+) -> t.Dict[t.Text, t.Any]:
+    """ 在同一会话(同一连接)上执行多个查询
+
+    非orm模式下列结构一致的查询合并为一条UNION ALL, 只需一次往返, 其余查询在同一连接上依次执行
+
+    @param session: 数据会话
+    @param searches: 名称 => 查询对象
+    @param mode: 结果模式, orm/tuple/dict/columnar
+    @param combine: 是否合并列结构一致的查询
+    @param options: 执行选项, 如只读路由
+    @return: t.Dict[t.Text, t.Any]
+    """
+    if mode not in result_modes:
+        errs = f'invalid result mode {mode}'
+        raise ValidationError(errormsg=errs)
+    groups, results = {}, {}
+    for name, search in searches.items():
+        key = make_union_key(search) if combine and mode != ORM else None
+        groups.setdefault(name if key is None else key, []).append(name)
+    for names in groups.values():
+        if len(names) > 1:
+            group = [searches[name] for name in names]
+            for name, search, rows in zip(names, group, execute_union(session, group, **options)):
+                results[name] = convert_rows(rows, search.columns[0], mode)
+            continue
+        search = searches[names[0]]
+        queryset = search.pagination.execution_options(**options) if options else search.pagination
+        results[names[0]] = search.result(mode, queryset)
+    return {name: results[name] for name in searches}
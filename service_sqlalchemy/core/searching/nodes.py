@@ -0,0 +1,190 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from types import MappingProxyType
+from sqlalchemy.sql import and_
+from sqlalchemy.sql import false
+
+from .registry import FieldPath
+
+# 没有选项的节点共享只读的空选项
+empty_param = MappingProxyType({})
+
+
+class Node(object):
+    """ 查询语法树节点 """
+
+    __slots__ = ()
+
+    def compile(self) -> t.Any:
+        """ 编译为SQL表达式
+
+        @return: t.Any
+        """
+        raise NotImplementedError
+
+
+class OperatorNode(Node):
+    """ 操作节点 """
+
+    __slots__ = ('handler', 'field', 'value', 'param', 'name', 'path')
+
+    def __init__(
+            self,
+            handler: t.Callable[..., t.Any],
+            field: t.Any,
+            value: t.Any,
+            param: t.Dict[t.Text, t.Any],
+            name: t.Any,
+            path: t.Optional[FieldPath] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param handler: 处理函数
+        @param field: 已解析的字段或子节点
+        @param value: 字段的值, 子节点或子节点列表
+        @param param: 操作选项
+        @param name: 字段名称
+        @param path: 字段的解析结果, plain类型和子节点时为None
+        """
+        self.handler = handler
+        self.field = field
+        self.value = value
+        self.param = param
+        self.name = name
+        self.path = path
+
+    def compile(self) -> t.Any:
+        """ 编译为SQL表达式
+
+        @return: t.Any
+        """
+        field, value = self.field, self.value
+        if isinstance(field, Node):
+            field = field.compile()
+        if isinstance(value, Node):
+            value = value.compile()
+        elif type(value) is list:
+            value = [v.compile() if isinstance(v, Node) else v for v in value]
+        expr = self.handler(field, value, self.param, self.name)
+        # 经由关系的多级路径转换为关联模型上的EXISTS条件
+        return expr if self.path is None or not self.path.relationships else self.path.wrap(expr)
+
+
+class FunctionNode(Node):
+    """ 函数节点 """
+
+    __slots__ = ('handler', 'field', 'param', 'fn')
+
+    def __init__(
+            self,
+            handler: t.Callable[..., t.Any],
+            field: t.Any,
+            param: t.Dict[t.Text, t.Any],
+            fn: t.Text
+    ) -> None:
+        """ 初始化实例
+
+        @param handler: 处理函数
+        @param field: 已解析的字段, 子节点或子节点列表
+        @param param: 函数选项
+        @param fn: 函数名称
+        """
+        self.handler = handler
+        self.field = field
+        self.param = param
+        self.fn = fn
+
+    def compile(self) -> t.Any:
+        """ 编译为SQL表达式
+
+        @return: t.Any
+        """
+        field = self.field
+        if isinstance(field, Node):
+            field = field.compile()
+        elif type(field) is list:
+            field = [f.compile() for f in field]
+        return self.handler(field, self.param, self.fn)
+
+
+class ConditionNode(Node):
+    """ 逻辑节点
+
+    子条件个数不限, 优化后同类的嵌套会被展平
+    """
+
+    __slots__ = ('combine', 'nodes')
+
+    def __init__(self, combine: t.Callable[..., t.Any], nodes: t.List[t.Any]) -> None:
+        """ 初始化实例
+
+        @param combine: and_/or_
+        @param nodes: 子条件, 可能为None
+        """
+        self.combine = combine
+        self.nodes = nodes
+
+    def compile(self, release: t.Optional[bool] = False) -> t.Any:
+        """ 编译为SQL表达式
+
+        迭代后序遍历, 嵌套层数不受递归深度限制
+
+        @param release: 编译后释放子条件, 只使用一次的语法树边编译边释放, 降低很大的条件树的内存峰值
+        @return: t.Any
+        """
+        order, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for n in node.nodes:
+                isinstance(n, ConditionNode) and stack.append(n)
+        # 注意: 先序的逆序中子节点总在父节点之前
+        results = {}
+        for node in reversed(order):
+            clauses = []
+            for n in node.nodes:
+                if isinstance(n, ConditionNode):
+                    # 注意: 子条件只被引用一次, 取出后不再保留
+                    clauses.append(results.pop(id(n)))
+                else:
+                    clauses.append(n.compile() if isinstance(n, Node) else n)
+            results[id(node)] = node.combine(*clauses)
+            if release: node.nodes = ()
+        return results[id(self)]
+
+
+class EmptyNode(Node):
+    """ 空条件节点 """
+
+    __slots__ = ()
+
+    def compile(self) -> t.Any:
+        """ 编译为SQL表达式
+
+        @return: t.Any
+        """
+        return and_()
+
+
+class FalseNode(Node):
+    """ 恒假条件节点, 由矛盾的条件折叠而来 """
+
+    __slots__ = ()
+
+    def compile(self) -> t.Any:
+        """ 编译为SQL表达式
+
+        @return: t.Any
+        """
+        return false()
+
+
+# 无状态的节点全局共享
+empty_node = EmptyNode()
+false_node = FalseNode()
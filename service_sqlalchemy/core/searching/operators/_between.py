@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import typing as t
+
 from sqlalchemy.sql.elements import BinaryExpression
 from service_sqlalchemy.exception import ValidationError
 
@@ -13,17 +15,22 @@ from .base import BaseOperator
 class BetweenOperator(BaseOperator):
     """ https://docs.sqlalchemy.org/en/14/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.between """
 
-    alias = {'contains'}
+    alias = {'between'}
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        if not isinstance(self._value, list):
-            errs = f'{self._field} must be list'
+        if not isinstance(value, list):
+            errs = f'{name} must be list'
             raise ValidationError(errormsg=errs)
-        if len(self._value) != 2:
-            errs = f'{self._field} != 2 items'
+        if len(value) != 2:
+            errs = f'{name} != 2 items'
             raise ValidationError(errormsg=errs)
-        return self.field.between(*self._value, **self._param)
+        return field.between(*value, **param)
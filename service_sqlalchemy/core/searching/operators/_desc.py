@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import typing as t
+
 from sqlalchemy.sql.elements import BinaryExpression
 
 from .base import BaseOperator
@@ -14,9 +16,14 @@ class DescOperator(BaseOperator):
 
     alias = {'desc'}
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        return self.field.desc()
+        return field.desc()
@@ -4,9 +4,13 @@
 
 from __future__ import annotations
 
+import typing as t
+
+from sqlalchemy.sql import operators
 from sqlalchemy.sql.elements import BinaryExpression
 from service_sqlalchemy.exception import ValidationError
 
+from .base import bind
 from .base import BaseOperator
 
 
@@ -14,13 +18,19 @@ class EndsWithOperator(BaseOperator):
     """ https://docs.sqlalchemy.org/en/14/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.endswith """
 
     alias = {'endswith'}
+    bindable = True
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        if not isinstance(self._value, str):
-            errs = f'{self._field} must be string'
+        if not isinstance(value, str):
+            errs = f'{name} must be string'
             raise ValidationError(errormsg=errs)
-        return self.field.endswith(self._value, **self._param)
+        return field.endswith(bind(value, field, operators.endswith_op), **param)
@@ -4,8 +4,12 @@
 
 from __future__ import annotations
 
+import typing as t
+
+from sqlalchemy.sql import operators
 from sqlalchemy.sql.elements import BinaryExpression
 
+from .base import bind
 from .base import BaseOperator
 
 
@@ -13,10 +17,16 @@ class EqualsOperator(BaseOperator):
     """ https://docs.sqlalchemy.org/en/14/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.__eq__ """
 
     alias = {'eq', '==', 'equal', 'equals'}
+    bindable = True
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        return self.field == self._value  # type: ignore
+        return field == bind(value, field, operators.eq)  # type: ignore
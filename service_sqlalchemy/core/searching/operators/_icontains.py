@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import typing as t
+
 from sqlalchemy.sql.elements import BinaryExpression
 from service_sqlalchemy.exception import ValidationError
 
@@ -14,15 +16,19 @@ class IContainsOperator(ILikeOperator):
     """ https://docs.sqlalchemy.org/en/14/core/sqlelement.html#sqlalchemy.sql.expression.ColumnOperators.contains """
 
     alias = {'icontains'}
+    bindable = False
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        if not isinstance(self._value, str):
-            errs = f'{self._field} must be string'
+        if not isinstance(value, str):
+            errs = f'{name} must be string'
             raise ValidationError(errormsg=errs)
-        else:
-            self._value = '%' + self._value + '%'
-        return super(IContainsOperator, self).expr()
+        return super(IContainsOperator, cls).handle(field, '%' + value + '%', param, name)
@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import typing as t
+
 from sqlalchemy.sql.elements import BinaryExpression
 from service_sqlalchemy.exception import ValidationError
 
@@ -15,12 +17,17 @@ class NotInOperator(BaseOperator):
 
     alias = {'notin', 'not_in'}
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        if not hasattr(self._value, '__iter__'):
-            errs = f'{self._field} must be iterable'
+        if not hasattr(value, '__iter__'):
+            errs = f'{name} must be iterable'
             raise ValidationError(errormsg=errs)
-        return self.field.not_in(self._value)
+        return field.not_in(value)
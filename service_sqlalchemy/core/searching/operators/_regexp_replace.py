@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import typing as t
+
 from sqlalchemy.sql.elements import BinaryExpression
 from service_sqlalchemy.exception import ValidationError
 
@@ -15,13 +17,15 @@ class RegexpReplaceOperator(BaseOperator):
 
     alias = {'regexp_replace'}
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        @param field: 模型的字段
+        @param value: 字段的值
+        @param param: 操作选项
+        @param name: 字段名称
         @return: BinaryExpression
         """
-        if isinstance(self._value, list):
-            value = self._value
-        else:
-            value = [self._value]
-        return self.field.regexp_replace(*value, **self._param)
+        value = value if isinstance(value, list) else [value]
+        return field.regexp_replace(*value, **param)
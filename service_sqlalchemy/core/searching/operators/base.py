@@ -10,6 +10,7 @@ from sqlalchemy.sql.functions import GenericFunction
 from sqlalchemy.sql.elements import BinaryExpression
 from service_core.core.decorator import AsLazyProperty
 from sqlalchemy.ext.declarative import declarative_base
+from service_sqlalchemy.core.searching.slots import Slot
 from service_sqlalchemy.core.searching.schemas import FieldTypeEnum
 
 BaseModel = declarative_base()
@@ -19,6 +20,8 @@ class OperatorMeta(type):
     """ 操作的收集器 """
 
     mapping = {}
+    # 操作名称 => 无状态的处理函数, 编译时直接查表分发
+    handlers = {}
 
     def __new__(mcs, name: t.Text, bases: t.Tuple[type, ...], namespace: t.Dict[t.Text, t.Any]) -> t.Type:
         """ 初始化子类
@@ -33,15 +36,54 @@ class OperatorMeta(type):
         if name == 'BaseOperator':
             return klass
         else:
+            # 兼容只实现了expr的自定义操作, 处理时退化为实例化后调用expr
+            if 'expr' in namespace and 'handle' not in namespace:
+                klass.handle = classmethod(legacy_handle)
             data = {alias: klass for alias in klass.alias}
             mcs.mapping.update(data)
+            # 注意: 每次访问classmethod都会生成新的绑定方法, 所有别名共享同一个对象
+            handle = klass.handle
+            mcs.handlers.update({alias: handle for alias in klass.alias})
             return klass
 
 
+def bind(value: t.Any, field: t.Any = None, op: t.Any = None) -> t.Any:
+    """ 绑定参数槽位
+
+    @param value: 字段的值
+    @param field: 模型的字段, 用于决定绑定类型
+    @param op: 比较的操作
+    @return: t.Any
+    """
+    return value.bind(getattr(field, 'type', None), op) if isinstance(value, Slot) else value
+
+
+def legacy_handle(
+        cls: t.Type[BaseOperator],
+        field: t.Any,
+        value: t.Any,
+        param: t.Dict[t.Text, t.Any],
+        name: t.Any
+) -> BinaryExpression:
+    """ 实例化后调用expr
+
+    @param cls: 操作类
+    @param field: 模型的字段
+    @param value: 字段的值
+    @param param: 操作选项
+    @param name: 字段名称
+    @return: BinaryExpression
+    """
+    type = FieldTypeEnum.plain.value if isinstance(field, str) else FieldTypeEnum.field.value
+    return cls(model=None, field=field, type=type, value=value, param=param).expr()
+
+
 class BaseOperator(object, metaclass=OperatorMeta):
     """ 操作的基类 """
 
     alias: t.Set[t.Text] = None
+    # 字面量的值能否替换为绑定参数
+    bindable: bool = False
 
     def __init__(
             self, *,
@@ -66,13 +108,39 @@ class BaseOperator(object, metaclass=OperatorMeta):
         self._param = param or {}
         self._type = type or FieldTypeEnum.field.value
 
-    def expr(self) -> BinaryExpression:
+    @classmethod
+    def can_bind(cls, param: t.Optional[t.Dict[t.Text, t.Any]] = None) -> bool:
+        """ 能否绑定参数
+
+        注意: autoescape要求值必须为字面量字符串
+
+        @param param: 操作选项
+        @return: bool
+        """
+        param = param or {}
+        return cls.bindable and not param.get('autoescape', False)
+
+    @classmethod
+    def handle(cls, field: t.Any, value: t.Any, param: t.Dict[t.Text, t.Any], name: t.Any) -> BinaryExpression:
         """ 构造表达式
 
+        无状态, 不依赖实例, 由编译器按操作名称直接调用
+
+        @param field: 模型的字段
+        @param value: 字段的值, 可能为参数槽位, 需要时使用bind绑定
+        @param param: 操作选项
+        @param name: 字段名称, 用于错误信息
         @return: BinaryExpression
         """
         raise NotImplementedError
 
+    def expr(self) -> BinaryExpression:
+        """ 构造表达式
+
+        @return: BinaryExpression
+        """
+        return self.handle(self.field, self._value, self._param, self._field)
+
     @AsLazyProperty
     def field(self) -> t.Any:
         """ 模型的字段
@@ -86,3 +154,11 @@ class BaseOperator(object, metaclass=OperatorMeta):
                 return getattr(self._model, self._field)
         this_is_an_other_type_field = self._field
         return this_is_an_other_type_field
+
+    @AsLazyProperty
+    def value(self) -> t.Any:
+        """ 字段的值
+
+        @return: t.Any
+        """
+        return bind(self._value, self.field)
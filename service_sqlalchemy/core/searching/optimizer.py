@@ -0,0 +1,244 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from decimal import Decimal
+from sqlalchemy.sql import and_, or_
+from sqlalchemy.sql import operators
+
+from .slots import Slot
+from .nodes import Node
+from .nodes import false_node
+from .nodes import EmptyNode
+from .nodes import empty_node
+from .nodes import empty_param
+from .nodes import OperatorNode
+from .nodes import ConditionNode
+from .operators import OperatorMeta
+
+# 注意: 与OperatorSchema.value的校验结果保持一致, 标量会被转换为字符串
+scalar_type = (str, int, float, bool)
+# 可安全比较大小的字段类型, 字符串的大小与数据库的排序规则相关, 不参与折叠
+number_type = (int, float, Decimal)
+
+EQ = OperatorMeta.handlers['eq']
+IN = OperatorMeta.handlers['in']
+GT, GE = OperatorMeta.handlers['gt'], OperatorMeta.handlers['ge']
+LT, LE = OperatorMeta.handlers['lt'], OperatorMeta.handlers['le']
+
+
+def make_key(node: t.Any) -> t.Optional[t.Tuple]:
+    """ 计算条件的去重键
+
+    参数槽位的值只在执行时确定, 以槽位名称区分, 不会被去重
+
+    @param node: 语法树节点
+    @return: t.Optional[t.Tuple]
+    """
+    if not isinstance(node, OperatorNode) or node.path is None:
+        return None
+    value = node.value
+    if isinstance(value, Slot):
+        value = (Slot, value.key)
+    elif value is None or isinstance(value, scalar_type):
+        value = (type(value), value)
+    else:
+        return None
+    try:
+        param = tuple(sorted(node.param.items())) if node.param else ()
+        key = (node.handler, node.name, value, param)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def load_number(node: t.Any) -> t.Optional[t.Any]:
+    """ 加载数值型比较条件的值
+
+    经由关系的路径会被转换为EXISTS, 不同关联行上的范围不构成矛盾, 不参与折叠
+
+    @param node: 语法树节点
+    @return: t.Optional[t.Any]
+    """
+    if not isinstance(node, OperatorNode) or node.handler not in (EQ, GT, GE, LT, LE):
+        return None
+    path, value = node.path, node.value
+    if path is None or path.relationships or node.param:
+        return None
+    python_type = path.python_type
+    if python_type is bool or python_type not in number_type:
+        return None
+    # 注意: 参数槽位的值只在执行时确定, 不能折叠进缓存的查询计划
+    if isinstance(value, Slot) or not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        return None
+    try:
+        return python_type(value)
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+
+
+def fold_ranges(nodes: t.List[t.Any]) -> t.Optional[t.List[t.Any]]:
+    """ 折叠AND中同一字段的范围条件
+
+    矛盾时返回None, 否则只保留最紧的上下界
+
+    @param nodes: 子条件
+    @return: t.Optional[t.List[t.Any]]
+    """
+    ranges = {}
+    for index, node in enumerate(nodes):
+        number = load_number(node)
+        if number is None: continue
+        info = ranges.setdefault(node.name, {'lower': None, 'upper': None, 'eq': set(), 'drop': []})
+        if node.handler == EQ:
+            info['eq'].add(number)
+            continue
+        strict = node.handler in (GT, LT)
+        side = 'lower' if node.handler in (GT, GE) else 'upper'
+        bound = info[side]
+        if bound is None:
+            info[side] = (number, strict, index)
+            continue
+        # 下界取最大, 上界取最小, 相等时严格的更紧
+        tighter = number > bound[0] if side == 'lower' else number < bound[0]
+        if tighter or number == bound[0] and strict and not bound[1]:
+            info['drop'].append(bound[2])
+            info[side] = (number, strict, index)
+        else:
+            info['drop'].append(index)
+    drops = set()
+    for info in ranges.values():
+        lower, upper, eqs = info['lower'], info['upper'], info['eq']
+        if len(eqs) > 1:
+            return None
+        if lower is not None and upper is not None:
+            if lower[0] > upper[0] or lower[0] == upper[0] and (lower[1] or upper[1]):
+                return None
+        for number in eqs:
+            if lower is not None and (number < lower[0] or number == lower[0] and lower[1]):
+                return None
+            if upper is not None and (number > upper[0] or number == upper[0] and upper[1]):
+                return None
+            # 等值条件在范围内时上下界都是多余的
+            drops.update(bound[2] for bound in (lower, upper) if bound is not None)
+        drops.update(info['drop'])
+    return [n for i, n in enumerate(nodes) if i not in drops] if drops else nodes
+
+
+def merge_equals(nodes: t.List[t.Any]) -> t.List[t.Any]:
+    """ 合并OR中同一字段的等值条件为IN
+
+    已合并的IN会继续吸收外层展平后的等值条件
+
+    @param nodes: 子条件
+    @return: t.List[t.Any]
+    """
+    groups = {}
+    for index, node in enumerate(nodes):
+        if not isinstance(node, OperatorNode) or node.path is None or node.param:
+            continue
+        if node.handler == EQ and node.value is not None and isinstance(node.value, scalar_type):
+            groups.setdefault(node.name, []).append(index)
+        # 注意: 合并生成的IN的值为元组, 用户传入的IN的值为子节点列表
+        if node.handler == IN and type(node.value) is tuple:
+            groups.setdefault(node.name, []).append(index)
+    merged, drops = {}, set()
+    for name, indexes in groups.items():
+        if len(indexes) < 2: continue
+        values, seen = [], set()
+        field_type = getattr(nodes[indexes[0]].field, 'type', None)
+        for index in indexes:
+            node = nodes[index]
+            single = node.value.bind(field_type, operators.in_op) if isinstance(node.value, Slot) else node.value
+            for value in node.value if node.handler == IN else (single,):
+                # 参数槽位绑定为独立参数, 只对字面量去重
+                key = (type(value), value) if isinstance(value, scalar_type) else id(value)
+                if key in seen: continue
+                seen.add(key)
+                values.append(value)
+        first = nodes[indexes[0]]
+        # 注意: 使用元组避免编译时被当作子节点列表
+        merged[indexes[0]] = OperatorNode(IN, first.field, tuple(values), empty_param, first.name, first.path)
+        drops.update(indexes[1:])
+    if not merged:
+        return nodes
+    return [merged.get(i, n) for i, n in enumerate(nodes) if i not in drops]
+
+
+def simplify(combine: t.Callable[..., t.Any], nodes: t.List[t.Any], parent: t.Optional[ConditionNode] = None) -> t.Any:
+    """ 化简展平后的逻辑节点
+
+    @param combine: and_/or_
+    @param nodes: 展平后的子条件
+    @param parent: 原逻辑节点, 传入时直接复用, 避免新旧两棵树同时存在
+    @return: t.Any
+    """
+    result, seen, has_false, fields = [], set(), False, 0
+    for node in nodes:
+        # 空条件在and_/or_中都会被忽略
+        if isinstance(node, EmptyNode): continue
+        if node is false_node:
+            if combine is and_: return false_node
+            has_false = True
+            continue
+        key = make_key(node)
+        if key is not None:
+            if key in seen: continue
+            seen.add(key)
+        result.append(node)
+        fields += isinstance(node, OperatorNode) and node.path is not None
+    # 注意: 折叠和合并都至少需要两个字段上的条件
+    if combine is and_ and fields > 1:
+        result = fold_ranges(result)
+        if result is None: return false_node
+    if combine is or_ and fields > 1:
+        result = merge_equals(result)
+    if not result:
+        # 注意: OR的子条件除空条件外全部恒假时整体恒假
+        return false_node if has_false else empty_node
+    if len(result) == 1:
+        return result[0]
+    if parent is None:
+        return ConditionNode(combine, result)
+    parent.nodes = result
+    return parent
+
+
+def optimize(root: t.Optional[Node]) -> t.Optional[Node]:
+    """ 优化过滤条件
+
+    1. 展平同类的and/or嵌套
+    2. 去掉空条件和重复的条件
+    3. OR中同一字段的等值条件合并为IN
+    4. AND中同一数值字段的范围条件折叠, 矛盾时整体替换为恒假
+
+    迭代后序遍历, 生成的客户端传入很深的条件树时不会超出递归深度
+
+    @param root: 语法树根节点
+    @return: t.Optional[Node]
+    """
+    if not isinstance(root, ConditionNode):
+        return root
+    order, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        for n in node.nodes:
+            isinstance(n, ConditionNode) and stack.append(n)
+    # 注意: 先序的逆序中子节点总在父节点之前
+    results = {}
+    for node in reversed(order):
+        nodes = []
+        for child in node.nodes:
+            child = results.pop(id(child)) if isinstance(child, ConditionNode) else child
+            if isinstance(child, ConditionNode) and child.combine is node.combine:
+                nodes.extend(child.nodes)
+            else:
+                nodes.append(child)
+        results[id(node)] = simplify(node.combine, nodes, node)
+    return results[id(root)]
@@ -0,0 +1,332 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import base64
+import typing as t
+import binascii
+import datetime
+
+from decimal import Decimal
+from sqlalchemy import case
+from sqlalchemy import func
+from sqlalchemy import false
+from sqlalchemy import inspect
+from sqlite3 import sqlite_version_info
+from sqlalchemy.engine import Dialect
+from sqlalchemy.sql import and_, or_
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql.elements import BooleanClauseList
+from service_sqlalchemy.exception import ValidationError
+
+# 游标方向
+NEXT, PREV = 'next', 'prev'
+# 统计策略
+PEEK, COUNT, WINDOW = 'peek', 'count', 'window'
+# 游标中非JSON原生类型的标记
+cursor_types = {
+    '$datetime': (datetime.datetime, datetime.datetime.fromisoformat),
+    '$date': (datetime.date, datetime.date.fromisoformat),
+    '$time': (datetime.time, datetime.time.fromisoformat),
+    '$decimal': (Decimal, Decimal),
+}
+
+
+class CursorPage(object):
+    """ 游标分页结果 """
+
+    def __init__(
+            self,
+            *,
+            items: t.List[t.Any],
+            page_size: int,
+            next_cursor: t.Optional[t.Text] = None,
+            prev_cursor: t.Optional[t.Text] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param items: 当前数据
+        @param page_size: 分页大小
+        @param next_cursor: 下页游标
+        @param prev_cursor: 上页游标
+        """
+        self.items = items
+        self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        """ 遍历当前数据
+
+        @return: t.Iterator[t.Any]
+        """
+        return iter(self.items)
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'items': self.items,
+            'page_size': self.page_size,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor
+        }
+
+
+class PageResult(object):
+    """ 页码分页结果 """
+
+    def __init__(
+            self,
+            *,
+            items: t.List[t.Any],
+            page: int,
+            page_size: int,
+            has_next: bool,
+            total: t.Optional[int] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param items: 当前数据
+        @param page: 分页页码
+        @param page_size: 分页大小
+        @param has_next: 有下一页
+        @param total: 数据总数, 未统计时为None
+        """
+        self.items = items
+        self.page = page
+        self.page_size = page_size
+        self.has_next = has_next
+        self.has_prev = page > 1
+        self.total = total
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        """ 遍历当前数据
+
+        @return: t.Iterator[t.Any]
+        """
+        return iter(self.items)
+
+    @property
+    def pages(self) -> t.Optional[int]:
+        """ 总的页数
+
+        @return: t.Optional[int]
+        """
+        if self.total is None: return None
+        return (self.total + self.page_size - 1) // self.page_size
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'items': self.items,
+            'page': self.page,
+            'page_size': self.page_size,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'total': self.total,
+            'pages': self.pages
+        }
+
+
+def support_window(dialect: Dialect) -> bool:
+    """ 是否支持窗口函数
+
+    @param dialect: 数据库方言
+    @return: bool
+    """
+    version = dialect.server_version_info or ()
+    if dialect.name == 'sqlite':
+        return sqlite_version_info >= (3, 25)
+    if dialect.name == 'mysql' and getattr(dialect, 'is_mariadb', False):
+        return version >= (10, 2)
+    if dialect.name == 'mysql':
+        return version >= (8,)
+    return dialect.name in ('postgresql', 'mssql', 'oracle')
+
+
+def count_queryset(queryset: Query) -> int:
+    """ 统计数据总数
+
+    去掉排序和预加载后再包装为子查询统计, 统计查询沿用数据查询的执行选项(如临时表IN列表)
+
+    @param queryset: 查询对象
+    @return: int
+    """
+    queryset = queryset.order_by(None).enable_eagerloads(False)
+    subquery = queryset.subquery()
+    options = queryset.get_execution_options()
+    counter = queryset.session.query(func.count()).select_from(subquery)
+    return counter.execution_options(**options).scalar()
+
+
+def dump_cursor_value(value: t.Any) -> t.Any:
+    """ 序列化游标值
+
+    @param value: 排序键值
+    @return: t.Any
+    """
+    # 注意: datetime是date的子类, 需按声明顺序优先匹配
+    for tag, (klass, _) in cursor_types.items():
+        if isinstance(value, klass):
+            return {tag: str(value) if klass is Decimal else value.isoformat()}
+    return value
+
+
+def load_cursor_value(value: t.Any) -> t.Any:
+    """ 反序列化游标值
+
+    @param value: 排序键值
+    @return: t.Any
+    """
+    if isinstance(value, dict) and len(value) == 1:
+        tag, data = next(iter(value.items()))
+        _, loads = cursor_types[tag]
+        return loads(data)
+    return value
+
+
+def encode_cursor(values: t.Sequence[t.Any], direction: t.Text) -> t.Text:
+    """ 生成游标
+
+    @param values: 排序键值
+    @param direction: 翻页方向
+    @return: t.Text
+    """
+    data = {'d': direction, 'v': [dump_cursor_value(v) for v in values]}
+    data = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: t.Text, size: int) -> t.Tuple[t.List[t.Any], t.Text]:
+    """ 解析游标
+
+    @param cursor: 游标
+    @param size: 排序键数
+    @return: t.Tuple[t.List[t.Any], t.Text]
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(data)
+        values = [load_cursor_value(v) for v in data['v']]
+        direction = data['d']
+    except (binascii.Error, ArithmeticError, ValueError, TypeError, KeyError):
+        errs = f'invalid cursor {cursor}'
+        raise ValidationError(errormsg=errs)
+    if direction not in (NEXT, PREV) or len(values) != size:
+        errs = f'invalid cursor {cursor}'
+        raise ValidationError(errormsg=errs)
+    return values, direction
+
+
+def make_sort_keys(queryset: Query, order_by: t.List[t.Any]) -> t.List[t.Tuple[t.Any, bool]]:
+    """ 生成排序键
+
+    自动追加主实体的主键作为唯一的排序键
+
+    @param queryset: 查询对象
+    @param order_by: 排序字段
+    @return: t.List[t.Tuple[t.Any, bool]]
+    """
+    keys = []
+    for field in order_by:
+        if isinstance(field, UnaryExpression) and field.modifier is operators.desc_op:
+            keys.append((field.element, True))
+        elif isinstance(field, UnaryExpression) and field.modifier is operators.asc_op:
+            keys.append((field.element, False))
+        else:
+            keys.append((getattr(field, 'expression', field), False))
+    entity = None
+    for desc in queryset.column_descriptions:
+        entity = desc['entity']
+        if entity is not None: break
+    if entity is None:
+        errs = 'cursor pagination must query a model'
+        raise ValidationError(errormsg=errs)
+    for column in inspect(entity).primary_key:
+        if any(column.compare(k) for k, _ in keys): continue
+        keys.append((column, False))
+    return keys
+
+
+def is_nullable(key: t.Any) -> bool:
+    """ 排序键是否可能为NULL
+
+    非字段的表达式无法判断, 按可为NULL处理
+
+    @param key: 排序键
+    @return: bool
+    """
+    return getattr(key, 'nullable', True) is not False
+
+
+def make_sort_orders(keys: t.List[t.Tuple[t.Any, bool]], reverse: bool = False) -> t.List[t.Any]:
+    """ 生成排序条件
+
+    各方言NULL的默认排序位置不同, 可为NULL的排序键统一视NULL为最大值
+
+    @param keys: 排序键
+    @param reverse: 是否反转
+    @return: t.List[t.Any]
+    """
+    orders = []
+    for key, desc in keys:
+        desc = desc ^ reverse
+        if is_nullable(key):
+            nulls = case((key.is_(None), 1), else_=0)
+            orders.append(nulls.desc() if desc else nulls.asc())
+        orders.append(key.desc() if desc else key.asc())
+    return orders
+
+
+def make_seek_clause(key: t.Any, value: t.Any, after: bool) -> t.Any:
+    """ 生成单个排序键的定位条件
+
+    与make_sort_orders一致, 可为NULL的排序键视NULL为最大值
+
+    @param key: 排序键
+    @param value: 排序键值
+    @param after: 是否定位到该值之后(更大)
+    @return: t.Any
+    """
+    if not is_nullable(key):
+        return key > value if after else key < value
+    if value is None:
+        return false() if after else key.isnot(None)
+    return or_(key > value, key.is_(None)) if after else key < value
+
+
+def make_seek_filter(
+        keys: t.List[t.Tuple[t.Any, bool]],
+        values: t.List[t.Any],
+        direction: t.Text
+) -> BooleanClauseList:
+    """ 生成定位条件
+
+    (a, b) > (x, y) 展开为 a > x or (a = x and b > y), 排序键值为NULL时按NULL最大处理
+
+    @param keys: 排序键
+    @param values: 排序键值
+    @param direction: 翻页方向
+    @return: BooleanClauseList
+    """
+    clauses = []
+    for index, (key, desc) in enumerate(keys):
+        value = values[index]
+        # 注意: k == None 编译为 k IS NULL
+        equals = [k == v for (k, _), v in zip(keys[:index], values[:index])]
+        # 向前翻页时比较方向相反
+        after = desc if direction == PREV else not desc
+        seek = make_seek_clause(key, value, after)
+        clauses.append(and_(*equals, seek))
+    return or_(*clauses)
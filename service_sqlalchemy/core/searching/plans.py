@@ -0,0 +1,179 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from threading import Lock
+from types import ModuleType
+from collections import OrderedDict
+from sqlalchemy.orm.query import Query
+
+from .slots import Slot
+from .operators import OperatorMeta
+
+# 注意: 与OperatorSchema.value的校验结果保持一致, 标量会被转换为字符串
+scalar_type = (str, int, float, bool)
+
+
+class SearchPlan(object):
+    """ 查询计划 """
+
+    def __init__(
+            self,
+            key: t.Tuple,
+            values: t.Dict[t.Text, t.Any],
+            payload: t.Dict[t.Text, t.Any]
+    ) -> None:
+        """ 初始化实例
+
+        @param key: 查询形状
+        @param values: 绑定参数
+        @param payload: 查询模版
+        """
+        self.key = key
+        self.values = values
+        self.payload = payload
+
+
+class PlanCache(object):
+    """ 查询计划缓存(LRU) """
+
+    def __init__(self, maxsize: t.Optional[int] = 512) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大容量, 0表示关闭缓存
+        """
+        self.maxsize = maxsize or 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 未命中时编译耗时的累计秒数
+        self.compile_seconds = 0.0
+        self._lock = Lock()
+        self._plans = OrderedDict()
+
+    def __len__(self) -> int:
+        """ 缓存数量
+
+        @return: int
+        """
+        return len(self._plans)
+
+    def get(self, key: t.Tuple) -> t.Optional[Query]:
+        """ 获取查询计划
+
+        @param key: 查询形状
+        @return: t.Optional[Query]
+        """
+        with self._lock:
+            queryset = self._plans.get(key, None)
+            if queryset is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._plans.move_to_end(key)
+            return queryset
+
+    def set(self, key: t.Tuple, queryset: Query, seconds: t.Optional[float] = 0.0) -> None:
+        """ 保存查询计划
+
+        @param key: 查询形状
+        @param queryset: 查询对象
+        @param seconds: 编译耗时
+        @return: None
+        """
+        with self._lock:
+            self.compile_seconds += seconds or 0.0
+            if not self.maxsize:
+                return
+            self._plans[key] = queryset
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """ 清空查询计划
+
+        @return: None
+        """
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 缓存统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            average = self.compile_seconds / self.misses if self.misses else 0.0
+            return {
+                'size': len(self._plans),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'compile_seconds': self.compile_seconds,
+                # 按未命中时的平均编译耗时估算命中节省的时间
+                'saved_seconds': average * self.hits
+            }
+
+
+def make_shape(node: t.Any, values: t.Dict[t.Text, t.Any]) -> t.Tuple[t.Any, t.Any]:
+    """ 计算节点形状
+
+    可绑定操作的标量值会被替换为Slot并记录到values
+
+    @param node: 查询节点
+    @param values: 绑定参数
+    @return: t.Tuple[t.Any, t.Any]
+    """
+    if isinstance(node, list):
+        items = [make_shape(item, values) for item in node]
+        shape = ('[',) + tuple(s for s, _ in items)
+        return shape, [n for _, n in items]
+    if not isinstance(node, dict):
+        return (type(node).__name__, node), node
+    op, param = node.get('op', None), node.get('param', None)
+    Operator = OperatorMeta.mapping.get(op, None) if isinstance(op, str) else None
+    bindable = (
+            Operator is not None
+            and isinstance(param, (dict, type(None)))
+            and Operator.can_bind(param)
+    )
+    shape, data = ['{'], {}
+    for k in sorted(node):
+        v = node[k]
+        if k == 'value' and bindable and isinstance(v, scalar_type):
+            key = f'search_slot_{len(values)}'
+            # 注意: 与OperatorSchema.value的校验结果保持一致
+            v = v if isinstance(v, str) else str(v)
+            values[key] = v
+            shape.append((k, '?'))
+            data[k] = Slot(key, v)
+            continue
+        s, data[k] = make_shape(v, values)
+        shape.append((k, s))
+    return tuple(shape), data
+
+
+def make_plan(
+        *,
+        module: ModuleType,
+        **payload: t.Any
+) -> SearchPlan:
+    """ 生成查询计划
+
+    @param module: 模块对象
+    @param payload: 查询参数
+    @return: SearchPlan
+    """
+    shape, values = [module.__name__], {}
+    template = {}
+    for name in sorted(payload):
+        s, template[name] = make_shape(payload[name], values)
+        shape.append((name, s))
+    return SearchPlan(tuple(shape), values, template)
@@ -0,0 +1,259 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from threading import Lock
+from types import ModuleType
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Mapper
+from sqlalchemy import Table
+from sqlalchemy.types import Boolean
+from sqlalchemy.orm.util import AliasedInsp
+from sqlalchemy.orm.properties import ColumnProperty
+from sqlalchemy.orm.relationships import RelationshipProperty
+from service_sqlalchemy.exception import ValidationError
+
+# 名称类型
+MODEL, COLUMN, RELATIONSHIP, DESCRIPTOR = 'model', 'column', 'relationship', 'descriptor'
+
+
+class FieldPath(object):
+    """ 名称解析结果 """
+
+    __slots__ = ('name', 'model', 'attribute', 'kind', 'python_type', 'relationships')
+
+    def __init__(
+            self,
+            name: t.Text,
+            model: t.Any,
+            attribute: t.Any,
+            kind: t.Text,
+            python_type: t.Optional[t.Type] = None,
+            relationships: t.Optional[t.Tuple[FieldPath, ...]] = ()
+    ) -> None:
+        """ 初始化实例
+
+        @param name: 完整名称
+        @param model: 所属模型
+        @param attribute: 模型或字段
+        @param kind: 名称类型, model/column/relationship/descriptor
+        @param python_type: 对应的Python类型, 关系为目标模型, 无法推断时为None
+        @param relationships: 点分路径中途经的关系
+        """
+        self.name = name
+        self.model = model
+        self.attribute = attribute
+        self.kind = kind
+        self.python_type = python_type
+        self.relationships = relationships
+
+    @property
+    def uselist(self) -> bool:
+        """ 是否为一对多/多对多关系
+
+        @return: bool
+        """
+        return self.kind == RELATIONSHIP and self.attribute.property.uselist
+
+    def wrap(self, expr: t.Any) -> t.Any:
+        """ 将关联模型上的条件包装为EXISTS子查询
+
+        User.roles.name eq x 等价于 User.roles.any(Role.name == x), 非条件表达式(如field/label)原样返回, 需自行联表
+
+        @param expr: 条件表达式
+        @return: t.Any
+        """
+        if not isinstance(getattr(expr, 'type', None), Boolean):
+            return expr
+        for relationship in reversed(self.relationships):
+            attribute = relationship.attribute
+            expr = attribute.any(expr) if relationship.uselist else attribute.has(expr)
+        return expr
+
+    def __repr__(self) -> t.Text:
+        """ 调试信息
+
+        @return: t.Text
+        """
+        return f'<FieldPath {self.name} {self.kind}>'
+
+
+def load_python_type(prop: t.Any) -> t.Optional[t.Type]:
+    """ 推断属性的Python类型
+
+    @param prop: 映射属性
+    @return: t.Optional[t.Type]
+    """
+    if isinstance(prop, RelationshipProperty):
+        return prop.mapper.class_
+    columns = getattr(prop, 'columns', None) or [prop]
+    try:
+        return columns[0].type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+class ModelRegistry(object):
+    """ 模型名称注册表
+
+    一次性从模块中的映射类/别名/表收集模型, 字段, 关系及其Python类型, 之后的名称解析均为字典查找
+    """
+
+    def __init__(self, module: ModuleType, max_paths: t.Optional[int] = 4096) -> None:
+        """ 初始化实例
+
+        @param module: 模块对象
+        @param max_paths: 缓存的多级路径数上限, 防止关系环路构造出无穷多的路径
+        """
+        self.module = module
+        self.max_paths = max_paths
+        # 模型名称 => 模型
+        self.models = {}
+        # 模型 => {字段名称 => FieldPath}
+        self.fields = {}
+        # 完整名称 => FieldPath
+        self.paths = {}
+        for name, value in list(vars(module).items()):
+            if name.startswith('_'): continue
+            self.add_model(name, value)
+
+    def add_model(self, name: t.Text, value: t.Any) -> None:
+        """ 注册模型
+
+        @param name: 模型名称
+        @param value: 模块属性
+        @return: None
+        """
+        if isinstance(value, Table):
+            self.models[name] = value
+            self.paths[name] = FieldPath(name, value, value, MODEL, None)
+            return
+        insp = inspect(value, raiseerr=False)
+        # 注意: 映射类自身才注册, 实例等其它可检查对象跳过
+        if isinstance(insp, Mapper) and insp.class_ is value or isinstance(insp, AliasedInsp):
+            self.models[name] = value
+            self.paths[name] = FieldPath(name, value, value, MODEL, getattr(insp, 'class_', None))
+            for key, path in self.load_fields(value).items():
+                self.paths[f'{name}.{key}'] = path
+
+    def load_fields(self, model: t.Any) -> t.Dict[t.Text, FieldPath]:
+        """ 收集模型的字段
+
+        @param model: 模型
+        @return: t.Dict[t.Text, FieldPath]
+        """
+        fields = self.fields.get(model, None)
+        if fields is not None:
+            return fields
+        fields = {}
+        if isinstance(model, Table):
+            for column in model.c:
+                fields[column.key] = FieldPath(column.key, model, column, COLUMN, load_python_type(column))
+            self.fields[model] = fields
+            return fields
+        mapper = inspect(model).mapper
+        # 注意: 访问attrs会触发映射配置, backref等关系在配置后才存在
+        attrs = mapper.attrs
+        for key in mapper.all_orm_descriptors.keys():
+            prop = attrs.get(key, None)
+            try:
+                attribute = getattr(model, key)
+            except Exception:
+                # 无法在类上求值的描述符(如未定义expression的hybrid)不可用于查询
+                continue
+            if isinstance(prop, RelationshipProperty):
+                kind = RELATIONSHIP
+            elif isinstance(prop, ColumnProperty):
+                kind = COLUMN
+            else:
+                kind = DESCRIPTOR
+            python_type = load_python_type(prop) if prop is not None else None
+            fields[key] = FieldPath(key, model, attribute, kind, python_type)
+        self.fields[model] = fields
+        return fields
+
+    def resolve(self, name: t.Text) -> FieldPath:
+        """ 解析名称
+
+        支持Model, Model.field和经由关系的多级路径Model.relationship.field
+
+        @param name: 完整名称
+        @return: FieldPath
+        """
+        path = self.paths.get(name, None)
+        if path is not None:
+            return path
+        if not isinstance(name, str):
+            errs = f'{name!r} must be [Model].[Field]'
+            raise ValidationError(errormsg=errs)
+        model_name, *field_names = name.split('.')
+        model = self.models.get(model_name, None)
+        if model is None:
+            errs = f'unknown model {model_name} in {name}'
+            raise ValidationError(errormsg=errs)
+        if not field_names or not all(field_names):
+            errs = f'{name} must be [Model].[Field]'
+            raise ValidationError(errormsg=errs)
+        relationships, current, path = [], model, None
+        for index, field_name in enumerate(field_names):
+            if path is not None:
+                if path.kind != RELATIONSHIP:
+                    errs = f'{path.name} in {name} is not a relationship'
+                    raise ValidationError(errormsg=errs)
+                relationships.append(path)
+                current = path.python_type
+            path = self.load_fields(current).get(field_name, None)
+            if path is None:
+                model_desc = model_name if index == 0 else current.__name__
+                errs = f'unknown field {field_name} of {model_desc} in {name}'
+                raise ValidationError(errormsg=errs)
+        path = FieldPath(
+            name, path.model, path.attribute, path.kind, path.python_type, tuple(relationships)
+        )
+        len(self.paths) < self.max_paths and self.paths.setdefault(name, path)
+        return path
+
+
+# 模块 => 注册表
+registries = {}
+registries_lock = Lock()
+
+
+def get_registry(module: ModuleType) -> ModelRegistry:
+    """ 获取模块的注册表
+
+    @param module: 模块对象
+    @return: ModelRegistry
+    """
+    registry = registries.get(module, None)
+    if registry is not None:
+        return registry
+    # 注意: 构建时可能触发映射配置事件, 先构建再保存
+    registry = ModelRegistry(module)
+    with registries_lock:
+        return registries.setdefault(module, registry)
+
+
+def resolve_field(module: ModuleType, name: t.Text) -> FieldPath:
+    """ 解析模块中的名称
+
+    @param module: 模块对象
+    @param name: 完整名称
+    @return: FieldPath
+    """
+    return get_registry(module).resolve(name)
+
+
+@event.listens_for(Mapper, 'after_configured')
+def clear_registries() -> None:
+    """ 映射重新配置后(如新增模型或关系)清空注册表
+
+    @return: None
+    """
+    with registries_lock:
+        registries.clear()
@@ -0,0 +1,638 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import abc
+import hmac
+import json
+import pickle
+import typing as t
+import hashlib
+
+from threading import Lock
+from time import monotonic
+from types import ModuleType
+from itertools import chain
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.expression import TableClause
+
+# 会话中待失效的表
+CHANGED_TABLES = 'changed_tables'
+# 缓存值中签名的长度
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+def load_tables(statement: t.Any) -> t.List[t.Text]:
+    """ 收集语句涉及的表
+
+    包括联表以及经由关系生成的EXISTS子查询中的表
+
+    @param statement: 查询语句
+    @return: t.List[t.Text]
+    """
+    return sorted({e.fullname for e in visitors.iterate(statement) if isinstance(e, TableClause)})
+
+
+def load_changed(session: Session) -> t.Set[t.Text]:
+    """ 加载会话中写入过的表
+
+    @param session: 数据会话
+    @return: t.Set[t.Text]
+    """
+    return session.info.get(CHANGED_TABLES, set())
+
+
+def load_pending(session: Session) -> t.Set[t.Text]:
+    """ 加载会话中尚未刷新的写入涉及的表
+
+    包括多对多的关联表
+
+    @param session: 数据会话
+    @return: t.Set[t.Text]
+    """
+    tables = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        mapper = inspect(instance).mapper
+        tables.update(t.fullname for t in mapper.tables)
+        tables.update(r.secondary.fullname for r in mapper.relationships if isinstance(r.secondary, TableClause))
+    return tables
+
+
+def mark_changed(session: Session, tables: t.Iterable[t.Any]) -> None:
+    """ 标记会话中写入的表, 提交后失效相关的缓存
+
+    不经过会话事件的写入(如bulk_insert_mappings)需要自行标记
+
+    @param session: 数据会话
+    @param tables: 表对象或名称
+    @return: None
+    """
+    changed = session.info.setdefault(CHANGED_TABLES, set())
+    changed.update(t if isinstance(t, str) else t.fullname for t in tables)
+
+
+def on_transaction_end(session: Session, transaction: t.Any) -> None:
+    """ 会话事务结束事件, 最外层事务提交或回滚后清除写入标记
+
+    注意: 晚于after_commit触发, 其它缓存可在提交事件中读取同一份标记
+
+    @param session: 数据会话
+    @param transaction: 结束的事务
+    @return: None
+    """
+    transaction.parent is None and session.info.pop(CHANGED_TABLES, None)
+
+
+class ResultBackend(abc.ABC):
+    """ 结果缓存后端
+
+    值均为序列化后的bytes, 表版本号需要在进程间共享时使用外部存储
+    """
+
+    @abc.abstractmethod
+    def get(self, key: t.Text) -> t.Optional[bytes]:
+        """ 获取缓存
+
+        @param key: 缓存键
+        @return: t.Optional[bytes]
+        """
+        pass
+
+    @abc.abstractmethod
+    def set(self, key: t.Text, value: bytes, ttl: t.Optional[float] = None) -> None:
+        """ 保存缓存
+
+        @param key: 缓存键
+        @param value: 缓存值
+        @param ttl: 过期秒数, None表示不过期
+        @return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key: t.Text) -> None:
+        """ 删除缓存
+
+        @param key: 缓存键
+        @return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def versions(self, keys: t.List[t.Text]) -> t.List[int]:
+        """ 获取表版本号
+
+        @param keys: 版本键
+        @return: t.List[int]
+        """
+        pass
+
+    @abc.abstractmethod
+    def incr(self, key: t.Text) -> int:
+        """ 递增表版本号
+
+        @param key: 版本键
+        @return: int
+        """
+        pass
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        pass
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 后端统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {}
+
+
+class MemoryBackend(ResultBackend):
+    """ 进程内缓存(LRU + TTL) """
+
+    def __init__(self, maxsize: t.Optional[int] = 1024) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大容量
+        """
+        self.maxsize = maxsize or 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = Lock()
+        # 缓存键 => (过期时间, 缓存值)
+        self._items = OrderedDict()
+        # 版本键 => 版本号, 不参与淘汰
+        self._versions = {}
+
+    def get(self, key: t.Text) -> t.Optional[bytes]:
+        """ 获取缓存
+
+        @param key: 缓存键
+        @return: t.Optional[bytes]
+        """
+        with self._lock:
+            item = self._items.get(key, None)
+            if item is None:
+                return None
+            if item[0] is not None and item[0] <= monotonic():
+                del self._items[key]
+                self.expirations += 1
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key: t.Text, value: bytes, ttl: t.Optional[float] = None) -> None:
+        """ 保存缓存
+
+        @param key: 缓存键
+        @param value: 缓存值
+        @param ttl: 过期秒数, None表示不过期
+        @return: None
+        """
+        with self._lock:
+            if not self.maxsize:
+                return
+            self._items[key] = (None if ttl is None else monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: t.Text) -> None:
+        """ 删除缓存
+
+        @param key: 缓存键
+        @return: None
+        """
+        with self._lock:
+            self._items.pop(key, None)
+
+    def versions(self, keys: t.List[t.Text]) -> t.List[int]:
+        """ 获取表版本号
+
+        @param keys: 版本键
+        @return: t.List[int]
+        """
+        with self._lock:
+            return [self._versions.get(k, 0) for k in keys]
+
+    def incr(self, key: t.Text) -> int:
+        """ 递增表版本号
+
+        @param key: 版本键
+        @return: int
+        """
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 后端统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'maxsize': self.maxsize,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class LocalStore(object):
+    """ 外部存储的本地替身
+
+    实现StoreBackend用到的get/set/delete/mget/incr, 参数与redis-py保持一致, 用于开发和测试
+    """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self._lock = Lock()
+        # 键 => (过期时间, 值)
+        self._data = {}
+
+    def get(self, name: t.Text) -> t.Optional[t.Any]:
+        """ 获取值
+
+        @param name: 键
+        @return: t.Optional[t.Any]
+        """
+        with self._lock:
+            item = self._data.get(name, None)
+            if item is None:
+                return None
+            if item[0] is not None and item[0] <= monotonic():
+                del self._data[name]
+                return None
+            return item[1]
+
+    def mget(self, keys: t.List[t.Text]) -> t.List[t.Optional[t.Any]]:
+        """ 批量获取值
+
+        @param keys: 键列表
+        @return: t.List[t.Optional[t.Any]]
+        """
+        return [self.get(k) for k in keys]
+
+    def set(self, name: t.Text, value: t.Any, px: t.Optional[int] = None) -> None:
+        """ 设置值
+
+        @param name: 键
+        @param value: 值
+        @param px: 过期毫秒数
+        @return: None
+        """
+        with self._lock:
+            self._data[name] = (None if px is None else monotonic() + px / 1000, value)
+
+    def delete(self, *names: t.Text) -> None:
+        """ 删除值
+
+        @param names: 键列表
+        @return: None
+        """
+        with self._lock:
+            for name in names: self._data.pop(name, None)
+
+    def incr(self, name: t.Text) -> int:
+        """ 递增整数值
+
+        @param name: 键
+        @return: int
+        """
+        with self._lock:
+            item = self._data.get(name, None)
+            value = int(item[1]) + 1 if item is not None else 1
+            self._data[name] = (None, value)
+            return value
+
+    def flushdb(self) -> None:
+        """ 清空数据
+
+        @return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+
+class StoreBackend(ResultBackend):
+    """ 外部存储缓存
+
+    store需提供get/set(px=)/delete/mget/incr, 如redis.Redis, 未指定时使用本地替身LocalStore;
+    淘汰交由外部存储自身的策略(如maxmemory-policy)
+    """
+
+    def __init__(self, store: t.Optional[t.Any] = None) -> None:
+        """ 初始化实例
+
+        @param store: 外部存储客户端
+        """
+        self.store = LocalStore() if store is None else store
+
+    def get(self, key: t.Text) -> t.Optional[bytes]:
+        """ 获取缓存
+
+        @param key: 缓存键
+        @return: t.Optional[bytes]
+        """
+        return self.store.get(key)
+
+    def set(self, key: t.Text, value: bytes, ttl: t.Optional[float] = None) -> None:
+        """ 保存缓存
+
+        @param key: 缓存键
+        @param value: 缓存值
+        @param ttl: 过期秒数, None表示不过期
+        @return: None
+        """
+        self.store.set(key, value, px=None if ttl is None else max(int(ttl * 1000), 1))
+
+    def delete(self, key: t.Text) -> None:
+        """ 删除缓存
+
+        @param key: 缓存键
+        @return: None
+        """
+        self.store.delete(key)
+
+    def versions(self, keys: t.List[t.Text]) -> t.List[int]:
+        """ 获取表版本号
+
+        @param keys: 版本键
+        @return: t.List[int]
+        """
+        return [int(v or 0) for v in self.store.mget(keys)] if keys else []
+
+    def incr(self, key: t.Text) -> int:
+        """ 递增表版本号
+
+        @param key: 版本键
+        @return: int
+        """
+        return self.store.incr(key)
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        注意: 外部存储可能被共享, 只有本地替身支持清空
+
+        @return: None
+        """
+        isinstance(self.store, LocalStore) and self.store.flushdb()
+
+
+class ResultCache(object):
+    """ 查询结果缓存
+
+    以别名, 模块和规范化后的查询参数为键, 缓存序列化后的结果以及涉及的表在查询前的版本号;
+    会话提交时递增写入过的表的版本号, 读取时版本号不一致的缓存视为过期;
+    缓存值带有HMAC签名, 签名不一致时不反序列化, 外部存储被多个进程共享时需配置相同的secret
+    """
+
+    def __init__(
+            self,
+            *,
+            namespace: t.Text,
+            backend: t.Optional[ResultBackend] = None,
+            maxsize: t.Optional[int] = 1024,
+            ttl: t.Optional[float] = 60,
+            secret: t.Optional[t.Union[t.Text, bytes]] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param namespace: 命名空间, 通常为配置别名
+        @param backend: 缓存后端, 默认为进程内缓存
+        @param maxsize: 进程内缓存的最大容量
+        @param ttl: 默认的过期秒数
+        @param secret: 签名密钥, 默认为进程内随机生成, 其它进程写入的缓存不会命中
+        """
+        self.namespace = namespace
+        self.backend = MemoryBackend(maxsize) if backend is None else backend
+        self.ttl = ttl
+        self.secret = os.urandom(32) if secret is None else secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.hits = 0
+        self.misses = 0
+        # 因表版本号变化而失效的缓存数
+        self.stales = 0
+        # 签名校验失败而丢弃的缓存数
+        self.rejects = 0
+        # 提交后递增版本号的表数
+        self.invalidations = 0
+        self._lock = Lock()
+
+    def make_key(self, module: ModuleType, payload: t.Dict[t.Text, t.Any]) -> t.Optional[t.Text]:
+        """ 计算缓存键
+
+        @param module: 模块对象
+        @param payload: 查询参数
+        @return: t.Optional[t.Text]
+        """
+        try:
+            data = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        return f'{self.namespace}:result:{module.__name__}:{digest}'
+
+    def version_keys(self, tables: t.List[t.Text]) -> t.List[t.Text]:
+        """ 表版本键
+
+        @param tables: 表名列表
+        @return: t.List[t.Text]
+        """
+        return [f'{self.namespace}:table:{name}' for name in tables]
+
+    def sign(self, data: bytes) -> bytes:
+        """ 计算签名
+
+        @param data: 序列化后的数据
+        @return: bytes
+        """
+        return hmac.new(self.secret, data, hashlib.sha256).digest()
+
+    def dumps(self, value: t.Any) -> bytes:
+        """ 序列化并签名
+
+        @param value: 缓存值
+        @return: bytes
+        """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.sign(data) + data
+
+    def loads(self, value: bytes) -> t.Optional[t.Any]:
+        """ 校验签名并反序列化
+
+        注意: 外部存储中的数据可能被篡改, 签名不一致时不能交给pickle
+
+        @param value: 缓存值
+        @return: t.Optional[t.Any]
+        """
+        signature, data = value[:SIGNATURE_SIZE], value[SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, self.sign(data)):
+            return None
+        return pickle.loads(data)
+
+    def get(self, key: t.Text) -> t.Optional[t.List[t.Any]]:
+        """ 获取查询结果
+
+        @param key: 缓存键
+        @return: t.Optional[t.List[t.Any]]
+        """
+        value = self.backend.get(key)
+        if value is None:
+            self.count('misses')
+            return None
+        value = self.loads(value)
+        if value is None:
+            self.count('rejects')
+            self.count('misses')
+            return None
+        tables, versions, rows = value
+        if self.backend.versions(self.version_keys(tables)) != versions:
+            self.backend.delete(key)
+            self.count('stales')
+            self.count('misses')
+            return None
+        self.count('hits')
+        return rows
+
+    def fetch(self, key: t.Optional[t.Text], queryset: Query, ttl: t.Optional[float] = None) -> t.List[t.Any]:
+        """ 获取查询结果, 未命中时执行查询并缓存
+
+        注意: 命中时返回反序列化后的新对象, 模型实例处于游离状态; 会话中存在未提交的同表写入时
+        既不读取也不写入缓存, 避免读到其它会话的缓存中没有本会话的写入, 以及回滚后缓存中留下不存在的数据
+
+        @param key: 缓存键, 为None时不缓存
+        @param queryset: 查询对象
+        @param ttl: 过期秒数, 默认使用初始化时的设置
+        @return: t.List[t.Any]
+        """
+        if key is None:
+            return queryset.all()
+        session = queryset.session
+        changed = load_changed(session) | load_pending(session)
+        # 注意: 命中时的热路径上只在会话有写入时才收集语句涉及的表
+        tables = load_tables(queryset.statement) if changed else None
+        if tables is not None and not changed.isdisjoint(tables):
+            return queryset.all()
+        rows = self.get(key)
+        if rows is not None:
+            return rows
+        tables = load_tables(queryset.statement) if tables is None else tables
+        # 注意: 在查询前读取版本号, 查询期间提交的写入会使本次缓存立即过期
+        versions = self.backend.versions(self.version_keys(tables))
+        rows = queryset.all()
+        self.backend.set(key, self.dumps((tables, versions, rows)), self.ttl if ttl is None else ttl)
+        return rows
+
+    def invalidate(self, tables: t.Iterable[t.Text]) -> None:
+        """ 失效涉及这些表的缓存
+
+        @param tables: 表名列表
+        @return: None
+        """
+        tables = list(tables)
+        for key in self.version_keys(tables): self.backend.incr(key)
+        self.count('invalidations', len(tables))
+
+    def count(self, name: t.Text, value: t.Optional[int] = 1) -> None:
+        """ 累加计数
+
+        @param name: 计数名称
+        @param value: 增量
+        @return: None
+        """
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def install(self, factory: sessionmaker) -> None:
+        """ 安装会话事件
+
+        @param factory: 会话工厂
+        @return: None
+        """
+        event.listen(factory, 'after_flush', self.on_after_flush)
+        event.listen(factory, 'do_orm_execute', self.on_do_orm_execute)
+        event.listen(factory, 'after_commit', self.on_after_commit)
+        event.listen(factory, 'after_transaction_end', on_transaction_end)
+
+    def on_after_flush(self, session: Session, context: t.Any) -> None:
+        """ 会话刷新事件, 记录工作单元写入的表及多对多的关联表
+
+        @param session: 数据会话
+        @param context: 刷新上下文
+        @return: None
+        """
+        tables = load_pending(session)
+        tables and mark_changed(session, tables)
+
+    def on_do_orm_execute(self, state: t.Any) -> None:
+        """ 会话执行事件, 记录通过session.execute执行的INSERT/UPDATE/DELETE写入的表
+
+        @param state: 执行状态
+        @return: None
+        """
+        statement = state.statement
+        if not isinstance(statement, UpdateBase):
+            return
+        table = getattr(statement, 'table', None)
+        isinstance(table, TableClause) and mark_changed(state.session, [table])
+
+    def on_after_commit(self, session: Session) -> None:
+        """ 会话提交事件
+
+        注意: 提交SAVEPOINT时同样会触发, 只有最外层事务提交后写入才对其它会话可见
+
+        @param session: 数据会话
+        @return: None
+        """
+        if session.in_nested_transaction():
+            return
+        tables = load_changed(session)
+        tables and self.invalidate(tables)
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        self.backend.clear()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 缓存统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stales': self.stales,
+                'rejects': self.rejects,
+                'invalidations': self.invalidations
+            }
+        return stats | self.backend.stats()
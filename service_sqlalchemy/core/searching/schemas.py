@@ -43,6 +43,7 @@ class OperatorSchema(BaseModel):
     op: t.Text = Field(description='操作名称')
     value: t.Union[
         t.List[t.Union[OperatorSchema, FunctionSchema]],
+        t.List[t.Union[t.Text, int, float, bool, None]],
         t.Text, int, float, bool, None,
         OperatorSchema, FunctionSchema,
     ] = Field(description='字段的值')
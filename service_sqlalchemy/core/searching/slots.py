@@ -0,0 +1,50 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from sqlalchemy.sql import bindparam
+from sqlalchemy.types import NullType
+from sqlalchemy.sql.elements import BindParameter
+
+
+class Slot(str):
+    """ 绑定参数槽位
+
+    继承str是为了能原样穿过FilterSchema等校验
+    """
+
+    def __new__(cls, key: t.Text, value: t.Any) -> Slot:
+        """ 创建实例
+
+        @param key: 参数名称
+        @param value: 参数的值
+        @return: Slot
+        """
+        slot = super(Slot, cls).__new__(cls, key)
+        slot.value = value
+        return slot
+
+    @property
+    def key(self) -> t.Text:
+        """ 参数名称
+
+        @return: t.Text
+        """
+        return str.__str__(self)
+
+    def bind(self, type_: t.Optional[t.Any] = None, op: t.Optional[t.Any] = None) -> BindParameter:
+        """ 生成绑定参数
+
+        注意: 与字面量比较时一致, 按字段类型的coerce_compared_value决定绑定类型, 保留TypeDecorator/Enum等的
+        绑定处理, 同时校验后为字符串的值不会交给Boolean/DateTime等类型处理, 未传入字段类型时使用NullType
+
+        @param type_: 字段的类型
+        @param op: 比较的操作
+        @return: BindParameter
+        """
+        type_ = NullType() if type_ is None else type_.coerce_compared_value(op, self.value)
+        return bindparam(self.key, value=self.value, type_=type_)
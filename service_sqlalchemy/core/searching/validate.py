@@ -0,0 +1,214 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import re
+import json
+import typing as t
+
+from time import perf_counter
+from pydantic import BaseModel
+from service_sqlalchemy.exception import ValidationError
+
+from .plans import PlanCache
+from .schemas import FieldTypeEnum
+from .schemas import FilterSchema
+from .schemas import SearchSchema
+
+# 节点类型
+FILTER, NODE, FIELD, FN_FIELD, VALUE, ITEM, JOIN = 'filter', 'node', 'field', 'fn_field', 'value', 'item', 'join'
+# 注意: 与FilterSchema.o的校验规则保持一致
+condition_regex = re.compile(r'and|or')
+
+
+class SchemaCache(PlanCache):
+    """ 校验结果缓存(LRU)
+
+    以查询参数的结构作为键, 缓存pydantic校验后的数据
+    """
+
+
+def make_key(node: t.Any) -> t.Optional[t.Text]:
+    """ 计算结构键
+
+    JSON能区分3/"3"/true等校验时类型转换不同的值, 无法序列化时返回None
+
+    @param node: 查询参数
+    @return: t.Optional[t.Text]
+    """
+    try:
+        return json.dumps(node, sort_keys=True, separators=(',', ':'), default=repr)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_text(value: t.Any, name: t.Text) -> t.Text:
+    """ 校验文本
+
+    @param value: 原始值
+    @param name: 字段名称
+    @return: t.Text
+    """
+    if isinstance(value, str): return value
+    if isinstance(value, (int, float)): return str(value)
+    errs = f'{name} must be str, got {value!r}'
+    raise ValidationError(errormsg=errs)
+
+
+def load_type(node: t.Dict[t.Text, t.Any]) -> t.Optional[FieldTypeEnum]:
+    """ 校验字段类型
+
+    @param node: 查询节点
+    @return: t.Optional[FieldTypeEnum]
+    """
+    value = node.get('type', FieldTypeEnum.field)
+    if value is None: return None
+    try:
+        return FieldTypeEnum(value)
+    except ValueError:
+        errs = f'type must be one of field/plain, got {value!r}'
+        raise ValidationError(errormsg=errs)
+
+
+def load_param(node: t.Dict[t.Text, t.Any]) -> t.Optional[t.Dict[t.Text, t.Any]]:
+    """ 校验选项
+
+    @param node: 查询节点
+    @return: t.Optional[t.Dict[t.Text, t.Any]]
+    """
+    value = node.get('param', {})
+    if value is None: return None
+    if isinstance(value, dict): return dict(value)
+    errs = f'param must be dict, got {value!r}'
+    raise ValidationError(errormsg=errs)
+
+
+def trusted_validate(data: t.Any, kind: t.Text) -> t.Any:
+    """ 迭代校验受信任的查询参数
+
+    不经过pydantic, 输出与对应Schema的dict()结果一致, 仅用于内部已校验过的参数
+
+    @param data: 查询参数
+    @param kind: 节点类型
+    @return: t.Any
+    """
+    root = {}
+    stack = [(root, 'data', data, kind)]
+    while stack:
+        parent, key, node, kind = stack.pop()
+        if kind in (FN_FIELD, VALUE, FILTER) and isinstance(node, list):
+            # 注意: 列表中的元素只能是操作或函数, 值列表中还可以是标量(如IN列表)
+            parent[key] = [None] * len(node)
+            for i, n in enumerate(node):
+                stack.append((parent[key], i, n, ITEM if kind == VALUE and not isinstance(n, dict) else NODE))
+            continue
+        if kind == ITEM and not isinstance(node, list):
+            parent[key] = None if node is None else load_text(node, 'value')
+            continue
+        if kind in (FIELD, FN_FIELD, VALUE) and not isinstance(node, dict):
+            if node is None and kind == VALUE:
+                parent[key] = None
+            else:
+                parent[key] = load_text(node, 'field' if kind != VALUE else 'value')
+            continue
+        if kind == FILTER and node is None:
+            parent[key] = None
+            continue
+        if not isinstance(node, dict):
+            errs = f'{kind} must be dict, got {node!r}'
+            raise ValidationError(errormsg=errs)
+        if kind == JOIN:
+            must = node.get('must', None)
+            parent[key] = {'model': load_text(node.get('model', None), 'model'), 'must': None, 'param': load_param(node)}
+            must is not None and stack.append((parent[key], 'must', must, NODE))
+            continue
+        if 'field' in node and 'op' in node:
+            parent[key] = {
+                'field': None, 'type': load_type(node),
+                'op': load_text(node['op'], 'op'),
+                'value': None, 'param': load_param(node)
+            }
+            stack.append((parent[key], 'field', node['field'], FIELD))
+            stack.append((parent[key], 'value', node.get('value', None), VALUE))
+            continue
+        if 'field' in node and 'fn' in node:
+            parent[key] = {
+                'field': None, 'type': load_type(node),
+                'fn': load_text(node['fn'], 'fn'), 'param': load_param(node)
+            }
+            stack.append((parent[key], 'field', node['field'], FN_FIELD))
+            continue
+        if kind != FILTER:
+            errs = f'{node!r} must be operator or function'
+            raise ValidationError(errormsg=errs)
+        o = node.get('o', 'and')
+        if not isinstance(o, str) or not condition_regex.match(o):
+            errs = f'o must match and|or, got {o!r}'
+            raise ValidationError(errormsg=errs)
+        parent[key] = {'a': None, 'o': o, 'b': None}
+        stack.append((parent[key], 'a', node.get('a', None), FILTER))
+        stack.append((parent[key], 'b', node.get('b', None), FILTER))
+    return root['data']
+
+
+def trusted_validate_search(data: t.Dict[t.Text, t.Any]) -> t.Dict[t.Text, t.Any]:
+    """ 迭代校验受信任的查询参数
+
+    @param data: 查询参数
+    @return: t.Dict[t.Text, t.Any]
+    """
+    result = {}
+    for name in ('query', 'join', 'group_by', 'order_by'):
+        value = data.get(name, None if name == 'query' else [])
+        if value is None and name != 'query':
+            result[name] = None
+            continue
+        if not isinstance(value, list):
+            errs = f'{name} must be list, got {value!r}'
+            raise ValidationError(errormsg=errs)
+        result[name] = [trusted_validate(v, JOIN if name == 'join' else FIELD) for v in value]
+    for name in ('page', 'page_size'):
+        value = data.get(name, None)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+            errs = f'{name} must be int, got {value!r}'
+            raise ValidationError(errormsg=errs)
+        result[name] = value
+    return result
+
+
+def validate(
+        schema: t.Type[BaseModel],
+        data: t.Dict[t.Text, t.Any],
+        *,
+        trusted: t.Optional[bool] = False,
+        cache: t.Optional[SchemaCache] = None
+) -> t.Dict[t.Text, t.Any]:
+    """ 校验查询参数
+
+    1. 受信任的参数跳过pydantic, 使用迭代校验
+    2. 开启缓存时相同结构的参数只经过一次pydantic校验, 错误信息与pydantic一致
+
+    注意: 返回的数据可能被共享, 调用方不应修改
+
+    @param schema: 校验模式, FilterSchema/SearchSchema
+    @param data: 查询参数
+    @param trusted: 是否受信任
+    @param cache: 校验缓存
+    @return: t.Dict[t.Text, t.Any]
+    """
+    if trusted and schema is FilterSchema:
+        return trusted_validate(data, FILTER)
+    if trusted and schema is SearchSchema:
+        return trusted_validate_search(data)
+    key = make_key(data) if cache is not None and cache.maxsize else None
+    if key is None:
+        return schema(**data).dict()
+    key = (schema.__name__, key)
+    result = cache.get(key)
+    if result is None:
+        start = perf_counter()
+        result = schema(**data).dict()
+        cache.set(key, result, perf_counter() - start)
+    return result
@@ -7,19 +7,91 @@ from __future__ import annotations
 import typing as t
 
 from types import ModuleType
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
+from sqlalchemy import select
+from sqlalchemy import inspect
 from sqlalchemy.orm.query import Query
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import MultipleResultsFound
 from sqlalchemy.ext.declarative import declarative_base
+from service_sqlalchemy.exception import ValidationError
 
+from .upserts import bulk_write
+from .upserts import BulkResult
+from .upserts import make_batches
+from .exports import CSV
+from .exports import ExportResult
+from .exports import export_search
 from .searching import Search
+from .searching.modes import ORM
+from .searching.multi import execute_searches
+from .searching.paging import COUNT
+from .searching.paging import CursorPage
+from .searching.paging import PageResult
+from .replicas import READONLY
 from .dependencies import SQLAlchemy
+from .dependencies import AsyncSQLAlchemy
+from .client import SQLAlchemyClient
+from .client import AsyncSQLAlchemyClient
 from .transaction import safe_transaction
+from .transaction import safe_transaction_async
 
 logger = getLogger(__name__)
 BaseModel = declarative_base()
 
 
+def get_instance(
+        session: SQLAlchemyClient,
+        *,
+        model: BaseModel,
+        query: t.Dict[t.Text, t.Any]
+) -> t.Optional[BaseModel]:
+    """ 单次查询获取实例
+
+    通过LIMIT 2一次查询同时判断是否存在多条数据
+
+    @param session: 数据会话
+    @param model: 目标模型
+    @param query: 查询字典
+    @return: t.Optional[BaseModel]
+    """
+    instances = session.query(model).filter_by(**query).limit(2).all()
+    if len(instances) > 1: raise MultipleResultsFound(f'{model} - {query}')
+    return instances[0] if instances else None
+
+
+def get_cached_instance(
+        orm: SQLAlchemy,
+        session: SQLAlchemyClient,
+        *,
+        model: BaseModel,
+        query: t.Dict[t.Text, t.Any]
+) -> t.Optional[BaseModel]:
+    """ 优先从实体缓存获取实例
+
+    命中时会话中已有该实例则直接返回, 否则将游离实例合并到会话中且不发出查询, 未命中时查询后写入缓存;
+    会话中有未刷新的修改时查询前会先自动刷新, 缓存无法反映这些修改, 直接查询
+
+    @param orm: sqlalchemy
+    @param session: 数据会话
+    @param model: 目标模型
+    @param query: 查询字典
+    @return: t.Optional[BaseModel]
+    """
+    cache = orm.identity_cache
+    if cache is None or session.autoflush and (session.new or session.dirty or session.deleted):
+        return get_instance(session, model=model, query=query)
+    instance = cache.get(session, model, query)
+    if instance is not None:
+        # 注意: 合并会用缓存中可能过时的数据覆盖会话中的实例
+        existing = session.identity_map.get(inspect(instance).key, None)
+        return existing if existing is not None else session.merge(instance, load=False)
+    instance = get_instance(session, model=model, query=query)
+    instance is not None and cache.set(session, instance)
+    return instance
+
+
 def select_or_create(
         orm: SQLAlchemy,
         *,
@@ -29,22 +101,27 @@ def select_or_create(
 ) -> Query:
     """ 查询并创建实例
 
+    命中时只有一次查询且不开启SAVEPOINT, 开启实体缓存时按主键或自然键查找不发出查询,
+    创建时依赖唯一约束处理并发冲突
+
     @param orm: sqlalchemy
     @param model: 目标模型
     @param defaults: 初始字典
     @param query: 查询字典
     @return: Query
     """
-    defaults = defaults or {}
-    with safe_transaction(orm, nested=True, commit=False) as session:
-        queryset = session.query(model).filter_by(**query)
-        if queryset.count() > 1: raise MultipleResultsFound(f'{model} - {query}')
-        instance = queryset.first()
-        if not instance:
-            defaults.update(query)
-            instance = model(**defaults)
+    session = orm.get_client()
+    instance = get_cached_instance(orm, session, model=model, query=query)
+    if instance is not None: return instance
+    try:
+        with safe_transaction(orm, nested=True, commit=True) as session:
+            instance = model(**(defaults or {}) | query)
             session.add(instance)
-            session.commit()
+        return instance
+    except IntegrityError:
+        # 并发创建时唯一约束冲突, 重新查询已创建的实例
+        instance = get_instance(session, model=model, query=query)
+        if instance is None: raise
         return instance
 
 
@@ -57,6 +134,8 @@ def update_or_create(
 ) -> Query:
     """ 更新并创建实例
 
+    查询只有一次, 仅在写入时开启SAVEPOINT, 创建时依赖唯一约束处理并发冲突
+
     @param orm: sqlalchemy
     @param model: 目标模型
     @param defaults: 初始字典
@@ -64,18 +143,75 @@ def update_or_create(
     @return: Query
     """
     defaults = defaults or {}
-    with safe_transaction(orm, nested=True, commit=True) as session:
-        queryset = session.query(model).filter_by(**query)
-        if queryset.count() > 1: raise MultipleResultsFound(f'{model} - {query}')
-        instance = queryset.first()
-        if instance:
-            items = defaults.items()
-            for k, v in items: setattr(instance, k, v)
-        else:
-            defaults.update(query)
-            instance = model(**defaults)
-            session.add(instance)
-        return instance
+    session = orm.get_client()
+    instance = get_instance(session, model=model, query=query)
+    if instance is None:
+        try:
+            with safe_transaction(orm, nested=True, commit=True) as session:
+                instance = model(**defaults | query)
+                session.add(instance)
+            return instance
+        except IntegrityError:
+            # 并发创建时唯一约束冲突, 重新查询后再更新
+            instance = get_instance(session, model=model, query=query)
+            if instance is None: raise
+    if not defaults: return instance
+    with safe_transaction(orm, nested=True, commit=True):
+        items = defaults.items()
+        for k, v in items: setattr(instance, k, v)
+    return instance
+
+
+def bulk_select_or_create(
+        orm: SQLAlchemy,
+        *,
+        model: BaseModel,
+        rows: t.List[t.Dict[t.Text, t.Any]],
+        key_fields: t.List[t.Text],
+        batch_size: t.Optional[int] = 1000
+) -> BulkResult:
+    """ 批量查询并创建实例
+
+    每批通过一次IN查询和一条原生INSERT IGNORE/ON CONFLICT DO NOTHING完成
+
+    @param orm: sqlalchemy
+    @param model: 目标模型
+    @param rows: 数据列表
+    @param key_fields: 唯一字段
+    @param batch_size: 批次大小
+    @return: BulkResult
+    """
+    result = BulkResult()
+    for batch in make_batches(rows, batch_size):
+        with safe_transaction(orm, nested=True, commit=True) as session:
+            bulk_write(session, model=model, rows=batch, key_fields=key_fields, update=False, result=result)
+    return result
+
+
+def bulk_update_or_create(
+        orm: SQLAlchemy,
+        *,
+        model: BaseModel,
+        rows: t.List[t.Dict[t.Text, t.Any]],
+        key_fields: t.List[t.Text],
+        batch_size: t.Optional[int] = 1000
+) -> BulkResult:
+    """ 批量更新并创建实例
+
+    每批通过一次IN查询和一条原生ON DUPLICATE KEY UPDATE/ON CONFLICT DO UPDATE完成
+
+    @param orm: sqlalchemy
+    @param model: 目标模型
+    @param rows: 数据列表
+    @param key_fields: 唯一字段
+    @param batch_size: 批次大小
+    @return: BulkResult
+    """
+    result = BulkResult()
+    for batch in make_batches(rows, batch_size):
+        with safe_transaction(orm, nested=True, commit=True) as session:
+            bulk_write(session, model=model, rows=batch, key_fields=key_fields, update=True, result=result)
+    return result
 
 
 def orm_json_search(
@@ -89,10 +225,16 @@ def orm_json_search(
         having: t.Optional[t.Union[t.Dict, t.List]] = None,
         order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
         page: t.Optional[int] = None,
-        page_size: t.Optional[int] = None
-) -> Query:
+        page_size: t.Optional[int] = None,
+        trusted: t.Optional[bool] = False,
+        cache_results: t.Optional[bool] = False,
+        cache_ttl: t.Optional[float] = None,
+        result_mode: t.Optional[t.Text] = None
+) -> t.Union[Query, t.List[t.Any], t.Dict[t.Text, t.Any]]:
     """ 基于json构建查询
 
+    开启结果缓存或指定结果模式时直接返回查询结果, 未配置result_cache_size时只执行查询
+
     @param orm: sqlalchemy
     @param module: 模块对象
     @param query: 查询字段
@@ -103,9 +245,132 @@ def orm_json_search(
     @param order_by: 排序字段
     @param page: 分页页码
     @param page_size: 每页大小
-    @return: Query
+    @param trusted: 受信任的参数跳过pydantic校验
+    @param cache_results: 是否缓存查询结果
+    @param cache_ttl: 结果缓存的过期秒数, 默认使用配置
+    @param result_mode: 结果模式, orm/tuple/dict/columnar, 非orm时不构造实例
+    @return: t.Union[Query, t.List[t.Any], t.Dict[t.Text, t.Any]]
+    """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        search = Search(
+            session,
+            module=module,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            group_by=group_by,
+            having=having,
+            order_by=order_by,
+            page=page,
+            page_size=page_size,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            explain_guard=orm.explain_guard,
+            trusted=trusted
+        )
+        queryset = search.pagination.execution_options(**{READONLY: True})
+        if not cache_results and result_mode is None:
+            return queryset
+        cache = orm.result_cache if cache_results else None
+        return search.result(result_mode or ORM, queryset, cache, cache_ttl)
+
+
+# 批量查询中每个查询可用的参数
+multi_search_options = ('query', 'join', 'filter_by', 'group_by', 'having', 'order_by', 'page', 'page_size')
+
+
+def orm_json_multi_search(
+        orm: SQLAlchemy,
+        *,
+        module: ModuleType,
+        searches: t.Dict[t.Text, t.Dict[t.Text, t.Any]],
+        result_mode: t.Optional[t.Text] = None,
+        combine: t.Optional[bool] = True,
+        parallel: t.Optional[int] = None,
+        trusted: t.Optional[bool] = False
+) -> t.Dict[t.Text, t.Any]:
+    """ 批量执行多个json查询
+
+    默认在同一只读事务(同一连接)上依次执行, 非orm模式下列结构一致且无排序的查询合并为一条UNION ALL;
+    parallel大于1时每个查询在独立的线程(eventlet/gevent打补丁后为协程)和连接上并发执行, 适合互不相关的重查询,
+    此时查询看不到调用方事务中未提交的修改
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param searches: 名称 => 查询参数, 同orm_json_search的query/join/filter_by/group_by/having/order_by/page/page_size
+    @param result_mode: 结果模式, orm/tuple/dict/columnar, 默认orm
+    @param combine: 是否合并列结构一致的查询
+    @param parallel: 并发执行的最大数量
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: t.Dict[t.Text, t.Any]
     """
-    with safe_transaction(orm, commit=False) as session:
+    for name, payload in searches.items():
+        if not isinstance(payload, dict):
+            errs = f'search {name} must be dict, got {payload!r}'
+            raise ValidationError(errormsg=errs)
+        invalid = sorted(set(payload) - set(multi_search_options))
+        if invalid:
+            errs = f'search {name} has invalid options {invalid}'
+            raise ValidationError(errormsg=errs)
+    mode = result_mode or ORM
+    if parallel is not None and parallel > 1 and len(searches) > 1:
+        with ThreadPoolExecutor(max_workers=min(parallel, len(searches))) as executor:
+            futures = {
+                name: executor.submit(orm_json_search, orm, module=module, trusted=trusted, result_mode=mode, **payload)
+                for name, payload in searches.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        return execute_searches(session, {
+            name: Search(
+                session,
+                module=module,
+                cache=orm.plan_cache,
+                schema_cache=orm.schema_cache,
+                in_list_strategy=orm.in_list_strategy,
+                limits=orm.search_limits,
+                explain_guard=orm.explain_guard,
+                trusted=trusted,
+                **payload
+            )
+            for name, payload in searches.items()
+        }, mode, combine, **{READONLY: True})
+
+
+def orm_json_page_search(
+        orm: SQLAlchemy,
+        *,
+        module: ModuleType,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        group_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        having: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        page: t.Optional[int] = None,
+        page_size: t.Optional[int] = None,
+        strategy: t.Optional[t.Text] = COUNT,
+        trusted: t.Optional[bool] = False
+) -> PageResult:
+    """ 基于json构建页码分页查询
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param group_by: 分组字段
+    @param having: 分组条件
+    @param order_by: 排序字段
+    @param page: 分页页码
+    @param page_size: 每页大小
+    @param strategy: 统计策略, peek/count/window
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: PageResult
+    """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
         return Search(
             session,
             module=module,
@@ -116,5 +381,356 @@ def orm_json_search(
             having=having,
             order_by=order_by,
             page=page,
-            page_size=page_size
-        ).pagination
+            page_size=page_size,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            explain_guard=orm.explain_guard,
+            trusted=trusted
+        ).page_result(strategy=strategy)
+
+
+def orm_json_cursor_search(
+        orm: SQLAlchemy,
+        *,
+        module: ModuleType,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        cursor: t.Optional[t.Text] = None,
+        page_size: t.Optional[int] = None,
+        trusted: t.Optional[bool] = False
+) -> CursorPage:
+    """ 基于json构建游标分页查询
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param order_by: 排序字段
+    @param cursor: 分页游标
+    @param page_size: 每页大小
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: CursorPage
+    """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        return Search(
+            session,
+            module=module,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            order_by=order_by,
+            page_size=page_size,
+            cursor=cursor,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            explain_guard=orm.explain_guard,
+            trusted=trusted
+        ).cursor_pagination
+
+
+def orm_json_stream_search(
+        orm: SQLAlchemy,
+        *,
+        module: ModuleType,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        group_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        having: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        batch_size: t.Optional[int] = 1000,
+        trusted: t.Optional[bool] = False
+) -> t.Iterator[t.List[t.Any]]:
+    """ 基于json构建流式查询
+
+    会话贯穿整个遍历过程, 提前关闭生成器时会回滚并释放连接
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param group_by: 分组字段
+    @param having: 分组条件
+    @param order_by: 排序字段
+    @param batch_size: 批次大小
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: t.Iterator[t.List[t.Any]]
+    """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        yield from Search(
+            session,
+            module=module,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            group_by=group_by,
+            having=having,
+            order_by=order_by,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            explain_guard=orm.explain_guard,
+            trusted=trusted
+        ).iter_batches(batch_size)
+
+
+def orm_json_export(
+        orm: SQLAlchemy,
+        *,
+        module: ModuleType,
+        stream: t.BinaryIO,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        group_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        having: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        format: t.Optional[t.Text] = CSV,
+        compression: t.Optional[t.Text] = None,
+        batch_size: t.Optional[int] = 1000,
+        progress: t.Optional[t.Callable[[ExportResult], t.Any]] = None,
+        trusted: t.Optional[bool] = False
+) -> ExportResult:
+    """ 基于json流式导出查询结果
+
+    模型展开为各列后通过服务端游标分批写入, 不构造实例, 内存占用只与batch_size相关
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param stream: 二进制输出流, 不会被关闭
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param group_by: 分组字段
+    @param having: 分组条件
+    @param order_by: 排序字段
+    @param format: csv/ndjson/arrow/parquet, arrow/parquet依赖pyarrow
+    @param compression: gzip/zstd, zstd压缩文本依赖zstandard
+    @param batch_size: 批次大小
+    @param progress: 每个批次写入后的回调
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: ExportResult
+    """
+    with safe_transaction(orm, commit=False, readonly=True) as session:
+        return export_search(
+            session,
+            module=module,
+            stream=stream,
+            format=format,
+            compression=compression,
+            batch_size=batch_size,
+            progress=progress,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            group_by=group_by,
+            having=having,
+            order_by=order_by,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            explain_guard=orm.explain_guard,
+            trusted=trusted
+        )
+
+
+async def get_instance_async(
+        session: AsyncSQLAlchemyClient,
+        *,
+        model: BaseModel,
+        query: t.Dict[t.Text, t.Any]
+) -> t.Optional[BaseModel]:
+    """ 单次查询获取实例(异步)
+
+    @param session: 数据会话
+    @param model: 目标模型
+    @param query: 查询字典
+    @return: t.Optional[BaseModel]
+    """
+    result = await session.execute(select(model).filter_by(**query).limit(2))
+    instances = result.scalars().all()
+    if len(instances) > 1: raise MultipleResultsFound(f'{model} - {query}')
+    return instances[0] if instances else None
+
+
+async def select_or_create_async(
+        orm: AsyncSQLAlchemy,
+        *,
+        model: BaseModel,
+        defaults: t.Optional[t.Dict[t.Text, t.Any]] = None,
+        **query: t.Any
+) -> BaseModel:
+    """ 查询并创建实例(异步)
+
+    @param orm: sqlalchemy
+    @param model: 目标模型
+    @param defaults: 初始字典
+    @param query: 查询字典
+    @return: BaseModel
+    """
+    session = orm.get_client()
+    instance = await get_instance_async(session, model=model, query=query)
+    if instance is not None: return instance
+    try:
+        async with safe_transaction_async(orm, nested=True, commit=True) as session:
+            instance = model(**(defaults or {}) | query)
+            session.add(instance)
+        return instance
+    except IntegrityError:
+        # 并发创建时唯一约束冲突, 重新查询已创建的实例
+        instance = await get_instance_async(session, model=model, query=query)
+        if instance is None: raise
+        return instance
+
+
+async def update_or_create_async(
+        orm: AsyncSQLAlchemy,
+        *,
+        model: BaseModel,
+        defaults: t.Optional[t.Dict[t.Text, t.Any]] = None,
+        **query: t.Any
+) -> BaseModel:
+    """ 更新并创建实例(异步)
+
+    @param orm: sqlalchemy
+    @param model: 目标模型
+    @param defaults: 初始字典
+    @param query: 查询字典
+    @return: BaseModel
+    """
+    defaults = defaults or {}
+    session = orm.get_client()
+    instance = await get_instance_async(session, model=model, query=query)
+    if instance is None:
+        try:
+            async with safe_transaction_async(orm, nested=True, commit=True) as session:
+                instance = model(**defaults | query)
+                session.add(instance)
+            return instance
+        except IntegrityError:
+            # 并发创建时唯一约束冲突, 重新查询后再更新
+            instance = await get_instance_async(session, model=model, query=query)
+            if instance is None: raise
+    if not defaults: return instance
+    async with safe_transaction_async(orm, nested=True, commit=True):
+        items = defaults.items()
+        for k, v in items: setattr(instance, k, v)
+    return instance
+
+
+async def orm_json_search_async(
+        orm: AsyncSQLAlchemy,
+        *,
+        module: ModuleType,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        group_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        having: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        page: t.Optional[int] = None,
+        page_size: t.Optional[int] = None,
+        trusted: t.Optional[bool] = False
+) -> t.List[t.Any]:
+    """ 基于json构建查询(异步)
+
+    查询对象在同步会话上构建(不涉及IO), 语句通过异步会话执行
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param group_by: 分组字段
+    @param having: 分组条件
+    @param order_by: 排序字段
+    @param page: 分页页码
+    @param page_size: 每页大小
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: t.List[t.Any]
+    """
+    async with safe_transaction_async(orm, commit=False) as session:
+        search = Search(
+            session.sync_session,
+            module=module,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            group_by=group_by,
+            having=having,
+            order_by=order_by,
+            page=page,
+            page_size=page_size,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            trusted=trusted
+        )
+        result = await session.execute(search.pagination.statement)
+        return result.scalars().all() if search.single_entity else result.all()
+
+
+async def orm_json_stream_search_async(
+        orm: AsyncSQLAlchemy,
+        *,
+        module: ModuleType,
+        query: t.List[t.Union[t.Text, t.Dict]],
+        join: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None,
+        filter_by: t.Optional[t.Union[t.Dict, t.List]] = None,
+        group_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        having: t.Optional[t.Union[t.Dict, t.List]] = None,
+        order_by: t.Optional[t.List[t.Union[t.Text, t.Dict]]] = None,
+        batch_size: t.Optional[int] = 1000,
+        trusted: t.Optional[bool] = False
+) -> t.AsyncIterator[t.List[t.Any]]:
+    """ 基于json构建流式查询(异步)
+
+    通过服务端游标分批返回, 提前退出时请调用aclose()释放连接
+
+    @param orm: sqlalchemy
+    @param module: 模块对象
+    @param query: 查询字段
+    @param join: 联表字段
+    @param filter_by: 过滤条件
+    @param group_by: 分组字段
+    @param having: 分组条件
+    @param order_by: 排序字段
+    @param batch_size: 批次大小
+    @param trusted: 受信任的参数跳过pydantic校验
+    @return: t.AsyncIterator[t.List[t.Any]]
+    """
+    async with safe_transaction_async(orm, commit=False) as session:
+        search = Search(
+            session.sync_session,
+            module=module,
+            query=query,
+            join=join,
+            filter_by=filter_by,
+            group_by=group_by,
+            having=having,
+            order_by=order_by,
+            cache=orm.plan_cache,
+            schema_cache=orm.schema_cache,
+            in_list_strategy=orm.in_list_strategy,
+            limits=orm.search_limits,
+            trusted=trusted
+        )
+        options = {'yield_per': batch_size, 'stream_results': True, 'max_row_buffer': batch_size}
+        result = await session.stream(search.pagination.statement, execution_options=options)
+        result = result.scalars() if search.single_entity else result
+        try:
+            async for batch in result.partitions(batch_size):
+                yield batch
+        finally:
+            await result.close()
@@ -0,0 +1,221 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import random
+import typing as t
+
+from logging import getLogger
+from threading import Lock
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .telemetry import Histogram
+from .telemetry import default_buckets
+
+logger = getLogger(__name__)
+
+# 查询语句上记录原始查询参数的执行选项
+SEARCH_PAYLOAD = 'search_payload'
+# 查询语句上记录大IN列表策略的执行选项
+SEARCH_IN_LISTS = 'search_in_lists'
+# 超出统计上限的语句归入该分组
+OTHER_STATEMENTS = '<other>'
+# 语句开始执行的时间
+QUERY_START = '_service_sqlalchemy_query_start'
+
+
+def redact_payload(node: t.Any) -> t.Any:
+    """ 隐藏查询参数中的值
+
+    @param node: 查询节点
+    @return: t.Any
+    """
+    if isinstance(node, list):
+        return [redact_payload(n) for n in node]
+    if not isinstance(node, dict):
+        return node
+    return {k: redact_value(v) if k == 'value' else redact_payload(v) for k, v in node.items()}
+
+
+def redact_value(value: t.Any) -> t.Any:
+    """ 隐藏操作的值
+
+    标量列表(如IN列表)只保留元素个数
+
+    @param value: 操作的值
+    @return: t.Any
+    """
+    if isinstance(value, dict):
+        return redact_payload(value)
+    if not isinstance(value, list):
+        return '?'
+    if any(isinstance(v, (dict, list)) for v in value):
+        return redact_payload(value)
+    return f'<{len(value)} values>'
+
+
+class QueryStats(object):
+    """ 语句耗时统计
+
+    按语句记录耗时直方图, 超过阈值的语句和按比例采样的语句会连同原始查询参数输出到日志
+    """
+
+    def __init__(
+            self,
+            *,
+            threshold: t.Optional[float] = 0.5,
+            sample_rate: t.Optional[float] = 0.0,
+            redact: t.Optional[bool] = True,
+            max_statements: t.Optional[int] = 1000,
+            buckets: t.Optional[t.Sequence[float]] = default_buckets
+    ) -> None:
+        """ 初始化实例
+
+        @param threshold: 慢查询阈值, 单位秒
+        @param sample_rate: 未超过阈值的语句的采样比例, 0~1
+        @param redact: 是否隐藏绑定参数
+        @param max_statements: 单独统计的语句数上限
+        @param buckets: 耗时分桶边界
+        """
+        self.threshold = threshold
+        self.sample_rate = sample_rate or 0.0
+        self.redact = redact
+        self.max_statements = max_statements
+        self.buckets = buckets
+        self.total = Histogram(buckets)
+        self.statements = {}
+        self.slow = 0
+        self.sampled = 0
+        self._lock = Lock()
+
+    def install(self, engine: Engine) -> None:
+        """ 安装引擎事件
+
+        @param engine: 数据引擎
+        @return: None
+        """
+        event.listen(engine, 'before_cursor_execute', self.on_before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.on_after_cursor_execute)
+
+    def on_before_cursor_execute(
+            self,
+            conn: t.Any,
+            cursor: t.Any,
+            statement: t.Text,
+            parameters: t.Any,
+            context: t.Any,
+            executemany: bool
+    ) -> None:
+        """ 语句执行前事件
+
+        @param conn: 数据连接
+        @param cursor: 原始游标
+        @param statement: 执行语句
+        @param parameters: 绑定参数
+        @param context: 执行上下文
+        @param executemany: 是否批量
+        @return: None
+        """
+        context is not None and setattr(context, QUERY_START, perf_counter())
+
+    def on_after_cursor_execute(
+            self,
+            conn: t.Any,
+            cursor: t.Any,
+            statement: t.Text,
+            parameters: t.Any,
+            context: t.Any,
+            executemany: bool
+    ) -> None:
+        """ 语句执行后事件
+
+        @param conn: 数据连接
+        @param cursor: 原始游标
+        @param statement: 执行语句
+        @param parameters: 绑定参数
+        @param context: 执行上下文
+        @param executemany: 是否批量
+        @return: None
+        """
+        start = getattr(context, QUERY_START, None)
+        if start is None: return
+        seconds = perf_counter() - start
+        self.record(statement, seconds)
+        slow = self.threshold is not None and seconds >= self.threshold
+        if not slow and not (self.sample_rate and random.random() < self.sample_rate):
+            return
+        options = context.execution_options or {}
+        message = self.format(
+            statement, parameters, options.get(SEARCH_PAYLOAD, None), seconds, options.get(SEARCH_IN_LISTS, None)
+        )
+        if slow:
+            with self._lock: self.slow += 1
+            logger.warning(f'slow query {message}')
+        else:
+            with self._lock: self.sampled += 1
+            logger.info(f'sampled query {message}')
+
+    def record(self, statement: t.Text, seconds: float) -> None:
+        """ 记录语句耗时
+
+        @param statement: 执行语句
+        @param seconds: 执行耗时
+        @return: None
+        """
+        self.total.record(seconds)
+        histogram = self.statements.get(statement, None)
+        if histogram is None:
+            with self._lock:
+                if statement not in self.statements and len(self.statements) >= self.max_statements:
+                    statement = OTHER_STATEMENTS
+                histogram = self.statements.setdefault(statement, Histogram(self.buckets))
+        histogram.record(seconds)
+
+    def format(
+            self,
+            statement: t.Text,
+            parameters: t.Any,
+            payload: t.Any,
+            seconds: float,
+            in_lists: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None
+    ) -> t.Text:
+        """ 格式化日志
+
+        @param statement: 执行语句
+        @param parameters: 绑定参数
+        @param payload: 查询参数
+        @param seconds: 执行耗时
+        @param in_lists: 大IN列表的策略, 只包含字段/大小/策略, 无需隐藏
+        @return: t.Text
+        """
+        statement = ' '.join(statement.split())
+        parameters = '<redacted>' if self.redact else repr(parameters)[:1024]
+        message = f'{seconds:.3f}s {statement} parameters={parameters}'
+        if payload is not None:
+            payload = redact_payload(payload) if self.redact else payload
+            message += f' search={json.dumps(payload, ensure_ascii=False, default=str)}'
+        if in_lists:
+            message += f' in_lists={json.dumps(in_lists, ensure_ascii=False, default=str)}'
+        return message
+
+    def dict(self, limit: t.Optional[int] = 20) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @param limit: 按总耗时输出的语句数
+        @return: t.Dict[t.Text, t.Any]
+        """
+        # 其它线程可能同时插入新语句, 在锁内复制后再排序
+        with self._lock:
+            slow, sampled, items = self.slow, self.sampled, list(self.statements.items())
+        statements = sorted(items, key=lambda i: i[1].total, reverse=True)
+        return {
+            'slow': slow,
+            'sampled': sampled,
+            'total': self.total.dict(),
+            'statements': {s: h.dict() for s, h in statements[:limit]}
+        }
@@ -0,0 +1,320 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from time import monotonic
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+
+# 默认的耗时分桶边界(秒)
+default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# 连接记录上的签出时间
+CHECKOUT_AT = 'checkout_at'
+
+
+class Histogram(object):
+    """ 耗时直方图 """
+
+    def __init__(self, buckets: t.Optional[t.Sequence[float]] = default_buckets) -> None:
+        """ 初始化实例
+
+        @param buckets: 分桶边界, 单位秒
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = Lock()
+
+    def record(self, seconds: float) -> None:
+        """ 记录一次耗时
+
+        @param seconds: 耗时
+        @return: None
+        """
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> t.Optional[float]:
+        """ 估算分位数, 返回所在分桶的上界
+
+        @param q: 分位, 0~1
+        @return: t.Optional[float]
+        """
+        if not self.count: return None
+        rank, seen = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        bounds = [f'le_{b:g}' for b in self.buckets] + ['le_inf']
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip(bounds, self.counts))
+        }
+
+
+class RateCounter(object):
+    """ 滑动窗口计数 """
+
+    def __init__(self, window: t.Optional[float] = 60) -> None:
+        """ 初始化实例
+
+        @param window: 窗口时长, 单位秒
+        """
+        self.total = 0
+        self.window = window
+        self._times = deque()
+        self._lock = Lock()
+
+    def incr(self) -> None:
+        """ 计数加一
+
+        @return: None
+        """
+        now = monotonic()
+        with self._lock:
+            self.total += 1
+            self._times.append(now)
+            while self._times and self._times[0] < now - self.window: self._times.popleft()
+
+    def rate(self) -> int:
+        """ 窗口内的次数
+
+        @return: int
+        """
+        now = monotonic()
+        with self._lock:
+            return sum(1 for v in self._times if v >= now - self.window)
+
+
+class PoolStats(object):
+    """ 连接池统计
+
+    只通过公开的连接池事件统计连接的创建/签出/签入/失效, 并计时每次签出到签入的占用时长;
+    连接池事件在engine.dispose()重建连接池后沿用, 签出等待由连接池自身统计(如AdaptivePool)
+
+    注意: 计数器会被多个签出线程同时更新, 均在锁内递增
+    """
+
+    def __init__(self, engine: Engine, *, buckets: t.Optional[t.Sequence[float]] = default_buckets) -> None:
+        """ 初始化实例
+
+        @param engine: 数据引擎
+        @param buckets: 占用时长的分桶边界
+        """
+        self.engine = engine
+        self.checkout_hold = Histogram(buckets)
+        self.connects = RateCounter()
+        self.closes = RateCounter()
+        self.invalidations = RateCounter()
+        self.soft_invalidations = 0
+        self.pre_ping_failures = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self._lock = Lock()
+        event.listen(engine.pool, 'connect', self.on_connect)
+        event.listen(engine.pool, 'close', self.on_close)
+        event.listen(engine.pool, 'checkout', self.on_checkout)
+        event.listen(engine.pool, 'checkin', self.on_checkin)
+        event.listen(engine.pool, 'invalidate', self.on_invalidate)
+        event.listen(engine.pool, 'soft_invalidate', self.on_soft_invalidate)
+        # 注意: 不注册引擎级事件, 否则每次执行语句都会走事件分发的慢路径
+
+    def on_connect(self, dbapi_connection: t.Any, connection_record: t.Any) -> None:
+        """ 新建连接事件
+
+        @param dbapi_connection: 原始连接
+        @param connection_record: 连接记录
+        @return: None
+        """
+        self.connects.incr()
+
+    def on_close(self, dbapi_connection: t.Any, connection_record: t.Any) -> None:
+        """ 关闭连接事件
+
+        @param dbapi_connection: 原始连接
+        @param connection_record: 连接记录
+        @return: None
+        """
+        self.closes.incr()
+
+    def on_checkout(self, dbapi_connection: t.Any, connection_record: t.Any, connection_proxy: t.Any) -> None:
+        """ 签出连接事件
+
+        @param dbapi_connection: 原始连接
+        @param connection_record: 连接记录
+        @param connection_proxy: 连接代理
+        @return: None
+        """
+        connection_record.info[CHECKOUT_AT] = perf_counter()
+        with self._lock:
+            self.checkouts += 1
+
+    def on_checkin(self, dbapi_connection: t.Any, connection_record: t.Any) -> None:
+        """ 签入连接事件
+
+        @param dbapi_connection: 原始连接, 连接失效后签入时为None
+        @param connection_record: 连接记录
+        @return: None
+        """
+        start = connection_record.info.pop(CHECKOUT_AT, None)
+        start is not None and self.checkout_hold.record(perf_counter() - start)
+        with self._lock:
+            self.checkins += 1
+
+    def on_invalidate(self, dbapi_connection: t.Any, connection_record: t.Any, exception: t.Any) -> None:
+        """ 连接失效事件
+
+        @param dbapi_connection: 原始连接
+        @param connection_record: 连接记录
+        @param exception: 失效原因
+        @return: None
+        """
+        self.invalidations.incr()
+        # 签出时预检测失败会以InvalidatePoolError使连接失效
+        if not isinstance(exception, exc.InvalidatePoolError): return
+        with self._lock:
+            self.pre_ping_failures += 1
+
+    def on_soft_invalidate(self, dbapi_connection: t.Any, connection_record: t.Any, exception: t.Any) -> None:
+        """ 连接软失效事件
+
+        @param dbapi_connection: 原始连接
+        @param connection_record: 连接记录
+        @param exception: 失效原因
+        @return: None
+        """
+        with self._lock:
+            self.soft_invalidations += 1
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        pool = self.engine.pool
+        # 非QueuePool的连接池没有容量相关的方法
+        size = getattr(pool, 'size', lambda: None)()
+        overflow = getattr(pool, 'overflow', lambda: None)()
+        with self._lock:
+            counters = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'soft_invalidations': self.soft_invalidations,
+                'pre_ping_failures': self.pre_ping_failures
+            }
+        # 自适应连接池(AdaptivePool)自身统计的签出等待/超时以及伸缩决策
+        adaptive = pool.stats() if callable(getattr(pool, 'stats', None)) else None
+        return {
+            'pool': pool.status(),
+            'size': size,
+            'checked_out': getattr(pool, 'checkedout', lambda: None)(),
+            'idle': getattr(pool, 'checkedin', lambda: None)(),
+            'overflow_in_use': max(overflow, 0) if overflow is not None else None,
+            'checkouts': counters['checkouts'],
+            'checkins': counters['checkins'],
+            'checkout_timeouts': adaptive['timeouts'] if adaptive else None,
+            'checkout_wait': adaptive['checkout_wait'] if adaptive else None,
+            'checkout_hold': self.checkout_hold.dict(),
+            'connects': self.connects.total,
+            'connects_per_minute': self.connects.rate(),
+            'closes': self.closes.total,
+            'closes_per_minute': self.closes.rate(),
+            'invalidations': self.invalidations.total,
+            'invalidations_per_minute': self.invalidations.rate(),
+            'soft_invalidations': counters['soft_invalidations'],
+            'pre_ping_failures': counters['pre_ping_failures'],
+            'adaptive': adaptive
+        }
+
+
+class RetryStats(object):
+    """ 事务重试统计 """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self.attempts = 0
+        self.retries = 0
+        self.recovered = 0
+        self.exhausted = 0
+        self.errors = {}
+        self.backoff = Histogram()
+        self._lock = Lock()
+
+    def record_attempt(self) -> None:
+        """ 记录一次执行
+
+        @return: None
+        """
+        with self._lock:
+            self.attempts += 1
+
+    def record_retry(self, error: t.Text, delay: float) -> None:
+        """ 记录一次重试
+
+        @param error: 错误分类, 如mysql:1213
+        @param delay: 退避秒数
+        @return: None
+        """
+        with self._lock:
+            self.retries += 1
+            self.errors[error] = self.errors.get(error, 0) + 1
+        self.backoff.record(delay)
+
+    def record_finish(self, retried: bool, success: bool) -> None:
+        """ 记录重试后的结果
+
+        @param retried: 是否发生过重试
+        @param success: 是否成功
+        @return: None
+        """
+        if not retried:
+            return
+        with self._lock:
+            if success:
+                self.recovered += 1
+            else:
+                self.exhausted += 1
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self._lock:
+            return {
+                'attempts': self.attempts,
+                'retries': self.retries,
+                # 重试后成功/重试耗尽后仍失败的事务数
+                'recovered': self.recovered,
+                'exhausted': self.exhausted,
+                'errors': dict(self.errors),
+                'backoff': self.backoff.dict()
+            }
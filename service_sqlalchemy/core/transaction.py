@@ -4,13 +4,24 @@
 
 from __future__ import annotations
 
+import time
+import random
+import asyncio
 import typing as t
 
+from functools import wraps
+from time import monotonic
+from inspect import iscoroutinefunction
 from logging import getLogger
 from contextlib import contextmanager
+from contextlib import asynccontextmanager
+from sqlalchemy.exc import DBAPIError
 
 from .dependencies import SQLAlchemy
+from .dependencies import AsyncSQLAlchemy
+from .replicas import READONLY
 from .client import SQLAlchemyClient
+from .client import AsyncSQLAlchemyClient
 
 
 logger = getLogger(__name__)
@@ -22,17 +33,23 @@ def safe_transaction(
         *,
         nested: t.Optional[bool] = False,
         commit: t.Optional[bool] = True,
+        readonly: t.Optional[bool] = False,
 ) -> SQLAlchemyClient:
     """ 开启安全事务模式
 
+    注意: 只读需显式指定, 不提交的事务可能由调用方手动提交或包含写入, 不能视为只读
+
     @param orm: sqlalchemy
     @param commit: 自动提交
     @param nested: 是否嵌套
+    @param readonly: 是否只读, 配置从库时读语句路由到从库, 会话中已有写入时仍使用主库
     @return: SQLAlchemyClient
     """
-    session, finish = None, False
+    session, finish, marked = None, False, False
     try:
         session = orm.get_client()
+        marked = bool(readonly) and not session.info.get(READONLY, False)
+        marked and session.info.update({READONLY: True})
         nested and session.begin_nested()
         yield session
         commit and session.commit()
@@ -40,3 +57,284 @@ def safe_transaction(
     finally:
         session and not finish and session.rollback()
         session and not nested and session.close()
+        # 注意: 嵌套的只读事务只清除本层的标记
+        session and (marked or not nested) and session.info.pop(READONLY, None)
+
+
+@asynccontextmanager
+async def safe_transaction_async(
+        orm: AsyncSQLAlchemy,
+        *,
+        nested: t.Optional[bool] = False,
+        commit: t.Optional[bool] = True,
+) -> t.AsyncIterator[AsyncSQLAlchemyClient]:
+    """ 开启异步安全事务模式
+
+    注意: AsyncSession为2.0风格, 嵌套时只提交/回滚本层的SAVEPOINT
+
+    @param orm: sqlalchemy
+    @param commit: 自动提交
+    @param nested: 是否嵌套
+    @return: t.AsyncIterator[AsyncSQLAlchemyClient]
+    """
+    session, transaction, finish = None, None, False
+    try:
+        session = orm.get_client()
+        transaction = await session.begin_nested() if nested else None
+        yield session
+        commit and await (transaction or session).commit()
+        finish = True
+    finally:
+        if session is not None and not finish:
+            await (transaction or session).rollback()
+        if session is not None and not nested:
+            await orm.session_cls.remove()
+
+
+# MySQL: 1213死锁, 1205锁等待超时
+mysql_transient_codes = {1213, 1205}
+# PostgreSQL: 40001序列化失败, 40P01死锁
+postgresql_transient_codes = {'40001', '40P01'}
+# SQLite: 数据库被其它连接锁定
+sqlite_transient_messages = ('database is locked', 'database table is locked')
+
+
+def classify_error(exc: BaseException) -> t.Optional[t.Text]:
+    """ 识别可重试的瞬时错误
+
+    注意: 连接断开时提交可能已经成功, 重放事务可能重复写入, 不视为瞬时错误
+
+    @param exc: 异常对象
+    @return: t.Optional[t.Text]
+    """
+    if not isinstance(exc, DBAPIError) or exc.connection_invalidated:
+        return None
+    orig = exc.orig
+    args = getattr(orig, 'args', ())
+    if args and isinstance(args[0], int) and args[0] in mysql_transient_codes:
+        return f'mysql:{args[0]}'
+    # 注意: psycopg2为pgcode, psycopg3/asyncpg为sqlstate
+    code = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    if code in postgresql_transient_codes:
+        return f'postgresql:{code}'
+    message = str(orig).lower()
+    if any(m in message for m in sqlite_transient_messages):
+        return 'sqlite:locked'
+    return None
+
+
+class RetryPolicy(object):
+    """ 事务重试策略
+
+    瞬时错误按带抖动的指数退避重试, 次数或总耗时超出预算后抛出最后一次的异常
+    """
+
+    def __init__(
+            self,
+            *,
+            retries: t.Optional[int] = 3,
+            base_delay: t.Optional[float] = 0.05,
+            max_delay: t.Optional[float] = 1.0,
+            budget: t.Optional[float] = None,
+            classify: t.Optional[t.Callable[[BaseException], t.Optional[t.Text]]] = classify_error
+    ) -> None:
+        """ 初始化实例
+
+        @param retries: 最多重试次数
+        @param base_delay: 首次退避的上限秒数, 之后每次翻倍
+        @param max_delay: 单次退避的上限秒数
+        @param budget: 包含退避在内的总耗时预算秒数, None表示不限制
+        @param classify: 错误分类, 返回None时不重试
+        """
+        self.retries = retries or 0
+        self.base_delay = base_delay or 0.0
+        self.max_delay = max_delay or 0.0
+        self.budget = budget
+        self.classify = classify
+
+    def next_delay(self, attempt: int, elapsed: float) -> t.Optional[float]:
+        """ 计算下次重试前的退避秒数
+
+        @param attempt: 已重试的次数
+        @param elapsed: 已耗费的秒数
+        @return: t.Optional[float]
+        """
+        if attempt >= self.retries:
+            return None
+        # 注意: 全抖动避免并发的事务在同一时刻再次冲突
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if self.budget is not None and elapsed + delay > self.budget:
+            return None
+        return delay
+
+
+default_policy = RetryPolicy()
+
+
+def load_orm(orm: t.Union[SQLAlchemy, AsyncSQLAlchemy, t.Text], args: t.Tuple) -> t.Any:
+    """ 加载依赖, 名称时从被装饰方法的实例上获取
+
+    @param orm: 依赖或属性名称
+    @param args: 调用参数
+    @return: t.Any
+    """
+    return getattr(args[0], orm) if isinstance(orm, str) else orm
+
+
+def retry_error(orm: t.Any, exc: BaseException, policy: RetryPolicy, attempt: int, start: float) -> t.Optional[float]:
+    """ 判断失败后是否重试并记录统计
+
+    外层已有事务时只重放本层的操作没有意义, 直接抛出由外层处理
+
+    @param orm: sqlalchemy
+    @param exc: 异常对象
+    @param policy: 重试策略
+    @param attempt: 已重试的次数
+    @param start: 开始时间
+    @return: t.Optional[float]
+    """
+    stats = getattr(orm, 'retry_stats', None)
+    error = policy.classify(exc)
+    delay = None if error is None else policy.next_delay(attempt, monotonic() - start)
+    if delay is None:
+        stats and stats.record_finish(attempt > 0, False)
+        return None
+    stats and stats.record_retry(error, delay)
+    logger.warning(f'transaction failed with transient error {error}, retry {attempt + 1} after {delay:.3f}s')
+    return delay
+
+
+def call_with_retry(orm: SQLAlchemy, func: t.Callable[[], t.Any], policy: t.Optional[RetryPolicy] = None) -> t.Any:
+    """ 遇到瞬时错误时重新执行func
+
+    @param orm: sqlalchemy
+    @param func: 完整的事务, 每次执行都会重新开启事务
+    @param policy: 重试策略
+    @return: t.Any
+    """
+    policy, stats = policy or default_policy, getattr(orm, 'retry_stats', None)
+    outer = orm.get_client().in_transaction()
+    start, attempt = monotonic(), 0
+    while True:
+        stats and stats.record_attempt()
+        try:
+            result = func()
+        except Exception as e:
+            delay = None if outer else retry_error(orm, e, policy, attempt, start)
+            if delay is None: raise
+            orm.get_client().rollback()
+            time.sleep(delay)
+            attempt += 1
+            continue
+        stats and stats.record_finish(attempt > 0, True)
+        return result
+
+
+async def call_with_retry_async(
+        orm: AsyncSQLAlchemy,
+        func: t.Callable[[], t.Awaitable[t.Any]],
+        policy: t.Optional[RetryPolicy] = None
+) -> t.Any:
+    """ 遇到瞬时错误时重新执行func(异步)
+
+    @param orm: sqlalchemy
+    @param func: 完整的事务, 每次执行都会重新开启事务
+    @param policy: 重试策略
+    @return: t.Any
+    """
+    policy, stats = policy or default_policy, getattr(orm, 'retry_stats', None)
+    outer = orm.get_client().in_transaction()
+    start, attempt = monotonic(), 0
+    while True:
+        stats and stats.record_attempt()
+        try:
+            result = await func()
+        except Exception as e:
+            delay = None if outer else retry_error(orm, e, policy, attempt, start)
+            if delay is None: raise
+            await orm.get_client().rollback()
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        stats and stats.record_finish(attempt > 0, True)
+        return result
+
+
+def run_transaction(
+        orm: SQLAlchemy,
+        func: t.Callable[..., t.Any],
+        *args: t.Any,
+        commit: t.Optional[bool] = True,
+        policy: t.Optional[RetryPolicy] = None,
+        **kwargs: t.Any
+) -> t.Any:
+    """ 在可重试的安全事务中执行func(session, *args, **kwargs)
+
+    @param orm: sqlalchemy
+    @param func: 事务函数, 第一个参数为会话
+    @param args: 位置参数
+    @param commit: 自动提交
+    @param policy: 重试策略
+    @param kwargs: 命名参数
+    @return: t.Any
+    """
+    def attempt() -> t.Any:
+        with safe_transaction(orm, commit=commit) as session:
+            return func(session, *args, **kwargs)
+
+    return call_with_retry(orm, attempt, policy)
+
+
+async def run_transaction_async(
+        orm: AsyncSQLAlchemy,
+        func: t.Callable[..., t.Awaitable[t.Any]],
+        *args: t.Any,
+        commit: t.Optional[bool] = True,
+        policy: t.Optional[RetryPolicy] = None,
+        **kwargs: t.Any
+) -> t.Any:
+    """ 在可重试的安全事务中执行func(session, *args, **kwargs)(异步)
+
+    @param orm: sqlalchemy
+    @param func: 事务函数, 第一个参数为会话
+    @param args: 位置参数
+    @param commit: 自动提交
+    @param policy: 重试策略
+    @param kwargs: 命名参数
+    @return: t.Any
+    """
+    async def attempt() -> t.Any:
+        async with safe_transaction_async(orm, commit=commit) as session:
+            return await func(session, *args, **kwargs)
+
+    return await call_with_retry_async(orm, attempt, policy)
+
+
+def retry_transaction(
+        orm: t.Union[SQLAlchemy, AsyncSQLAlchemy, t.Text],
+        *,
+        policy: t.Optional[RetryPolicy] = None
+) -> t.Callable[[t.Callable[..., t.Any]], t.Callable[..., t.Any]]:
+    """ 遇到瞬时错误时重新执行被装饰的函数
+
+    with块无法重新执行, 被装饰的函数应包含完整的事务(如函数内的safe_transaction), 支持协程函数
+
+    @param orm: 依赖, 或被装饰方法所属实例上的依赖属性名称, 如'orm'
+    @param policy: 重试策略
+    @return: t.Callable[[t.Callable[..., t.Any]], t.Callable[..., t.Any]]
+    """
+    def decorator(func: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+                return await call_with_retry_async(load_orm(orm, args), lambda: func(*args, **kwargs), policy)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            return call_with_retry(load_orm(orm, args), lambda: func(*args, **kwargs), policy)
+
+        return wrapper
+
+    return decorator
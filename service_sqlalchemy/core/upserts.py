@@ -0,0 +1,192 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from itertools import groupby
+from sqlalchemy import inspect
+from sqlalchemy import tuple_
+from sqlalchemy.sql.dml import Insert
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
+from service_sqlalchemy.core.client import SQLAlchemyClient
+from service_sqlalchemy.core.searching.results import mark_changed
+
+BaseModel = declarative_base()
+# 支持原生批量UPSERT的方言
+upsert_dialects = {
+    'mysql': mysql.insert,
+    'mariadb': mysql.insert,
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert
+}
+
+
+class BulkResult(object):
+    """ 批量写入结果 """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self.inserted = 0
+        self.updated = 0
+        self.selected = 0
+        self.primary_keys = []
+
+    def dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'selected': self.selected,
+            'primary_keys': self.primary_keys
+        }
+
+
+def make_batches(rows: t.List[t.Dict[t.Text, t.Any]], batch_size: int) -> t.Iterator[t.List[t.Dict[t.Text, t.Any]]]:
+    """ 按批次切分数据
+
+    @param rows: 数据列表
+    @param batch_size: 批次大小
+    @return: t.Iterator[t.List[t.Dict[t.Text, t.Any]]]
+    """
+    for index in range(0, len(rows), batch_size):
+        yield rows[index:index + batch_size]
+
+
+def make_row_key(row: t.Dict[t.Text, t.Any], key_fields: t.List[t.Text]) -> t.Tuple:
+    """ 计算数据的唯一键
+
+    @param row: 数据字典
+    @param key_fields: 唯一字段
+    @return: t.Tuple
+    """
+    return tuple(row[f] for f in key_fields)
+
+
+def load_primary_keys(
+        session: SQLAlchemyClient,
+        *,
+        model: BaseModel,
+        key_fields: t.List[t.Text],
+        keys: t.List[t.Tuple]
+) -> t.Dict[t.Tuple, t.Any]:
+    """ 通过一次IN查询加载主键
+
+    @param session: 数据会话
+    @param model: 目标模型
+    @param key_fields: 唯一字段
+    @param keys: 唯一键列表
+    @return: t.Dict[t.Tuple, t.Any]
+    """
+    if not keys: return {}
+    primary_key = inspect(model).primary_key
+    key_columns = [getattr(model, f) for f in key_fields]
+    if len(key_columns) == 1:
+        where = key_columns[0].in_([k[0] for k in keys])
+    else:
+        where = tuple_(*key_columns).in_(keys)
+    queryset = session.query(*primary_key, *key_columns).filter(where)
+    width = len(primary_key)
+    result = {}
+    for row in queryset:
+        result[tuple(row[width:])] = row[0] if width == 1 else tuple(row[:width])
+    return result
+
+
+def make_upsert(
+        dialect: t.Text,
+        *,
+        model: BaseModel,
+        rows: t.List[t.Dict[t.Text, t.Any]],
+        key_fields: t.List[t.Text],
+        update: bool
+) -> Insert:
+    """ 生成原生批量UPSERT语句
+
+    mysql: INSERT ... ON DUPLICATE KEY UPDATE / INSERT IGNORE
+    sqlite/postgresql: INSERT ... ON CONFLICT DO UPDATE / DO NOTHING
+
+    注意: 唯一字段上必须存在唯一约束
+
+    @param dialect: 方言名称
+    @param model: 目标模型
+    @param rows: 数据列表
+    @param key_fields: 唯一字段
+    @param update: 是否更新
+    @return: Insert
+    """
+    stmt = upsert_dialects[dialect](model.__table__).values(rows)
+    fields = [f for f in rows[0] if f not in key_fields] if update else []
+    if dialect in ('mysql', 'mariadb') and fields:
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in fields})
+    if dialect in ('mysql', 'mariadb'):
+        return stmt.prefix_with('IGNORE')
+    if fields:
+        return stmt.on_conflict_do_update(index_elements=key_fields, set_={f: stmt.excluded[f] for f in fields})
+    return stmt.on_conflict_do_nothing(index_elements=key_fields)
+
+
+def bulk_write(
+        session: SQLAlchemyClient,
+        *,
+        model: BaseModel,
+        rows: t.List[t.Dict[t.Text, t.Any]],
+        key_fields: t.List[t.Text],
+        update: bool,
+        result: BulkResult
+) -> None:
+    """ 批量写入一个批次
+
+    1. 一次IN查询区分已存在和待创建的数据
+    2. 按字段集合分组后执行原生多行UPSERT, 不支持时退化为executemany
+    3. 一次IN查询加载新建数据的主键
+
+    @param session: 数据会话
+    @param model: 目标模型
+    @param rows: 数据列表
+    @param key_fields: 唯一字段
+    @param update: 是否更新
+    @param result: 写入结果
+    @return: None
+    """
+    # 同批次重复的唯一键以最后一条为准
+    unique = {make_row_key(row, key_fields): row for row in rows}
+    exists = load_primary_keys(session, model=model, key_fields=key_fields, keys=list(unique))
+    writes = [r for k, r in unique.items() if update or k not in exists]
+    dialect = session.get_bind().dialect.name
+    writes.sort(key=lambda r: tuple(sorted(r)))
+    for _, group in groupby(writes, key=lambda r: tuple(sorted(r))):
+        group = list(group)
+        if dialect in upsert_dialects:
+            stmt = make_upsert(dialect, model=model, rows=group, key_fields=key_fields, update=update)
+            session.execute(stmt)
+            continue
+        inserts, updates = [], []
+        primary_key = [c.key for c in inspect(model).primary_key]
+        for row in group:
+            values = exists.get(make_row_key(row, key_fields), None)
+            if values is None:
+                inserts.append(row)
+                continue
+            values = values if isinstance(values, tuple) else (values,)
+            updates.append(dict(row, **dict(zip(primary_key, values))))
+        inserts and session.bulk_insert_mappings(model, inserts)
+        updates and session.bulk_update_mappings(model, updates)
+        # 注意: bulk_*_mappings不触发会话刷新事件, 需要自行标记写入的表
+        mark_changed(session, inspect(model).tables)
+    news = [k for k in unique if k not in exists]
+    exists.update(load_primary_keys(session, model=model, key_fields=key_fields, keys=news))
+    result.inserted += len(news)
+    if update:
+        result.updated += len(unique) - len(news)
+    else:
+        result.selected += len(unique) - len(news)
+    result.primary_keys.extend(exists.get(make_row_key(r, key_fields)) for r in rows)
@@ -0,0 +1,68 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sys
+import typing as t
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import declarative_base
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.searching import Search
+from service_sqlalchemy.core.searching.explain import ExplainGuard
+
+BaseModel = declarative_base()
+
+
+class Perm(BaseModel):
+    __tablename__ = 'perm'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(64), nullable=False)
+
+
+@pytest.fixture
+def session() -> t.Iterator[Session]:
+    engine = sa.create_engine('sqlite://')
+    BaseModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(Perm(name=name) for name in ('write', 'admin', 'read'))
+        session.commit()
+        yield session
+
+
+def search(session: Session, guard: ExplainGuard, **kwargs: t.Any) -> Search:
+    return Search(
+        session, module=sys.modules[__name__], query=['Perm.name'], order_by=['Perm.name'],
+        explain_guard=guard, **kwargs
+    )
+
+
+def test_reject(session: Session) -> None:
+    guard = ExplainGuard(allow_filesort=False, action='reject')
+    with pytest.raises(ValidationError):
+        search(session, guard).queryset.all()
+    assert guard.stats()['counts']['rejects'] == 1
+
+
+def test_downgrade(session: Session) -> None:
+    guard = ExplainGuard(allow_filesort=False, action='downgrade')
+    assert sorted(search(session, guard).queryset.all()) == [('admin',), ('read',), ('write',)]
+    assert guard.stats()['counts']['downgrades'] == 1
+    # 分页查询依赖排序, 不去掉排序而是拒绝
+    with pytest.raises(ValidationError):
+        search(session, guard, page=1, page_size=2).pagination.all()
+    with pytest.raises(ValidationError):
+        search(session, guard, page_size=2).cursor_pagination
+    assert guard.stats()['counts']['rejects'] == 2
+
+
+def test_warn(session: Session, caplog: pytest.LogCaptureFixture) -> None:
+    guard = ExplainGuard(allow_filesort=False, action='warn')
+    assert search(session, guard, page=1, page_size=2).pagination.all() == [('admin',), ('read',)]
+    assert guard.stats()['counts']['warns'] == 1
+    assert 'filesort' in caplog.text
@@ -0,0 +1,48 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import declarative_base
+from service_sqlalchemy.core import identity
+from service_sqlalchemy.core.identity import IdentityCache
+
+BaseModel = declarative_base()
+
+
+class Tag(BaseModel):
+    __tablename__ = 'tag'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(64), nullable=False, unique=True)
+
+
+@pytest.fixture
+def factory() -> sessionmaker:
+    engine = sa.create_engine('sqlite://', poolclass=sa.pool.StaticPool, connect_args={'check_same_thread': False})
+    BaseModel.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_entries_expire_after_ttl(factory: sessionmaker, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = IdentityCache(maxsize=8, ttl=10, models={'tag': [['name']]})
+    cache.install(factory)
+    now = 1000.0
+    monkeypatch.setattr(identity, 'monotonic', lambda: now)
+    with factory() as session:
+        session.add(Tag(name='a'))
+        session.commit()
+    with factory() as session:
+        cache.set(session, session.query(Tag).one())
+        assert cache.get(session, Tag, {'name': 'a'}).name == 'a'
+        # 其它进程的写入不会清除本进程的缓存, 只能等待过期
+        now += 10
+        assert cache.get(session, Tag, {'name': 'a'}) is None
+        assert cache.get(session, Tag, {'id': 1}) is None
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['expirations']) == (0, 1, 2, 1)
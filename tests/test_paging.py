@@ -0,0 +1,69 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sys
+import typing as t
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import declarative_base
+from service_sqlalchemy.core.searching import Search
+
+BaseModel = declarative_base()
+
+
+class User(BaseModel):
+    __tablename__ = 'user'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(64), nullable=False)
+    age = sa.Column(sa.Integer, nullable=True)
+
+
+@pytest.fixture
+def session() -> t.Iterator[Session]:
+    engine = sa.create_engine('sqlite://')
+    BaseModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        ages = [None, 3, None, 1, 2, None, 3, 1, None, 2, None]
+        session.add_all(User(name=f'u{i}', age=age) for i, age in enumerate(ages))
+        session.commit()
+        yield session
+
+
+def paginate(session: Session, order_by: t.List[t.Any], cursor: t.Optional[t.Text] = None) -> t.Any:
+    search = Search(
+        session, module=sys.modules[__name__], query=['User'],
+        order_by=order_by, cursor=cursor, page_size=3
+    )
+    return search.cursor_pagination
+
+
+@pytest.mark.parametrize('order_by', [
+    ['User.age'],
+    [{'field': 'User.age', 'fn': 'desc'}],
+    [{'field': 'User.age', 'fn': 'desc'}, {'field': 'User.name', 'fn': 'asc'}],
+])
+def test_cursor_pagination_across_null(session: Session, order_by: t.List[t.Any]) -> None:
+    pages, cursor = [], None
+    while True:
+        page = paginate(session, order_by, cursor)
+        pages.append(page)
+        cursor = page.next_cursor
+        if cursor is None: break
+    forward = [u.id for p in pages for u in p.items]
+    assert sorted(forward) == [u.id for u in session.query(User).order_by(User.id)]
+    # NULL视为最大值, 升序时位于末尾, 降序时位于开头
+    ages = [session.get(User, i).age for i in forward]
+    nulls = [a is None for a in ages]
+    assert nulls == sorted(nulls, reverse=order_by != ['User.age'])
+    backward, cursor = [], pages[-1].prev_cursor
+    while cursor is not None:
+        page = paginate(session, order_by, cursor)
+        backward = [u.id for u in page.items] + backward
+        cursor = page.prev_cursor
+    assert backward == forward[:len(backward)]
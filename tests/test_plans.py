@@ -0,0 +1,71 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sys
+import enum
+import typing as t
+import datetime
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import declarative_base
+from service_sqlalchemy.core.searching import Search
+from service_sqlalchemy.core.searching.plans import PlanCache
+
+BaseModel = declarative_base()
+
+
+class Color(enum.Enum):
+    red = 'red'
+    blue = 'blue'
+
+
+class Item(BaseModel):
+    __tablename__ = 'item'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    flag = sa.Column(sa.Boolean, nullable=False)
+    created = sa.Column(sa.DateTime, nullable=False)
+    color = sa.Column(sa.Enum(Color), nullable=False)
+
+
+@pytest.fixture
+def session() -> t.Iterator[Session]:
+    engine = sa.create_engine('sqlite://')
+    BaseModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            Item(flag=i % 2 == 0, created=datetime.datetime(2024, 1, 1 + i), color=list(Color)[i % 2])
+            for i in range(5)
+        )
+        session.commit()
+        yield session
+
+
+def search(session: Session, filter_by: t.Any, cache: t.Optional[PlanCache] = None) -> t.List[int]:
+    queryset = Search(session, module=sys.modules[__name__], query=['Item'], filter_by=filter_by, cache=cache).queryset
+    return sorted(item.id for item in queryset)
+
+
+@pytest.mark.parametrize('filter_by', [
+    {'field': 'Item.flag', 'op': 'eq', 'value': True},
+    {'field': 'Item.flag', 'op': 'eq', 'value': 1},
+    {'field': 'Item.flag', 'op': 'ne', 'value': 0},
+    {'field': 'Item.created', 'op': 'ge', 'value': '2024-01-03'},
+    {'field': 'Item.created', 'op': 'lt', 'value': '2024-01-03'},
+    {'field': 'Item.color', 'op': 'eq', 'value': 'red'},
+    {'field': 'Item.color', 'op': 'ne', 'value': 'blue'},
+    [{'field': 'Item.color', 'op': 'eq', 'value': 'red'}, 'or', {'field': 'Item.color', 'op': 'eq', 'value': 'blue'}],
+    [{'field': 'Item.flag', 'op': 'eq', 'value': 1}, 'or', {'field': 'Item.flag', 'op': 'eq', 'value': 0}],
+])
+def test_cached_plan_matches_uncached(session: Session, filter_by: t.Any) -> None:
+    expected = search(session, filter_by)
+    cache = PlanCache()
+    # 第一次未命中编译, 第二次命中后只绑定参数
+    assert search(session, filter_by, cache) == expected
+    assert search(session, filter_by, cache) == expected
+    assert cache.stats()['hits'] == 1
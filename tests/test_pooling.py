@@ -0,0 +1,41 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sqlite3
+import pytest
+
+from service_sqlalchemy.exception import ValidationError
+from service_sqlalchemy.core.pooling import AdaptivePool
+
+
+def creator() -> sqlite3.Connection:
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+
+@pytest.mark.parametrize('min_size, max_size', [(8, 4), (-1, 4), (0, 0)])
+def test_invalid_bounds(min_size: int, max_size: int) -> None:
+    with pytest.raises(ValidationError):
+        AdaptivePool(creator, min_size=min_size, max_size=max_size)
+
+
+def test_resize_keeps_total_within_max_size() -> None:
+    pool = AdaptivePool(creator, min_size=1, max_size=4, timeout=0.1)
+    conns = [pool.connect() for _ in range(4)]
+    assert pool.checkedout() == 4
+    for conn in conns: conn.close()
+    # 超出常驻数的连接归还时直接关闭
+    assert pool.checkedin() == 1
+    pool.resize(4)
+    conns = [pool.connect() for _ in range(4)]
+    for conn in conns: conn.close()
+    assert pool.checkedin() == 4
+    assert pool.resize(2) == 2
+    assert pool.checkedin() == 2 and pool.target_size == 2
+    # 收缩后仍可签出max_size个连接
+    conns = [pool.connect() for _ in range(4)]
+    assert pool.checkedout() == 4
+    for conn in conns: conn.close()
+    assert pool.checkedin() == 2
@@ -0,0 +1,78 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sys
+import pickle
+import typing as t
+import pytest
+import sqlalchemy as sa
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import declarative_base
+from service_sqlalchemy.core.searching import Search
+from service_sqlalchemy.core.searching.results import ResultCache
+from service_sqlalchemy.core.searching.results import StoreBackend
+
+BaseModel = declarative_base()
+
+
+class Tag(BaseModel):
+    __tablename__ = 'tag'
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(64), nullable=False)
+
+
+@pytest.fixture
+def factory() -> sessionmaker:
+    engine = sa.create_engine('sqlite://', poolclass=sa.pool.StaticPool, connect_args={'check_same_thread': False})
+    BaseModel.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def search(session: t.Any, cache: ResultCache) -> t.List[t.Any]:
+    return Search(session, module=sys.modules[__name__], query=['Tag.name']).cached_result(cache)
+
+
+def test_uncommitted_writes_skip_cache(factory: sessionmaker) -> None:
+    cache = ResultCache(namespace='test')
+    cache.install(factory)
+    s1 = factory()
+    s1.add(Tag(name='phantom'))
+    s1.flush()
+    assert search(s1, cache) == [('phantom',)]
+    s1.rollback()
+    s2 = factory()
+    assert search(s2, cache) == []
+    assert cache.stats()['hits'] == 0
+    # 未刷新的写入同样不读写缓存
+    s2.add(Tag(name='pending'))
+    assert search(s2, cache) == [('pending',)]
+    s2.rollback()
+    assert search(s2, cache) == []
+    assert cache.stats()['hits'] == 1
+
+
+class Exploit(object):
+
+    def __reduce__(self) -> t.Tuple[t.Any, ...]:
+        return exec, ('raise RuntimeError("executed")',)
+
+
+def test_tampered_value_is_not_unpickled(factory: sessionmaker) -> None:
+    backend = StoreBackend()
+    cache = ResultCache(namespace='test', backend=backend, secret='secret')
+    session = factory()
+    assert search(session, cache) == []
+    key = cache.make_key(sys.modules[__name__], Search(session, module=sys.modules[__name__], query=['Tag.name']).payload)
+    backend.set(key, b'\0' * 32 + pickle.dumps(Exploit()))
+    assert search(session, cache) == []
+    assert cache.stats()['rejects'] == 1
+    # 相同密钥的其它进程写入的缓存可以命中
+    other = ResultCache(namespace='test', backend=backend, secret='secret')
+    assert search(session, other) == []
+    assert search(session, cache) == []
+    assert cache.stats()['hits'] == 1